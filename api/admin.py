@@ -3,6 +3,7 @@ from .models import Category, Book, User, Cart, CartItem, Order, OrderItem
 from django.contrib.auth.admin import UserAdmin
 
 from django.utils.html import format_html  # Import
+from .images import variant_url
 
 
 class MyUserAdmin(UserAdmin):
@@ -33,8 +34,16 @@ class BookAdmin(admin.ModelAdmin):
 
     def image_tag(self, obj):
         if obj.image:  # Ensure that the image field is not empty
+            icon = variant_url(obj.image_variants, "icon", "jpg")
+            if icon is None:  # Not generated yet
+                return format_html(
+                    '<img src="{}" width="50" height="50" />', obj.image.url
+                )
             return format_html(
-                '<img src="{}" width="50" height="50" />', obj.image.url
+                '<picture><source srcset="{}" type="image/webp" />'
+                '<img src="{}" width="50" height="50" /></picture>',
+                variant_url(obj.image_variants, "icon", "webp"),
+                icon,
             )
         return "No image"
 
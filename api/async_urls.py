@@ -0,0 +1,31 @@
+from django.urls import path
+
+from .async_views import (
+    AsyncBookDetailView,
+    AsyncBookExportView,
+    AsyncBookListView,
+    AsyncCategoryDetailView,
+    AsyncCategoryListView,
+    AsyncLoginView,
+    AsyncOrderListView,
+    AsyncUserRegistrationView,
+)
+
+# Same names as their counterparts in api/urls.py, which they shadow for
+# ASGI requests
+urlpatterns = [
+    path("books/", AsyncBookListView.as_view(), name="book-list"),
+    path("books/<int:pk>/", AsyncBookDetailView.as_view(), name="book-detail"),
+    path("books/export/", AsyncBookExportView.as_view(), name="book-export"),
+    path("categories/", AsyncCategoryListView.as_view(), name="category-list"),
+    path(
+        "categories/<int:pk>/",
+        AsyncCategoryDetailView.as_view(),
+        name="category-detail",
+    ),
+    path(
+        "register/", AsyncUserRegistrationView.as_view(), name="user-register"
+    ),
+    path("login/", AsyncLoginView.as_view(), name="user-login"),
+    path("orders/", AsyncOrderListView.as_view(), name="order_list"),
+]
@@ -0,0 +1,344 @@
+"""
+Async versions of endpoints, served instead of the DRF views to requests
+coming through base/asgi.py (see base/asgi_urls.py).
+"""
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.signals import user_login_failed
+from django.http import Http404
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.authtoken.models import Token
+from rest_framework.response import Response
+
+from .cache import CachedResponseMixin, ConditionalGetMixin
+from .export import aiter_export, export_response
+from .hashing import HashingPoolBusy, amake_password
+from .models import User
+from .pagination import KeysetPagination
+from .serializer import (
+    BookListSerializer,
+    LoginSerializer,
+    UserRegistrationSerializer,
+)
+from .streaming import astream_json_object
+from .views import (
+    BookDetailView,
+    BookExportView,
+    BookListView,
+    CategoryDetailView,
+    CategoryListView,
+    LoginView,
+    OrderListView,
+    UserRegistrationView,
+)
+
+
+class LoginCredentialsSerializer(LoginSerializer):
+    # Field validation only, the password is checked by the view
+    def validate(self, attrs):
+        return attrs
+
+
+def hashing_busy_response():
+    return Response(
+        {"detail": "Too many logins in progress, try again shortly."},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
+
+
+async def aauthenticate(request, email, password):
+    """
+    What ModelBackend.authenticate() does, without blocking the event
+    loop on the password hash.
+    """
+    try:
+        user = await User.objects.aget(email=email)
+    except User.DoesNotExist:
+        # Hash anyway so unknown emails take as long as wrong passwords
+        await amake_password(password)
+        user = None
+    else:
+        if not (await user.acheck_password(password) and user.is_active):
+            user = None
+    if user is None:
+        await user_login_failed.asend(
+            sender=__name__, credentials={"username": email}, request=request
+        )
+    return user
+
+
+class AsyncAPIView(View):
+    """
+    Async handling for a DRF view class (``drf_view``), which still
+    supplies the parsers, serializer, permissions and rendering, and turns
+    exceptions into its usual error responses. Authentication goes through
+    the async ORM; subclasses implement ``handle()``. Methods outside
+    ``http_method_names`` are handed to the DRF view as they are.
+    """
+
+    drf_view = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Like the DRF views: SessionAuthentication checks CSRF itself
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method.lower() not in self.http_method_names:
+            return sync_to_async(self.drf_view.as_view())(
+                request, *args, **kwargs
+            )
+        return super().dispatch(request, *args, **kwargs)
+
+    async def run(self, request, *args, **kwargs):
+        view = self.drf_view()
+        view.args = args
+        view.kwargs = kwargs
+        view.headers = view.default_response_headers
+        request = view.initialize_request(request, *args, **kwargs)
+        view.request = request
+
+        try:
+            await self.authenticate(request)
+            # Authentication is done, the rest of initial() doesn't query
+            view.initial(request, *args, **kwargs)
+            response = await self.handle(view, request)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+
+        response = view.finalize_response(request, response, *args, **kwargs)
+        if isinstance(response, Response):
+            response.render()
+        return response
+
+    async def authenticate(self, request):
+        """
+        What Request._authenticate() does, awaiting authenticators that
+        have an async variant.
+        """
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, "aauthenticate"):
+                    user_auth = await authenticator.aauthenticate(request)
+                else:
+                    user_auth = await sync_to_async(
+                        authenticator.authenticate
+                    )(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth
+                return
+        request._not_authenticated()
+
+    async def handle(self, view, request):
+        raise NotImplementedError
+
+
+class AsyncLoginView(AsyncAPIView):
+    drf_view = LoginView
+    http_method_names = ["post"]
+
+    async def post(self, request, *args, **kwargs):
+        return await self.run(request, *args, **kwargs)
+
+    async def handle(self, view, request):
+        serializer = LoginCredentialsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            user = await aauthenticate(
+                request,
+                serializer.validated_data["email"],
+                serializer.validated_data["password"],
+            )
+        except HashingPoolBusy:
+            return hashing_busy_response()
+        if user is None:
+            return Response(
+                {"non_field_errors": ["Invalid login credentials."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        token, created = await Token.objects.aget_or_create(user=user)
+        return Response(
+            {"token": token.key, "message": "Logged in successfully."},
+            status=status.HTTP_200_OK,
+        )
+
+
+class AsyncUserRegistrationView(AsyncAPIView):
+    drf_view = UserRegistrationView
+    http_method_names = ["post"]
+
+    async def post(self, request, *args, **kwargs):
+        return await self.run(request, *args, **kwargs)
+
+    async def handle(self, view, request):
+        serializer = view.get_serializer(data=request.data)
+        # Validation checks email uniqueness against the database
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+
+        user = serializer.build_user(serializer.validated_data)
+        try:
+            await user.aset_password(serializer.validated_data["password"])
+        except HashingPoolBusy:
+            return hashing_busy_response()
+        await user.asave()
+        return Response(
+            {
+                "message": "Registration successful!",
+                "user": {"email": user.email, "user_type": user.user_type},
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class AsyncReadView(AsyncAPIView):
+    """
+    Async GET handling for a DRF view class, with its conditional GET and
+    response caching. Subclasses implement ``aget_response()``; other
+    methods (writes, OPTIONS) are handed to the DRF view.
+    """
+
+    http_method_names = ["get", "head"]
+
+    async def get(self, request, *args, **kwargs):
+        return await self.run(request, *args, **kwargs)
+
+    async def handle(self, view, request):
+        """
+        Conditional GET and response caching, as the DRF view's mixins do.
+        """
+        validators = None
+        if isinstance(view, ConditionalGetMixin):
+            state = await view.aget_validator_state()
+            validators = view.get_validators(state)
+            if validators is not None:
+                response = view.not_modified_response(validators)
+                if response is not None:
+                    return view.set_validator_headers(response, validators)
+
+        cache_key = None
+        if isinstance(view, CachedResponseMixin):
+            cache_key, cached = view.get_cached()
+            if cached is not None:
+                response = Response(cached[0], status=cached[1])
+                response["X-Cache"] = "HIT"
+                return self.set_validator_headers(view, response, validators)
+
+        response = await self.aget_response(view, request)
+        if (
+            cache_key is not None
+            and isinstance(response, Response)
+            and response.status_code == 200
+        ):
+            view.set_cached(cache_key, response.data, response.status_code)
+            response["X-Cache"] = "MISS"
+        return self.set_validator_headers(view, response, validators)
+
+    def set_validator_headers(self, view, response, validators):
+        if validators is None:
+            return response
+        return view.set_validator_headers(response, validators)
+
+    async def aget_response(self, view, request):
+        raise NotImplementedError
+
+    async def aget_object(self, view):
+        """
+        GenericAPIView.get_object() through the async ORM.
+        """
+        queryset = view.filter_queryset(view.get_queryset())
+        lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+        lookup = {view.lookup_field: view.kwargs[lookup_url_kwarg]}
+        try:
+            obj = await queryset.aget(**lookup)
+        except queryset.model.DoesNotExist:
+            raise Http404(
+                "No %s matches the given query."
+                % queryset.model._meta.object_name
+            )
+        view.check_object_permissions(view.request, obj)
+        return obj
+
+
+class AsyncBookListView(AsyncReadView):
+    drf_view = BookListView
+
+    async def aget_response(self, view, request):
+        # The search filter may have to check the database for its index
+        queryset = await sync_to_async(view.filter_queryset)(
+            view.get_queryset()
+        )
+        serializer = view.get_row_serializer()
+        page = await view.paginator.apaginate_queryset(
+            serializer.rows(queryset), request, view
+        )
+        return view.get_paginated_response(await serializer.aserialize(page))
+
+
+class AsyncBookDetailView(AsyncReadView):
+    drf_view = BookDetailView
+
+    async def aget_response(self, view, request):
+        book = await self.aget_object(view)
+        return Response(view.get_serializer(book).data)
+
+
+class AsyncBookExportView(AsyncReadView):
+    drf_view = BookExportView
+
+    async def aget_response(self, view, request):
+        queryset, encoder = view.get_export()
+        return export_response(aiter_export(queryset, encoder), request)
+
+
+class AsyncCategoryListView(AsyncReadView):
+    drf_view = CategoryListView
+
+    async def aget_response(self, view, request):
+        serializer = view.get_row_serializer()
+        queryset = view.filter_queryset(view.get_queryset())
+        categories = [row async for row in serializer.rows(queryset)]
+        return Response(await serializer.aserialize(categories))
+
+
+class AsyncCategoryDetailView(AsyncReadView):
+    drf_view = CategoryDetailView
+
+    async def aget_response(self, view, request):
+        category = await self.aget_object(view)
+        books = view.get_books(category)
+
+        if view.wants_stream():
+            return astream_json_object(
+                {"name": category.name},
+                "books",
+                books,
+                BookListSerializer,
+                view.get_serializer_context(),
+            )
+
+        paginator = KeysetPagination()
+        category.book_page = await paginator.apaginate_queryset(
+            books, request, view
+        )
+        return Response(view.get_page_data(category, paginator))
+
+
+class AsyncOrderListView(AsyncReadView):
+    drf_view = OrderListView
+
+    async def aget_response(self, view, request):
+        serializer = view.get_row_serializer()
+        orders = [row async for row in serializer.rows(view.get_queryset())]
+        return Response(await serializer.aserialize(orders))
@@ -0,0 +1,169 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    TokenAuthentication,
+    get_authorization_header,
+)
+
+from .cache import get_stats
+from .metrics import count_cache_lookup
+
+# Stored in place of an invalidated entry for a short while, so a request
+# that read the token from the database just before the invalidation
+# can't put the stale token back (cache.add won't overwrite it).
+REVOKED = "revoked"
+REVOKED_TIMEOUT = 30
+
+# Part of every entry's key: changing it drops them all at once
+GENERATION_KEY = "auth:generation"
+
+
+def get_token_cache():
+    return caches[settings.AUTH_TOKEN_CACHE_ALIAS]
+
+
+def get_generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:  # None yet, or evicted: a fresh one
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def token_cache_key(key, generation):
+    # Never use the raw token as a cache key
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f"auth:token:{generation}:{digest}"
+
+
+def cached_user_fields():
+    """
+    The user's columns kept in the cache: all of them but the password
+    hash, which is left deferred on the users built from it.
+    """
+    return [
+        field.attname
+        for field in get_user_model()._meta.concrete_fields
+        if field.attname != "password"
+    ]
+
+
+def invalidate_tokens(*keys):
+    """
+    Drop cached resolutions of the given token keys.
+    """
+    cache = get_token_cache()
+    generation = get_generation(cache)
+    cache.set_many(
+        {token_cache_key(key, generation): REVOKED for key in keys},
+        timeout=REVOKED_TIMEOUT,
+    )
+
+
+def invalidate_all_tokens():
+    """
+    Drop every cached resolution, for writes that don't say which users
+    they changed (QuerySet.update(), bulk_update()).
+    """
+    get_token_cache().set(GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that caches the token (with its user) in the
+    AUTH_TOKEN_CACHE_ALIAS cache instead of querying it on every request.
+    Only the columns are cached, not the user's password hash.
+
+    Entries are dropped when the token is deleted (logout) or its user is
+    saved (deactivation, user_type changes, ...), and all of them on bulk
+    writes to users, see api/signals.py.
+    """
+
+    def authenticate_credentials(self, key):
+        token, generation = self.get_cached_token(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            self.cache_token(key, token, generation)
+        return token.user, token
+
+    async def aauthenticate(self, request):
+        """
+        authenticate() for async views, through the async ORM on a miss.
+        """
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            msg = _("Invalid token header. No credentials provided.")
+            raise exceptions.AuthenticationFailed(msg)
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            msg = _(
+                "Invalid token header. "
+                "Token string should not contain invalid characters."
+            )
+            raise exceptions.AuthenticationFailed(msg)
+
+        token, generation = self.get_cached_token(key)
+        if token is None:
+            model = self.get_model()
+            try:
+                token = await model.objects.select_related("user").aget(
+                    key=key
+                )
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_("Invalid token."))
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(
+                    _("User inactive or deleted.")
+                )
+            self.cache_token(key, token, generation)
+        return token.user, token
+
+    def get_cached_token(self, key):
+        """
+        ``(token, generation)``: the cached token for a key, or None when
+        it has to be looked up, and the generation to cache it under.
+        """
+        cache = get_token_cache()
+        generation = get_generation(cache)
+        entry = cache.get(token_cache_key(key, generation))
+        stats = get_stats(settings.AUTH_TOKEN_CACHE_ALIAS)
+        # The same is_active check as TokenAuthentication, on the cached
+        # user; an inactive user goes through the database for the error
+        if entry is None or entry == REVOKED or not entry["is_active"]:
+            stats.record(misses=1)
+            count_cache_lookup(settings.AUTH_TOKEN_CACHE_ALIAS, False)
+            return None, generation
+        stats.record(hits=1)
+        count_cache_lookup(settings.AUTH_TOKEN_CACHE_ALIAS, True)
+        return self.token_from_entry(key, entry), generation
+
+    def cache_token(self, key, token, generation):
+        user = token.user
+        entry = {
+            "db": token._state.db,
+            "created": token.created,
+            "is_active": user.is_active,
+            "user": [getattr(user, name) for name in cached_user_fields()],
+        }
+        get_token_cache().add(token_cache_key(key, generation), entry)
+
+    def token_from_entry(self, key, entry):
+        user = get_user_model().from_db(
+            entry["db"], cached_user_fields(), entry["user"]
+        )
+        token = self.get_model().from_db(
+            entry["db"],
+            ["key", "user_id", "created"],
+            [key, user.pk, entry["created"]],
+        )
+        token.user = user
+        return token
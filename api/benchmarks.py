@@ -0,0 +1,516 @@
+import json
+import math
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from . import urls
+from .factories import BookFactory, CategoryFactory, UserFactory
+from .models import Book, Cart, CartItem, Order, OrderItem, User
+
+# Books per bulk insert when seeding
+SEED_BATCH_SIZE = 1000
+
+
+@contextmanager
+def throwaway_database():
+    """
+    Run the block against a freshly migrated test database, like the test
+    runner does, so benchmarks never seed into the real one.
+    """
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def route_names():
+    """
+    The names of the routes in api/urls.py.
+    """
+    return {pattern.name for pattern in urls.urlpatterns if pattern.name}
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of ``values``, None when there are none.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+class Scenario:
+    """
+    Requests to one route of api/urls.py. ``build(index)`` returns the
+    index-th request as (method, path, data, content_type, headers),
+    after creating whatever it needs, so that isn't timed.
+    """
+
+    def __init__(self, name, route, build, slow=False, writes=False):
+        self.name = name
+        self.route = route
+        self.build = build
+        # Hashes a password per request, run fewer of them
+        self.slow = slow
+        # Writes to the database, see run_scenario()
+        self.writes = writes
+
+
+class ApiBenchmark:
+    """
+    A dataset of ``scale`` books (with categories, users, a cart and
+    orders) and a scenario for every route of api/urls.py over it.
+    """
+
+    def __init__(self, scale):
+        self.scale = scale
+        self.profile_id = None
+        self.seed()
+
+    def seed(self):
+        self.categories = CategoryFactory.create_batch(
+            max(1, self.scale // 100)
+        )
+        self.seller = UserFactory(user_type="seller")
+        self.buyer = UserFactory()
+        self.admin = UserFactory(is_staff=True)
+        self.tokens = {
+            user.pk: Token.objects.create(user=user).key
+            for user in (self.seller, self.buyer, self.admin)
+        }
+
+        self.books = []
+        for start in range(0, self.scale, SEED_BATCH_SIZE):
+            batch = [
+                BookFactory.build(
+                    seller=self.seller,
+                    category=self.categories[index % len(self.categories)],
+                )
+                for index in range(
+                    start, min(start + SEED_BATCH_SIZE, self.scale)
+                )
+            ]
+            self.books += Book.objects.bulk_create(batch)
+
+        self.orders = list(
+            Order.objects.bulk_create(
+                Order(buyer=self.buyer, total_price=0) for _ in range(10)
+            )
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, book=book, quantity=1, unit_price=10)
+            for order in self.orders
+            for book in self.books[:3]
+        )
+        self.cart = Cart.objects.create(buyer=self.buyer)
+        self.cart_item = CartItem.objects.create(
+            cart=self.cart, book=self.books[0], quantity=1
+        )
+
+    def auth(self, user):
+        return {"Authorization": f"Token {self.tokens[user.pk]}"}
+
+    def book(self, index):
+        return self.books[index % len(self.books)]
+
+    def scenarios(self):
+        books, categories = self.books, self.categories
+        word = books[0].title.split()[0]
+        return [
+            Scenario(
+                "book-list",
+                "book-list",
+                lambda i: ("get", reverse("book-list"), {}, None, {}),
+            ),
+            Scenario(
+                "book-list search",
+                "book-list",
+                lambda i: (
+                    "get",
+                    reverse("book-list"),
+                    {"search": word},
+                    None,
+                    {},
+                ),
+            ),
+            Scenario(
+                "book-list keyset",
+                "book-list",
+                lambda i: (
+                    "get",
+                    reverse("book-list"),
+                    {"cursor": ""},
+                    None,
+                    {},
+                ),
+            ),
+            Scenario(
+                "book-detail",
+                "book-detail",
+                lambda i: (
+                    "get",
+                    reverse("book-detail", kwargs={"pk": self.book(i).pk}),
+                    {},
+                    None,
+                    self.auth(self.buyer),
+                ),
+            ),
+            Scenario(
+                "category-list",
+                "category-list",
+                lambda i: ("get", reverse("category-list"), {}, None, {}),
+            ),
+            Scenario(
+                "category-detail",
+                "category-detail",
+                lambda i: (
+                    "get",
+                    reverse(
+                        "category-detail",
+                        kwargs={"pk": categories[i % len(categories)].pk},
+                    ),
+                    {},
+                    None,
+                    {},
+                ),
+            ),
+            Scenario(
+                "user-register",
+                "user-register",
+                self.register,
+                slow=True,
+                writes=True,
+            ),
+            Scenario(
+                "user-login", "user-login", self.login, slow=True, writes=True
+            ),
+            Scenario("user-logout", "user-logout", self.logout, writes=True),
+            Scenario(
+                "book-create", "book-create", self.create_book, writes=True
+            ),
+            Scenario(
+                "book-import", "book-import", self.import_books, writes=True
+            ),
+            Scenario(
+                "book-export",
+                "book-export",
+                lambda i: (
+                    "get",
+                    reverse("book-export"),
+                    {},
+                    None,
+                    {**self.auth(self.buyer), "Accept": "text/csv"},
+                ),
+            ),
+            Scenario(
+                "cart",
+                "cart",
+                lambda i: (
+                    "get",
+                    reverse("cart"),
+                    {},
+                    None,
+                    self.auth(self.buyer),
+                ),
+            ),
+            Scenario("cart add", "cart", self.add_to_cart, writes=True),
+            Scenario(
+                "cart-update",
+                "cart-update",
+                lambda i: (
+                    "patch",
+                    reverse("cart-update", kwargs={"pk": self.cart_item.pk}),
+                    json.dumps({"quantity": i % 5 + 1}),
+                    "application/json",
+                    self.auth(self.buyer),
+                ),
+                writes=True,
+            ),
+            Scenario("checkout", "checkout", self.checkout, writes=True),
+            Scenario(
+                "order_confirmation",
+                "order_confirmation",
+                lambda i: (
+                    "get",
+                    reverse(
+                        "order_confirmation",
+                        kwargs={
+                            "order_id": self.orders[i % len(self.orders)].pk
+                        },
+                    ),
+                    {},
+                    None,
+                    self.auth(self.buyer),
+                ),
+            ),
+            Scenario(
+                "order_list",
+                "order_list",
+                lambda i: (
+                    "get",
+                    reverse("order_list"),
+                    {},
+                    None,
+                    self.auth(self.buyer),
+                ),
+            ),
+            Scenario(
+                "cache-stats",
+                "cache-stats",
+                lambda i: (
+                    "get",
+                    reverse("cache-stats"),
+                    {},
+                    None,
+                    self.auth(self.admin),
+                ),
+            ),
+            Scenario(
+                "profile-list",
+                "profile-list",
+                lambda i: (
+                    "get",
+                    reverse("profile-list"),
+                    {},
+                    None,
+                    self.auth(self.admin),
+                ),
+            ),
+            Scenario("profile-detail", "profile-detail", self.profile_detail),
+        ]
+
+    def register(self, index):
+        data = {
+            "email": f"bench-{uuid.uuid4().hex}@example.com",
+            "first_name": "Bench",
+            "last_name": "Mark",
+            "password": "password123",
+            "confirm_password": "password123",
+        }
+        return (
+            "post",
+            reverse("user-register"),
+            json.dumps(data),
+            "application/json",
+            {},
+        )
+
+    def login(self, index):
+        data = {"email": self.buyer.email, "password": "password123"}
+        return (
+            "post",
+            reverse("user-login"),
+            json.dumps(data),
+            "application/json",
+            {},
+        )
+
+    def logout(self, index):
+        # Logging out deletes the token, so each request needs a user
+        user = User.objects.create(email=f"bench-{uuid.uuid4().hex}@x.com")
+        token = Token.objects.create(user=user)
+        return (
+            "post",
+            reverse("user-logout"),
+            {},
+            None,
+            {"Authorization": f"Token {token.key}"},
+        )
+
+    def create_book(self, index):
+        data = {
+            "title": f"Benchmark book {index}",
+            "author": "Bench Mark",
+            "price": "12.50",
+            "category": self.categories[index % len(self.categories)].name,
+        }
+        return (
+            "post",
+            reverse("book-create"),
+            json.dumps(data),
+            "application/json",
+            self.auth(self.seller),
+        )
+
+    def import_books(self, index):
+        rows = "".join(
+            f"Imported {index}-{row},Bench Mark,9.99,"
+            f"{self.categories[row % len(self.categories)].name},\n"
+            for row in range(20)
+        )
+        upload = SimpleUploadedFile(
+            "books.csv",
+            ("title,author,price,category,description\n" + rows).encode(),
+        )
+        return (
+            "post",
+            reverse("book-import"),
+            {"file": upload},
+            None,
+            self.auth(self.seller),
+        )
+
+    def add_to_cart(self, index):
+        items = [
+            {"book_id": self.book(index + offset).pk, "quantity": 1}
+            for offset in range(3)
+        ]
+        return (
+            "post",
+            reverse("cart"),
+            json.dumps({"items": items}),
+            "application/json",
+            self.auth(self.buyer),
+        )
+
+    def checkout(self, index):
+        # Checking out empties the cart, so each request needs a buyer
+        buyer = User.objects.create(email=f"bench-{uuid.uuid4().hex}@x.com")
+        token = Token.objects.create(user=buyer)
+        cart = Cart.objects.create(buyer=buyer)
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, book=self.book(index + offset), quantity=1)
+            for offset in range(3)
+        )
+        return (
+            "post",
+            reverse("checkout"),
+            {},
+            None,
+            {"Authorization": f"Token {token.key}"},
+        )
+
+    def profile_detail(self, index):
+        # Profile one request, the first time, for the scenario to fetch
+        if self.profile_id is None:
+            response = send(
+                Client(),
+                (
+                    "get",
+                    reverse("book-list"),
+                    {"profile": "1"},
+                    None,
+                    self.auth(self.admin),
+                ),
+            )
+            self.profile_id = response["X-Profile-Id"]
+        return (
+            "get",
+            reverse("profile-detail", kwargs={"profile_id": self.profile_id}),
+            {},
+            None,
+            self.auth(self.admin),
+        )
+
+
+def send(client, request):
+    method, path, data, content_type, headers = request
+    kwargs = {"headers": headers}
+    if content_type is not None:
+        kwargs["content_type"] = content_type
+    response = getattr(client, method)(path, data, **kwargs)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    response.close()
+    return response
+
+
+def profile(scenario):
+    """
+    Queries and peak traced memory (KiB) of one request.
+    """
+    request = scenario.build(0)
+    client = Client(raise_request_exception=False)
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            send(client, request)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return len(queries), peak / 1024
+
+
+def load(scenario, requests, concurrency):
+    """
+    Send ``requests`` requests from ``concurrency`` threads, and return
+    the wall clock time, the latencies (seconds) and the status codes.
+    """
+    prepared = [scenario.build(index) for index in range(1, requests + 1)]
+    local = threading.local()
+
+    def timed(request):
+        if not hasattr(local, "client"):
+            local.client = Client(raise_request_exception=False)
+        start = time.perf_counter()
+        response = send(local.client, request)
+        return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        results = [timed(request) for request in prepared]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed, prepared))
+    elapsed = time.perf_counter() - start
+    return (
+        elapsed,
+        [latency for latency, _ in results],
+        [status for _, status in results],
+    )
+
+
+def run_scenario(scenario, requests, concurrency):
+    """
+    The benchmark result of one scenario, as a JSON-serializable dict.
+
+    Writes run one at a time on SQLite: it serializes writers anyway, and
+    its in-memory test database fails concurrent ones instead of making
+    them wait.
+    """
+    if scenario.writes and connection.vendor == "sqlite":
+        concurrency = 1
+    queries, peak_kib = profile(scenario)
+    elapsed, latencies, statuses = load(scenario, requests, concurrency)
+    milliseconds = [latency * 1000 for latency in latencies]
+    return {
+        "route": scenario.route,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": sum(1 for status in statuses if status >= 400),
+        "statuses": {
+            str(status): count
+            for status, count in sorted(Counter(statuses).items())
+        },
+        "requests_per_second": round(requests / elapsed, 1),
+        "latency_ms": {
+            f"p{percent}": round(percentile(milliseconds, percent), 3)
+            for percent in (50, 95, 99)
+        },
+        "queries": queries,
+        "peak_kib": round(peak_kib, 1),
+    }
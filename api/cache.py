@@ -0,0 +1,308 @@
+import hashlib
+import random
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from .metrics import count_cache_lookup
+
+
+class CacheStats:
+    """
+    Hit, miss and eviction counters of one cache store, per process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def record(self, hits=0, misses=0, evictions=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.evictions += evictions
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# One CacheStats per store, shared by the per-thread backend instances
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _stats_for_store(store):
+    with _stats_lock:
+        return _stats.setdefault(store, CacheStats())
+
+
+def get_stats(alias):
+    """
+    CacheStats of a cache alias. Backends that don't count (e.g. when
+    swapped for memcached in settings) get a detached, unused one.
+    """
+    return getattr(caches[alias], "stats", None) or CacheStats()
+
+
+class LRUCache(LocMemCache):
+    """
+    In-process cache bounded by MAX_ENTRIES, evicting least recently used
+    entries first, which counts its evictions.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self.stats = _stats_for_store(f"locmem:{name}")
+
+    def _cull(self):
+        before = len(self._cache)
+        super()._cull()
+        self.stats.record(evictions=before - len(self._cache))
+
+
+class SharedFileCache(FileBasedCache):
+    """
+    File based cache, shared by every worker process on the box, which
+    counts its evictions.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self.stats = _stats_for_store(f"file:{self._dir}")
+
+    def _cull(self):
+        # FileBasedCache._cull(), counting what it deletes rather than
+        # listing the directory again
+        filelist = self._list_cache_files()
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            self.clear()
+            self.stats.record(evictions=num_entries)
+            return
+        filelist = random.sample(
+            filelist, int(num_entries / self._cull_frequency)
+        )
+        evicted = sum(1 for fname in filelist if self._delete(fname))
+        self.stats.record(evictions=evicted)
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def get_version_cache():
+    return caches[settings.CATALOG_VERSION_CACHE_ALIAS]
+
+
+def version_key(namespace):
+    return f"catalog:version:{namespace}"
+
+
+# Versions read from the version cache, reused by this process for
+# CATALOG_VERSION_TTL seconds: key -> (version, expiry)
+_local_versions = {}
+LOCAL_VERSIONS_MAX = 10000
+
+
+def get_versions(namespaces):
+    """
+    Current version of each namespace. A namespace without a version yet
+    (or whose version was evicted) gets a fresh one, so entries stored
+    under an older version can never be served again.
+
+    Versions are kept in the process for CATALOG_VERSION_TTL seconds, so
+    a write made by another worker is seen that much later at most; this
+    process's own writes are seen at once.
+    """
+    keys = [version_key(namespace) for namespace in namespaces]
+    now = time.monotonic()
+    versions = {}
+    for key in keys:
+        entry = _local_versions.get(key)
+        if entry is not None and entry[1] > now:
+            versions[key] = entry[0]
+
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        cache = get_version_cache()
+        fetched = cache.get_many(missing)
+        for key in missing:
+            if key not in fetched:
+                cache.add(key, time.time_ns(), timeout=None)
+                fetched[key] = cache.get(key)
+        _remember_versions(fetched)
+        versions.update(fetched)
+    return [versions[key] for key in keys]
+
+
+def _remember_versions(versions):
+    ttl = settings.CATALOG_VERSION_TTL
+    if not ttl:
+        return
+    if len(_local_versions) + len(versions) > LOCAL_VERSIONS_MAX:
+        _local_versions.clear()
+    expiry = time.monotonic() + ttl
+    _local_versions.update(
+        {key: (version, expiry) for key, version in versions.items()}
+    )
+
+
+def bump_versions(*namespaces):
+    """
+    Invalidate every cached response depending on the given namespaces,
+    now and again once the current transaction commits: a response
+    cached in between was built from the rows as they were before it.
+    """
+    _set_versions(namespaces)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _set_versions(namespaces))
+
+
+def _set_versions(namespaces):
+    # A new value rather than an increment, which two workers bumping
+    # at once could both turn into the same version
+    version = time.time_ns()
+    versions = {version_key(namespace): version for namespace in namespaces}
+    get_version_cache().set_many(versions, timeout=None)
+    _remember_versions(versions)
+
+
+class CachedResponseMixin:
+    """
+    Cache successful GET responses of a view, keyed on path and query
+    params, and on the user when ``cache_per_user`` is set.
+
+    ``get_cache_namespaces()`` lists what the response depends on;
+    writes bump those namespaces (see api/signals.py), which changes the
+    key and so invalidates the entry. The versions are shared by all the
+    workers, so a write invalidates what each of them cached.
+    Authentication and permission checks still run before the cache is
+    consulted.
+    """
+
+    cache_per_user = False
+
+    def get_cache_namespaces(self):
+        raise NotImplementedError
+
+    def get_cache_key(self):
+        request = self.request
+        parts = [request.path, request.META.get("QUERY_STRING", "")]
+        if self.cache_per_user:
+            parts.append(str(request.user.pk))
+        parts += [
+            str(version)
+            for version in get_versions(self.get_cache_namespaces())
+        ]
+        digest = hashlib.md5("\n".join(parts).encode()).hexdigest()
+        return f"catalog:response:{digest}"
+
+    def get_cached(self):
+        """
+        ``(key, (data, status_code))`` on a hit, ``(key, None)`` on a miss.
+        """
+        key = self.get_cache_key()
+        cached = get_cache().get(key)
+        stats = get_stats(settings.CATALOG_CACHE_ALIAS)
+        count_cache_lookup(settings.CATALOG_CACHE_ALIAS, cached is not None)
+        if cached is not None:
+            stats.record(hits=1)
+        else:
+            stats.record(misses=1)
+        return key, cached
+
+    def set_cached(self, key, data, status_code):
+        get_cache().set(key, (data, status_code))
+
+    def get(self, request, *args, **kwargs):
+        key, cached = self.get_cached()
+        if cached is not None:
+            data, status_code = cached
+            response = Response(data, status=status_code)
+            response["X-Cache"] = "HIT"
+            return response
+
+        response = super().get(request, *args, **kwargs)
+        # Streamed responses are never materialized, so never cached
+        if isinstance(response, Response) and response.status_code == 200:
+            self.set_cached(key, response.data, response.status_code)
+            response["X-Cache"] = "MISS"
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    Add ETag/Last-Modified to GET responses and answer If-None-Match /
+    If-Modified-Since with 304 before any response is built.
+
+    ``get_validator_state()`` runs at most one cheap query and returns
+    ``(last_modified, state)``, where ``state`` is anything that changes
+    whenever the response would, or None when the object doesn't exist.
+    """
+
+    def get_validator_state(self):
+        raise NotImplementedError
+
+    async def aget_validator_state(self):
+        return await sync_to_async(self.get_validator_state)()
+
+    def get_validators(self, state):
+        """
+        ``(etag, last_modified timestamp)`` for a validator state, or
+        None when the object doesn't exist.
+        """
+        if state is None:
+            return None
+        last_modified, state = state
+        fingerprint = f"{self.request.accepted_renderer.format}|{state}"
+        etag = quote_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        return etag, timestamp
+
+    def not_modified_response(self, validators):
+        """
+        A 304 response when the request's preconditions say the client's
+        copy is current, else None.
+        """
+        etag, timestamp = validators
+        return get_conditional_response(
+            self.request, etag=etag, last_modified=timestamp
+        )
+
+    def set_validator_headers(self, response, validators):
+        if response.status_code in (200, 304):
+            etag, timestamp = validators
+            response["ETag"] = etag
+            if timestamp is not None:
+                response["Last-Modified"] = http_date(timestamp)
+        return response
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators(self.get_validator_state())
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+
+        response = self.not_modified_response(validators)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return self.set_validator_headers(response, validators)
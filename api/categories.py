@@ -0,0 +1,77 @@
+import copy
+import threading
+
+from django.db import transaction
+
+from .cache import CacheStats, get_versions
+from .metrics import count_cache_lookup
+from .models import Category, category_key
+
+
+class CategoryCache:
+    """
+    Categories by category_key() of their name, per process: the table
+    is tiny and read on every book write.
+
+    Every category write, bulk ones included, bumps the "categories"
+    version (see api/signals.py), which empties this one. The versions
+    are shared by the workers, so each of them sees the change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._categories = {}
+        self._version = None
+        self.stats = CacheStats()
+
+    def get(self, name):
+        """
+        The category called ``name``, created if there is none. Safe
+        against concurrent creations: the key is unique, and
+        get_or_create() fetches the row that won.
+        """
+        key = category_key(name)
+        (version,) = get_versions(["categories"])
+        with self._lock:
+            if version != self._version:
+                self._categories = {}
+                self._version = version
+            category = self._categories.get(key)
+
+        if category is None:
+            self.stats.record(misses=1)
+            count_cache_lookup("categories", False)
+            category, _ = Category.objects.get_or_create(
+                key=key, defaults={"name": " ".join(name.split())}
+            )
+            # Not before the row is committed, a rollback would leave
+            # the cache pointing at nothing
+            transaction.on_commit(lambda: self._store(version, key, category))
+        else:
+            self.stats.record(hits=1)
+            count_cache_lookup("categories", True)
+        # Callers get their own instance to attach to books
+        return copy.copy(category)
+
+    def _store(self, version, key, category):
+        with self._lock:
+            if version == self._version:
+                self._categories[key] = category
+
+    def clear(self):
+        with self._lock:
+            self._categories = {}
+            self._version = None
+
+
+category_cache = CategoryCache()
+
+
+def get_category(name):
+    """
+    The category called ``name`` (case and spacing aside), None for an
+    empty name.
+    """
+    if not name or not name.strip():
+        return None
+    return category_cache.get(name)
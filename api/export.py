@@ -0,0 +1,132 @@
+from django.http import StreamingHttpResponse
+from rest_framework import renderers, serializers
+
+from .models import Book
+from .streaming import aiter_batches, csv_chunk, iter_batches, ndjson_chunk
+
+# Rows fetched per round trip by the export's server-side iterator
+EXPORT_CHUNK_SIZE = 2000
+
+# Exported column name and the values() lookup it comes from
+EXPORT_COLUMNS = (
+    ("id", "id"),
+    ("title", "title"),
+    ("author", "author"),
+    ("price", "price"),
+    ("description", "description"),
+    ("is_available", "is_available"),
+    ("category", "category__name"),
+    ("seller", "seller_id"),
+    ("image", "image"),
+    ("created", "created"),
+    ("updated_at", "updated_at"),
+)
+EXPORT_FIELDS = tuple(name for name, _ in EXPORT_COLUMNS)
+EXPORT_LOOKUPS = tuple(lookup for _, lookup in EXPORT_COLUMNS)
+PRICE, IMAGE, CREATED, UPDATED_AT = (
+    EXPORT_FIELDS.index(name)
+    for name in ("price", "image", "created", "updated_at")
+)
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """
+    Only used for content negotiation, export responses are streamed.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """
+    Only used for content negotiation, export responses are streamed.
+    """
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+
+class BookExportFilterSerializer(serializers.Serializer):
+    category = serializers.IntegerField(required=False)
+    seller = serializers.IntegerField(required=False)
+    updated_since = serializers.DateTimeField(required=False)
+
+
+def export_queryset(filters):
+    """
+    The books to export as values() rows, in primary key order so an
+    export is stable while it streams. (Not values_list(): its iterator
+    runs the query eagerly, which aiterator() can't do from async code.)
+    """
+    queryset = Book.objects.order_by("pk")
+    if "category" in filters:
+        queryset = queryset.filter(category_id=filters["category"])
+    if "seller" in filters:
+        queryset = queryset.filter(seller_id=filters["seller"])
+    if "updated_since" in filters:
+        queryset = queryset.filter(updated_at__gte=filters["updated_since"])
+    return queryset.values(*EXPORT_LOOKUPS)
+
+
+class ExportEncoder:
+    """
+    Turns batches of export_queryset() rows into NDJSON or CSV text,
+    with values formatted the way the API's serializers format them.
+    """
+
+    def __init__(self, format, request):
+        self.format = format
+        self.request = request
+        self.storage = Book._meta.get_field("image").storage
+        self.datetime_field = serializers.DateTimeField()
+
+    def head(self):
+        return csv_chunk([EXPORT_FIELDS]) if self.format == "csv" else ""
+
+    def encode(self, batch):
+        rows = [self.format_row(row) for row in batch]
+        if self.format == "csv":
+            return csv_chunk(rows)
+        return ndjson_chunk(dict(zip(EXPORT_FIELDS, row)) for row in rows)
+
+    def format_row(self, values):
+        row = [values[lookup] for lookup in EXPORT_LOOKUPS]
+        row[PRICE] = str(row[PRICE])
+        if row[IMAGE]:
+            url = self.storage.url(row[IMAGE])
+            row[IMAGE] = self.request.build_absolute_uri(url)
+        else:
+            row[IMAGE] = None
+        for index in (CREATED, UPDATED_AT):
+            row[index] = self.datetime_field.to_representation(row[index])
+        return row
+
+
+def iter_export(queryset, encoder):
+    yield encoder.head()
+    for batch in iter_batches(queryset, EXPORT_CHUNK_SIZE):
+        yield encoder.encode(batch)
+
+
+async def aiter_export(queryset, encoder):
+    """
+    iter_export() over the async ORM, so ASGI streams the export instead
+    of consuming a sync iterator in full first.
+    """
+    yield encoder.head()
+    async for batch in aiter_batches(queryset, EXPORT_CHUNK_SIZE):
+        yield encoder.encode(batch)
+
+
+def export_response(content, request):
+    response = StreamingHttpResponse(
+        content,
+        content_type=f"{request.accepted_renderer.media_type}; charset=utf-8",
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="books.{request.accepted_renderer.format}"'
+    )
+    return response
@@ -1,5 +1,13 @@
 import factory
-from api.models import User, Order, Category, Book
+from api.models import (
+    User,
+    Order,
+    OrderItem,
+    Category,
+    Book,
+    Cart,
+    CartItem,
+)
 
 
 class UserFactory(factory.django.DjangoModelFactory):
@@ -25,7 +33,11 @@ class CategoryFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = Category
 
-    name = factory.Faker("word")
+    class Params:
+        word = factory.Faker("word")
+
+    # Category names are unique, whatever the case, and words repeat
+    name = factory.LazyAttributeSequence(lambda obj, n: f"{obj.word} {n}")
 
 
 class BookFactory(factory.django.DjangoModelFactory):
@@ -38,3 +50,29 @@ class BookFactory(factory.django.DjangoModelFactory):
         "random_number", digits=2
     )  # Generate a random number for the price (e.g., 10, 25, etc.)
     seller = factory.SubFactory(UserFactory, user_type="seller")
+
+
+class OrderItemFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = OrderItem
+
+    order = factory.SubFactory(OrderFactory)
+    book = factory.SubFactory(BookFactory)
+    quantity = factory.Faker("random_int", min=1, max=5)
+    unit_price = factory.Faker("random_number", digits=2)
+
+
+class CartFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Cart
+
+    buyer = factory.SubFactory(UserFactory)
+
+
+class CartItemFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = CartItem
+
+    cart = factory.SubFactory(CartFactory)
+    book = factory.SubFactory(BookFactory)
+    quantity = factory.Faker("random_int", min=1, max=5)
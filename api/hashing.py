@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class HashingPoolBusy(Exception):
+    """
+    Raised instead of queueing a hash past the pool's ``max_pending``.
+    """
+
+
+class HashingPool:
+    """
+    Runs password hashing on a few dedicated threads (PBKDF2 releases the
+    GIL), so a burst of logins can't occupy every request worker.
+
+    At most ``max_pending`` hashes may be queued or running; past that,
+    callers get HashingPoolBusy at once instead of piling up, which the
+    async views turn into a 503. Only they use it: sync requests already
+    run on a worker thread of their own.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="hashing"
+                )
+            return self._executor
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolBusy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    async def arun(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+
+pool = HashingPool(
+    settings.PASSWORD_HASHING_WORKERS, settings.PASSWORD_HASHING_MAX_PENDING
+)
+
+
+async def amake_password(raw_password):
+    return await pool.arun(hashers.make_password, raw_password)
+
+
+async def averify_password(raw_password, encoded):
+    """
+    ``(is_correct, must_update)`` for a raw password against its hash.
+    """
+    return await pool.arun(hashers.verify_password, raw_password, encoded)
@@ -0,0 +1,243 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .models import Book
+from .storage import release, retain
+
+logger = logging.getLogger(__name__)
+
+# Derivative name -> (box, crop). Boxed variants keep the aspect ratio and
+# fit inside the box, cropped ones fill it exactly. Largest first, each
+# is resized from the previous one.
+IMAGE_VARIANTS = {
+    "detail": ((600, 900), False),
+    "thumbnail": ((200, 300), False),
+    "icon": ((50, 50), True),
+}
+
+# Pillow format -> (file extension, save options)
+IMAGE_FORMATS = {
+    "JPEG": ("jpg", {"quality": 80, "optimize": True, "progressive": True}),
+    "WEBP": ("webp", {"quality": 75, "method": 4}),
+}
+
+
+def render_variants(source):
+    """
+    Encode every variant of the image at ``source`` (a path or bytes) in
+    every format: {(variant, extension): bytes}.
+
+    Runs in the worker processes, so it only needs Pillow.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with Image.open(source) as original:
+        # Let JPEG decode at a reduced scale, we never need the full size
+        largest = max(box for box, _ in IMAGE_VARIANTS.values())
+        original.draft("RGB", largest)
+        image = ImageOps.exif_transpose(original)
+        image = flatten(image)
+
+    rendered = {}
+    for name, (box, crop) in IMAGE_VARIANTS.items():
+        if crop:
+            variant = ImageOps.fit(image, box, Image.Resampling.LANCZOS)
+        else:
+            variant = image.copy()
+            variant.thumbnail(box, Image.Resampling.LANCZOS)
+            image = variant
+        for format, (extension, options) in IMAGE_FORMATS.items():
+            buffer = io.BytesIO()
+            variant.save(buffer, format, **options)
+            rendered[name, extension] = buffer.getvalue()
+    return rendered
+
+
+def flatten(image):
+    """
+    RGB copy of ``image``, transparency composited on white (JPEG has no
+    alpha channel).
+    """
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def variant_name(name, variant, extension):
+    """
+    Storage name of a derivative, next to the original:
+    ``media/cover.png`` -> ``media/cover.thumbnail.webp``.
+    """
+    root, _ = os.path.splitext(name)
+    return f"{root}.{variant}.{extension}"
+
+
+def image_source(field_file):
+    """
+    What render_variants() reads: the path for local storage, so the
+    worker reads the file itself, the bytes otherwise.
+    """
+    try:
+        return field_file.storage.path(field_file.name)
+    except NotImplementedError:
+        with field_file.storage.open(field_file.name, "rb") as stream:
+            return stream.read()
+
+
+def store_variants(book_id, name, rendered):
+    """
+    Save rendered derivatives of image ``name`` and record them on the
+    book, unless its image changed in the meantime.
+    """
+    storage = Book._meta.get_field("image").storage
+    variants = {"source": name}
+    for (variant, extension), data in rendered.items():
+        variants.setdefault(variant, {})[extension] = storage.save(
+            variant_name(name, variant, extension), ContentFile(data)
+        )
+    return record_variants(book_id, name, variants)
+
+
+def record_variants(book_id, name, variants):
+    """
+    Set the book's derivatives to ``variants`` if its image is still
+    ``name``, moving the blob references over from the previous ones.
+    Files nothing references are left to storage.collect_garbage().
+    """
+    with transaction.atomic():
+        books = Book.objects.filter(pk=book_id, image=name)
+        previous = (
+            books.select_for_update()
+            .values_list("image_variants", flat=True)
+            .first()
+        )
+        if not books.update(image_variants=variants):
+            return None
+        retain(variant_paths(variants))
+        release(variant_paths(previous))
+    return variants
+
+
+def reuse_variants(book):
+    """
+    Record the derivatives of another book with the same image, if there
+    is one; with content-addressed storage, the same cover uploaded twice
+    is the same image.
+    """
+    name = book.image.name
+    variants = (
+        Book.objects.filter(image=name, image_variants__source=name)
+        .exclude(pk=book.pk)
+        .values_list("image_variants", flat=True)
+        .first()
+    )
+    if variants is None:
+        return None
+    return record_variants(book.pk, name, variants)
+
+
+def variant_paths(variants):
+    for variant in IMAGE_VARIANTS:
+        yield from (variants or {}).get(variant, {}).values()
+
+
+def book_blobs(image, variants):
+    """
+    Storage names a book references through its image and derivatives.
+    """
+    return [name for name in [image, *variant_paths(variants)] if name]
+
+
+def variant_url(variants, variant, extension):
+    """
+    Storage URL of a derivative, None if it wasn't generated.
+    """
+    path = (variants or {}).get(variant, {}).get(extension)
+    if path is None:
+        return None
+    return Book._meta.get_field("image").storage.url(path)
+
+
+def needs_variants(book):
+    if not book.image:
+        return False
+    return (book.image_variants or {}).get("source") != book.image.name
+
+
+def schedule_variants(book):
+    """
+    Give the book derivatives, in the background unless they can be
+    reused.
+    """
+    if reuse_variants(book) is None:
+        pool.submit(book)
+
+
+def generate_variants(book):
+    """
+    Render and store the book's derivatives in this process.
+    """
+    rendered = render_variants(image_source(book.image))
+    variants = store_variants(book.pk, book.image.name, rendered)
+    if variants is not None:
+        book.image_variants = variants
+    return variants
+
+
+class DerivativePool:
+    """
+    Renders derivatives in worker processes, off the request path; the
+    results are stored from the pool's result thread.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def submit(self, book):
+        """
+        Render and store the book's derivatives in the background; the
+        returned future is done once they're stored.
+        """
+        book_id, name = book.pk, book.image.name
+        stored = Future()
+        rendering = self._get_executor().submit(
+            render_variants, image_source(book.image)
+        )
+        rendering.add_done_callback(
+            lambda rendering: self._store(rendering, stored, book_id, name)
+        )
+        return stored
+
+    def _store(self, rendering, stored, book_id, name):
+        close_old_connections()
+        try:
+            variants = store_variants(book_id, name, rendering.result())
+        except Exception as exc:
+            logger.exception("Could not generate images for book %s", book_id)
+            stored.set_exception(exc)
+        else:
+            stored.set_result(variants)
+        finally:
+            close_old_connections()
+
+
+pool = DerivativePool(settings.IMAGE_DERIVATIVE_WORKERS)
@@ -0,0 +1,194 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+from django.db import DatabaseError, transaction
+from rest_framework import serializers
+
+from .categories import get_category
+from .models import Book, category_key
+
+IMPORT_BATCH_SIZE = 1000
+# Errors beyond this are counted but not kept, so a file of bad rows
+# doesn't grow the report without bound
+MAX_REPORTED_ERRORS = 100
+IMPORT_FORMATS = ("csv", "jsonl")
+
+
+class BookImportSerializer(serializers.ModelSerializer):
+    category = serializers.CharField(
+        max_length=100, required=False, allow_blank=True
+    )
+
+    class Meta:
+        model = Book
+        fields = (
+            "title",
+            "author",
+            "price",
+            "description",
+            "is_available",
+            "category",
+        )
+
+
+def guess_format(name):
+    """
+    The import format for a file name, None when the extension is unknown.
+    """
+    name = name.lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return None
+
+
+def iter_rows(stream, format):
+    """
+    Yield (line number, row dict or parse error message) from a text
+    stream, one row at a time.
+    """
+    try:
+        yield from parse_rows(stream, format)
+    except UnicodeDecodeError as exc:
+        # Nothing after this can be trusted, report it and stop
+        yield None, f"Could not decode the file: {exc}"
+
+
+def parse_rows(stream, format):
+    if format == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # Columns past the header end up under the None key
+            row.pop(None, None)
+            yield reader.line_num, row
+    elif format == "jsonl":
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_number, f"Invalid JSON: {exc}"
+                continue
+            if not isinstance(row, dict):
+                yield line_number, "Expected a JSON object."
+                continue
+            yield line_number, row
+    else:
+        raise ValueError(f"Unknown import format {format!r}")
+
+
+def text_stream(binary_file, encoding="utf-8"):
+    """
+    Decode an uploaded (binary) file lazily; newline="" is what csv wants.
+    """
+    return io.TextIOWrapper(binary_file, encoding=encoding, newline="")
+
+
+class CategoryResolver:
+    """
+    Category lookups for an import, through get_category() but hitting
+    it once per distinct name, also inside a transaction, where the
+    category cache isn't filled yet.
+    """
+
+    def __init__(self):
+        self.categories = {}
+
+    def resolve(self, name):
+        if not name:
+            return None
+        key = category_key(name)
+        if key not in self.categories:
+            self.categories[key] = get_category(name)
+        return self.categories[key]
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "errors": errors})
+
+    @property
+    def rows_per_second(self):
+        rows = self.imported + self.failed
+        return rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "seconds": round(self.elapsed, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+def import_books(stream, format, seller, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Import books for ``seller`` from a CSV or JSONL text stream.
+
+    Rows are validated one by one and inserted with one bulk insert and
+    transaction per batch, so memory stays at one batch whatever the file
+    size. Invalid rows are reported in the result and skipped.
+    """
+    result = ImportResult()
+    categories = CategoryResolver()
+    rows = iter_rows(stream, format)
+    # One serializer validates every row; building its fields per row
+    # costs more than the validation itself
+    validator = BookImportSerializer()
+
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+        batch = []
+        for line, row in chunk:
+            if isinstance(row, str):
+                result.add_error(line, {"non_field_errors": [row]})
+                continue
+            try:
+                data = validator.run_validation(row)
+            except serializers.ValidationError as exc:
+                result.add_error(line, exc.detail)
+                continue
+            data["category"] = categories.resolve(data.get("category"))
+            batch.append((line, Book(seller=seller, **data)))
+        save_batch(batch, result)
+
+    result.elapsed = time.perf_counter() - result.started
+    return result
+
+
+def save_batch(batch, result):
+    if not batch:
+        return
+    try:
+        with transaction.atomic():
+            Book.objects.bulk_create([book for _, book in batch])
+    except DatabaseError:
+        # Find the rows the database refused, keeping the rest
+        for line, book in batch:
+            book.pk = None
+            try:
+                with transaction.atomic():
+                    book.save(force_insert=True)
+            except DatabaseError as exc:
+                result.add_error(line, {"non_field_errors": [str(exc)]})
+            else:
+                result.imported += 1
+    else:
+        result.imported += len(batch)
@@ -0,0 +1,135 @@
+import json
+import logging
+import platform
+import sys
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import ApiBenchmark, run_scenario, throwaway_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Throughput, p50/p95/p99 latency, query count and peak memory of "
+        "every route in api/urls.py on a seeded throwaway database, as "
+        "JSON that can be diffed between commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale", type=int, default=2000, help="Books to seed."
+        )
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Per scenario."
+        )
+        parser.add_argument(
+            "--slow-requests",
+            type=int,
+            default=20,
+            help="Per scenario that hashes a password (register, login).",
+        )
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--only", nargs="+", help="Scenario names to run.")
+        parser.add_argument(
+            "--output", default="-", help="JSON file, - for stdout."
+        )
+        parser.add_argument(
+            "--baseline",
+            help="JSON output of an earlier run to print the changes from.",
+        )
+
+    def handle(self, *args, **options):
+        if min(options["requests"], options["slow_requests"]) < 1:
+            raise CommandError("Run at least one request per scenario.")
+        if options["concurrency"] < 1:
+            raise CommandError("Concurrency must be at least 1.")
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as stream:
+                baseline = json.load(stream)
+
+        # Failed requests are counted in the report, not logged
+        request_logger = logging.getLogger("django.request")
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            with throwaway_database():
+                report = self.run(options)
+        finally:
+            request_logger.setLevel(level)
+
+        output = json.dumps(report, indent=2, sort_keys=True) + "\n"
+        if options["output"] == "-":
+            self.stdout.write(output, ending="")
+        else:
+            with open(options["output"], "w") as stream:
+                stream.write(output)
+        if baseline is not None:
+            self.compare(baseline, report)
+
+    def run(self, options):
+        benchmark = ApiBenchmark(options["scale"])
+        scenarios = benchmark.scenarios()
+        if options["only"]:
+            unknown = set(options["only"]) - {s.name for s in scenarios}
+            if unknown:
+                raise CommandError(
+                    f"Unknown scenarios: {', '.join(sorted(unknown))}"
+                )
+            scenarios = [s for s in scenarios if s.name in options["only"]]
+
+        results = {}
+        for scenario in scenarios:
+            requests = options[
+                "slow_requests" if scenario.slow else "requests"
+            ]
+            results[scenario.name] = run_scenario(
+                scenario, requests, options["concurrency"]
+            )
+            self.stderr.write(
+                f"{scenario.name}: "
+                f"{results[scenario.name]['requests_per_second']} req/s"
+            )
+        return {
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "platform": sys.platform,
+            },
+            "settings": {
+                "scale": options["scale"],
+                "concurrency": options["concurrency"],
+                "requests": options["requests"],
+                "slow_requests": options["slow_requests"],
+            },
+            "scenarios": results,
+        }
+
+    def compare(self, baseline, report):
+        self.stderr.write("scenario\treq_per_s\tp95_ms\tqueries")
+        for name, now in report["scenarios"].items():
+            before = baseline.get("scenarios", {}).get(name)
+            if before is None:
+                self.stderr.write(f"{name}\tnew")
+                continue
+            columns = [
+                (before["requests_per_second"], now["requests_per_second"]),
+                (before["latency_ms"]["p95"], now["latency_ms"]["p95"]),
+                (before["queries"], now["queries"]),
+            ]
+            self.stderr.write(
+                "\t".join(
+                    [name]
+                    + [
+                        f"{old} -> {new} ({change(old, new)})"
+                        for old, new in columns
+                    ]
+                )
+            )
+
+
+def change(before, now):
+    if not before:
+        return "n/a"
+    return f"{(now - before) / before:+.0%}"
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from api.benchmarks import throwaway_database
+from api.factories import (
+    BookFactory,
+    CategoryFactory,
+    OrderFactory,
+    OrderItemFactory,
+    UserFactory,
+)
+from rest_framework.authtoken.models import Token
+
+
+class Command(BaseCommand):
+    help = (
+        "Read endpoint throughput and memory with the sync views on a "
+        "threaded WSGI handler against the async views on the ASGI one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            nargs="+",
+            default=[8, 64, 256],
+            help="Clients in flight at once (threads for WSGI).",
+        )
+        parser.add_argument("--requests", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.run(options)
+
+    def run(self, options):
+        buyer = UserFactory()
+        token = Token.objects.create(user=buyer)
+        category = CategoryFactory()
+        books = BookFactory.create_batch(50, category=category)
+        for order in OrderFactory.create_batch(5, buyer=buyer):
+            for book in books[:3]:
+                OrderItemFactory(order=order, book=book)
+
+        self.headers = {"Authorization": f"Token {token.key}"}
+        self.urls = [
+            reverse("book-list"),
+            reverse("book-detail", kwargs={"pk": books[0].pk}),
+            reverse("category-list"),
+            reverse("category-detail", kwargs={"pk": category.pk}),
+            reverse("order_list"),
+        ]
+
+        self.stdout.write("handler\tclients\treq_per_s\tpeak_kib\tthreads")
+        for clients in options["concurrency"]:
+            for name, scenario in [
+                ("wsgi", self.run_sync),
+                ("asgi", self.run_async),
+            ]:
+                tracemalloc.start()
+                start = time.perf_counter()
+                threads = scenario(clients, options["requests"])
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.stdout.write(
+                    f"{name}\t{clients}"
+                    f"\t{options['requests'] / elapsed:.0f}"
+                    f"\t{peak / 1024:.0f}\t{threads}"
+                )
+
+    def run_sync(self, clients, total):
+        local = threading.local()
+        peak_threads = 0
+
+        def fetch(index):
+            nonlocal peak_threads
+            if not hasattr(local, "client"):
+                local.client = Client()
+            peak_threads = max(peak_threads, threading.active_count())
+            url = self.urls[index % len(self.urls)]
+            local.client.get(url, headers=self.headers)
+
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            list(executor.map(fetch, range(total)))
+        return peak_threads
+
+    def run_async(self, clients, total):
+        peak_threads = 0
+
+        async def worker(queue):
+            nonlocal peak_threads
+            client = AsyncClient()
+            while queue:
+                url = self.urls[queue.pop() % len(self.urls)]
+                await client.get(url, headers=self.headers)
+                peak_threads = max(peak_threads, threading.active_count())
+
+        async def main():
+            queue = list(range(total))
+            await asyncio.gather(*(worker(queue) for _ in range(clients)))
+
+        asyncio.run(main())
+        return peak_threads
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import CachedTokenAuthentication, get_token_cache
+from api.benchmarks import throwaway_database
+from api.factories import OrderFactory, UserFactory
+from api.views import OrderListView
+
+
+class Command(BaseCommand):
+    help = (
+        "Requests/sec on /api/orders/ with TokenAuthentication and with "
+        "CachedTokenAuthentication, on a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--orders", type=int, default=3)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.run(options)
+
+    def run(self, options):
+        user = UserFactory()
+        OrderFactory.create_batch(options["orders"], buyer=user)
+        token = Token.objects.create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        url = reverse("order_list")
+
+        original = OrderListView.authentication_classes
+        try:
+            for auth_class in (TokenAuthentication, CachedTokenAuthentication):
+                OrderListView.authentication_classes = [auth_class]
+                get_token_cache().clear()
+                client.get(url)  # Warm up (and fill the cache)
+                start = time.perf_counter()
+                for _ in range(options["requests"]):
+                    client.get(url)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{auth_class.__name__}\t"
+                    f"{options['requests'] / elapsed:.0f} req/s"
+                )
+        finally:
+            OrderListView.authentication_classes = original
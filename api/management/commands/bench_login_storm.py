@@ -0,0 +1,96 @@
+import asyncio
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+
+from api.benchmarks import throwaway_database
+from api.factories import BookFactory, CategoryFactory, UserFactory
+from api.models import User
+
+PASSWORD = "storm-password"
+
+
+class Command(BaseCommand):
+    help = (
+        "Catalog read latency through the ASGI handler while a storm of "
+        "logins runs, with the async (pooled) login and the sync DRF one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--duration", type=float, default=5.0)
+        parser.add_argument("--login-clients", type=int, default=16)
+        parser.add_argument("--catalog-clients", type=int, default=4)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.run(options)
+
+    def run(self, options):
+        # Hash once and share it, seeding shouldn't take minutes
+        template = UserFactory.build()
+        template.set_password(PASSWORD)
+        User.objects.bulk_create(
+            User(email=f"storm{index}@example.com", password=template.password)
+            for index in range(options["login_clients"])
+        )
+        BookFactory.create_batch(20, category=CategoryFactory())
+
+        scenarios = [
+            ("no logins", False, settings.ASGI_URLCONF),
+            ("async login", True, settings.ASGI_URLCONF),
+            ("sync login", True, settings.ROOT_URLCONF),
+        ]
+        self.stdout.write(
+            "scenario\tcatalog_reqs\tp50_ms\tp99_ms\tlogins\trejected"
+        )
+        for name, storm, urlconf in scenarios:
+            with override_settings(ASGI_URLCONF=urlconf):
+                result = asyncio.run(self.scenario(storm, options))
+            latencies, logins, rejected = result
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+            self.stdout.write(
+                f"{name}\t{len(latencies)}\t{p50:.1f}\t{p99:.1f}"
+                f"\t{logins}\t{rejected}"
+            )
+
+    async def scenario(self, storm, options):
+        deadline = time.perf_counter() + options["duration"]
+        latencies = []
+        logins = {"ok": 0, "rejected": 0}
+        catalog_url = reverse("category-list")
+        login_url = reverse("user-login")
+
+        async def read_catalog():
+            client = AsyncClient()
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                await client.get(catalog_url)
+                latencies.append(time.perf_counter() - start)
+
+        async def log_in(index):
+            client = AsyncClient()
+            payload = {
+                "email": f"storm{index}@example.com",
+                "password": PASSWORD,
+            }
+            while time.perf_counter() < deadline:
+                response = await client.post(
+                    login_url, payload, content_type="application/json"
+                )
+                if response.status_code == 503:
+                    logins["rejected"] += 1
+                    await asyncio.sleep(0.05)
+                else:
+                    logins["ok"] += 1
+
+        tasks = [read_catalog() for _ in range(options["catalog_clients"])]
+        if storm:
+            tasks += [log_in(i) for i in range(options["login_clients"])]
+        await asyncio.gather(*tasks)
+        return latencies, logins["ok"], logins["rejected"]
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import path
+from django.views.static import serve
+
+from api.benchmarks import throwaway_database
+from api.models import Book
+from base.urls import urlpatterns
+
+
+class Command(BaseCommand):
+    help = (
+        "Cover image throughput through api.media.serve_media (full, "
+        "revalidated, ranged and offloaded) against django.views.static."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument(
+            "--size", type=int, default=200, help="Cover size in KiB."
+        )
+
+    def handle(self, *args, **options):
+        with throwaway_database(), tempfile.TemporaryDirectory() as root:
+            with override_settings(MEDIA_ROOT=root, ROOT_URLCONF=__name__):
+                self.run(options)
+
+    def run(self, options):
+        storage = Book._meta.get_field("image").storage
+        name = storage.save(
+            "media/cover.jpg",
+            ContentFile(os.urandom(options["size"] * 1024)),
+        )
+        client = Client()
+        url = "/media/" + name
+        etag = client.get(url)["ETag"]
+
+        scenarios = [
+            ("static.serve", "/static-serve/" + name, {}, {}),
+            ("serve_media", url, {}, {}),
+            ("304", url, {"If-None-Match": etag}, {}),
+            ("range 64k", url, {"Range": "bytes=0-65535"}, {}),
+            (
+                "x-accel-redirect",
+                url,
+                {},
+                {"MEDIA_OFFLOAD": "x-accel-redirect"},
+            ),
+        ]
+        self.stdout.write("scenario\treq_per_s\tMiB_per_s")
+        for label, scenario_url, headers, overrides in scenarios:
+            with override_settings(**overrides):
+                received = 0
+                start = time.perf_counter()
+                for _ in range(options["requests"]):
+                    response = client.get(scenario_url, headers=headers)
+                    if response.streaming:
+                        for chunk in response.streaming_content:
+                            received += len(chunk)
+                    else:
+                        received += len(response.content)
+                    response.close()
+                elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{label}\t{options['requests'] / elapsed:.0f}"
+                f"\t{received / elapsed / 2**20:.0f}"
+            )
+
+
+def serve_from_media_root(request, path):
+    return serve(request, path, document_root=settings.MEDIA_ROOT)
+
+
+# The benchmark's URLconf: the project's, and the DEBUG-only static view
+urlpatterns = [
+    *urlpatterns,
+    path("static-serve/<path:path>", serve_from_media_root),
+]
@@ -0,0 +1,109 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework import filters
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.benchmarks import throwaway_database
+from api.models import Book, Category, User, category_key
+from api.search import BookSearchFilter, fts_available
+from api.views import BookListView
+
+SYLLABLES = (
+    "ka ri mo ten sha lo vin dar el na tor bel quin ras ul fe go ster "
+    "an mir"
+).split()
+
+# ~8000 pseudo-words, so terms are as selective as in a real catalog
+WORDS = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare /api/books/?search= latency of the FTS5 index against "
+        "the plain SearchFilter on a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=[10_000, 100_000, 1_000_000],
+        )
+        parser.add_argument(
+            "--terms",
+            nargs="+",
+            default=[WORDS[100], WORDS[2000][:4], f"{WORDS[5]} {WORDS[7]}"],
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.run(options)
+
+    def run(self, options):
+        if not fts_available(connection.alias):
+            self.stderr.write("FTS5 index not available on this database.")
+            return
+
+        seller = User.objects.create_user(
+            email="bench-seller@example.com",
+            password="password123",
+            user_type="seller",
+        )
+        categories = Category.objects.bulk_create(
+            Category(name=word.title(), key=category_key(word))
+            for word in WORDS[:50]
+        )
+        rng = random.Random(0)
+        seeded = 0
+        self.stdout.write("books\tterm\tfts_ms\tsearchfilter_ms")
+        for size in sorted(options["sizes"]):
+            self.seed(seller, categories, rng, size - seeded)
+            seeded = size
+            for term in options["terms"]:
+                fts = self.time_search(BookSearchFilter(), term, options)
+                plain = self.time_search(filters.SearchFilter(), term, options)
+                self.stdout.write(
+                    f"{size}\t{term}\t{fts:.2f}\t{plain:.2f}"
+                )
+
+    def seed(self, seller, categories, rng, count, batch_size=5000):
+        while count > 0:
+            batch = min(batch_size, count)
+            Book.objects.bulk_create(
+                Book(
+                    title=" ".join(rng.sample(WORDS, 3)).title(),
+                    author=" ".join(rng.sample(WORDS, 2)).title(),
+                    description=" ".join(rng.choices(WORDS, k=30)),
+                    category=rng.choice(categories),
+                    seller=seller,
+                    price=rng.randint(100, 9999) / 100,
+                )
+                for _ in range(batch)
+            )
+            count -= batch
+
+    def time_search(self, backend, term, options):
+        """
+        Best-of-N milliseconds for what BookListView does per request:
+        one page of results plus the pagination count.
+        """
+        view = BookListView()
+        request = Request(
+            APIRequestFactory().get("/api/books/", {"search": term})
+        )
+        best = float("inf")
+        for _ in range(options["repeat"]):
+            start = time.perf_counter()
+            queryset = backend.filter_queryset(
+                request, Book.objects.all(), view
+            )
+            queryset.count()
+            list(queryset[:5])
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
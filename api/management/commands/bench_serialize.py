@@ -0,0 +1,191 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.benchmarks import throwaway_database
+from api.models import Book, Category, Order, OrderItem, User, category_key
+from api.rows import (
+    BookListRowSerializer,
+    CategoryListRowSerializer,
+    OrderRowSerializer,
+)
+from api.serializer import (
+    BookListSerializer,
+    CategoryListSerializer,
+    OrderSerializer,
+)
+from api.views import orders_by_date, orders_with_items
+
+# Items per order
+ORDER_ITEMS = 3
+
+
+class Command(BaseCommand):
+    help = (
+        "Rows/sec serializing the book, category and order lists from the "
+        "database with their ModelSerializers and with their row "
+        "serializers (api/rows.py), on a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.run(options)
+
+    def run(self, options):
+        buyer = self.seed(options["rows"], random.Random(0))
+        request = Request(APIRequestFactory().get("/api/"))
+        context = {"request": request, "format": None, "view": None}
+        # (list, instances, ModelSerializer, rows, RowSerializer)
+        cases = [
+            (
+                "books",
+                Book.objects.all(),
+                BookListSerializer,
+                Book.objects.all(),
+                BookListRowSerializer,
+            ),
+            (
+                "categories",
+                Category.objects.all(),
+                CategoryListSerializer,
+                Category.objects.all(),
+                CategoryListRowSerializer,
+            ),
+            (
+                "orders",
+                orders_with_items(buyer),
+                OrderSerializer,
+                orders_by_date(buyer),
+                OrderRowSerializer,
+            ),
+        ]
+
+        self.stdout.write("list\trows\tbefore_rows/s\tafter_rows/s\tidentical")
+        for name, *case in cases:
+            rows, before, after, identical = self.compare(
+                *case, context, options["repeat"]
+            )
+            self.stdout.write(
+                f"{name}\t{rows}\t{rows / before:.0f}\t{rows / after:.0f}\t"
+                f"{identical}"
+            )
+
+    def compare(
+        self,
+        queryset,
+        serializer_class,
+        row_queryset,
+        row_serializer_class,
+        context,
+        repeat,
+    ):
+        """
+        (rows, best seconds with the ModelSerializer, with the
+        RowSerializer, whether both rendered the same JSON).
+        """
+
+        def before():
+            return serializer_class(
+                queryset.all(), many=True, context=context
+            ).data
+
+        def after():
+            serializer = row_serializer_class(context)
+            return serializer.serialize(serializer.rows(row_queryset))
+
+        before_data, before_time = self.best(before, repeat)
+        after_data, after_time = self.best(after, repeat)
+        renderer = JSONRenderer()
+        identical = renderer.render(before_data) == renderer.render(after_data)
+        return len(before_data), before_time, after_time, identical
+
+    def best(self, serialize, repeat):
+        """
+        The output of ``serialize()`` and its best time out of ``repeat``.
+        """
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = serialize()
+            best = min(best, time.perf_counter() - start)
+        return data, best
+
+    def seed(self, count, rng, batch_size=5000):
+        """
+        ``count`` books (a third with images and half of those with
+        derivatives), categories, and orders of one buyer.
+        """
+        seller = User.objects.create_user(
+            email="bench-seller@example.com",
+            password="password123",
+            user_type="seller",
+        )
+        buyer = User.objects.create_user(
+            email="bench-buyer@example.com", password="password123"
+        )
+        Category.objects.bulk_create(
+            (
+                Category(
+                    name=f"Category {index}",
+                    key=category_key(f"Category {index}"),
+                )
+                for index in range(count)
+            ),
+            batch_size=batch_size,
+        )
+        Book.objects.bulk_create(
+            (self.book(index, seller, rng) for index in range(count)),
+            batch_size=batch_size,
+        )
+        orders = Order.objects.bulk_create(
+            (
+                Order(buyer=buyer, total_price=Decimal(rng.randint(1, 99999)))
+                for _ in range(count)
+            ),
+            batch_size=batch_size,
+        )
+        book_ids = list(Book.objects.values_list("id", flat=True)[:100])
+        OrderItem.objects.bulk_create(
+            (
+                OrderItem(
+                    order=order,
+                    book_id=rng.choice(book_ids),
+                    quantity=rng.randint(1, 5),
+                    unit_price=Decimal(rng.randint(100, 9999)) / 100,
+                )
+                for order in orders
+                for _ in range(ORDER_ITEMS)
+            ),
+            batch_size=batch_size,
+        )
+        return buyer
+
+    def book(self, index, seller, rng):
+        image = variants = None
+        if index % 3 == 0:
+            image = f"media/cover-{index}.png"
+        if index % 6 == 0:
+            variants = {
+                "source": image,
+                "thumbnail": {
+                    "jpg": f"media/thumbnail-{index}.jpg",
+                    "webp": f"media/thumbnail-{index}.webp",
+                },
+            }
+        return Book(
+            title=f"Book {index}",
+            author=f"Author {index % 500}",
+            seller=seller,
+            price=Decimal(rng.randint(100, 9999)) / 100,
+            image=image,
+            image_variants=variants,
+        )
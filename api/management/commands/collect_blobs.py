@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api.images import book_blobs
+from api.models import Book
+from api.storage import (
+    BLOB_GC_BATCH_SIZE,
+    BLOB_GC_GRACE,
+    collect_garbage,
+    rebuild_refcounts,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete stored files no book has referenced for the grace period, "
+        "in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-minutes",
+            type=float,
+            default=BLOB_GC_GRACE.total_seconds() / 60,
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=BLOB_GC_BATCH_SIZE
+        )
+        parser.add_argument(
+            "--rebuild-refcounts",
+            action="store_true",
+            help="Recount references from the books first.",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild_refcounts"]:
+            rows = Book.objects.values_list("image", "image_variants")
+            rebuild_refcounts(
+                name for row in rows.iterator() for name in book_blobs(*row)
+            )
+
+        deleted = collect_garbage(
+            Book._meta.get_field("image").storage,
+            grace=timedelta(minutes=options["grace_minutes"]),
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(f"Deleted {deleted} unreferenced files")
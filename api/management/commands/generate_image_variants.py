@@ -0,0 +1,46 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.core.management.base import BaseCommand
+
+from api import images
+from api.models import Book
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the missing or outdated Book.image derivatives on the "
+        "derivative worker pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-pending",
+            type=int,
+            default=32,
+            help="Images submitted to the pool at once.",
+        )
+
+    def handle(self, *args, **options):
+        books = (
+            Book.objects.exclude(image="")
+            .exclude(image__isnull=True)
+            .only("id", "image", "image_variants")
+            .order_by("pk")
+        )
+        pending = set()
+        submitted = failed = 0
+        for book in books.iterator():
+            if not images.needs_variants(book):
+                continue
+            if len(pending) >= options["max_pending"]:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                failed += sum(1 for future in done if future.exception())
+            pending.add(images.pool.submit(book))
+            submitted += 1
+        done, _ = wait(pending)
+        failed += sum(1 for future in done if future.exception())
+
+        self.stdout.write(
+            f"Rendered images for {submitted - failed} books, "
+            f"{failed} failed"
+        )
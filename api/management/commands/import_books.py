@@ -0,0 +1,64 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importer import (
+    IMPORT_BATCH_SIZE,
+    IMPORT_FORMATS,
+    guess_format,
+    import_books,
+)
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a seller's books from a CSV or JSONL file ('-' for stdin), "
+        "in batches, skipping and reporting invalid rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--seller", required=True, help="Email of the selling user."
+        )
+        parser.add_argument("--format", choices=IMPORT_FORMATS)
+        parser.add_argument(
+            "--batch-size", type=int, default=IMPORT_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        try:
+            seller = User.objects.get(
+                email=options["seller"], user_type="seller"
+            )
+        except User.DoesNotExist:
+            raise CommandError(f"No seller with email {options['seller']}")
+
+        path = options["path"]
+        format = options["format"] or guess_format(path)
+        if format is None:
+            raise CommandError(
+                "Can't tell the format from the file name, pass --format"
+            )
+
+        if path == "-":
+            result = import_books(
+                sys.stdin, format, seller, options["batch_size"]
+            )
+        else:
+            with open(path, encoding="utf-8", newline="") as stream:
+                result = import_books(
+                    stream, format, seller, options["batch_size"]
+                )
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        if result.failed > len(result.errors):
+            self.stderr.write(
+                f"... and {result.failed - len(result.errors)} more errors"
+            )
+        self.stdout.write(
+            f"Imported {result.imported} books, {result.failed} rows failed "
+            f"in {result.elapsed:.2f}s ({result.rows_per_second:.0f} rows/s)"
+        )
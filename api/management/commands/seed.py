@@ -0,0 +1,92 @@
+import os
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from api.seeding import SEED_CHUNK_SIZE, SeedPlan, password_salt, seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Add a large, realistic synthetic dataset (users, categories, "
+        "books, carts and orders) to the database. The same --seed gives "
+        "the same rows. Every user's password is --password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=100_000)
+        parser.add_argument(
+            "--buyers", type=int, help="Default: one per 10 books."
+        )
+        parser.add_argument(
+            "--sellers", type=int, help="Default: one per 200 books."
+        )
+        parser.add_argument(
+            "--categories", type=int, help="Default: one per 2000 books."
+        )
+        parser.add_argument(
+            "--carts", type=int, help="Default: one per 5 buyers."
+        )
+        parser.add_argument(
+            "--orders", type=int, help="Default: two per buyer."
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Processes generating rows.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=SEED_CHUNK_SIZE)
+        parser.add_argument("--password", default="password123")
+
+    def handle(self, *args, **options):
+        def count(name, default):
+            value = options[name]
+            return default if value is None else value
+
+        books = options["books"]
+        buyers = count("buyers", max(1, books // 10))
+        counts = {
+            "books": books,
+            "buyers": buyers,
+            "sellers": count("sellers", max(1, books // 200)),
+            "categories": count("categories", max(10, books // 2000)),
+            "carts": count("carts", buyers // 5),
+            "orders": count("orders", 2 * buyers),
+        }
+        if (
+            min(counts.values()) < 0
+            or min(books, buyers, counts["sellers"], counts["categories"]) < 1
+        ):
+            raise CommandError(
+                "Seed at least one book, buyer, seller and category."
+            )
+        if min(options["workers"], options["chunk_size"]) < 1:
+            raise CommandError("Workers and chunk size must be at least 1.")
+
+        plan = SeedPlan.for_database(
+            password_hash=make_password(
+                options["password"], salt=password_salt(options["seed"])
+            ),
+            seed=options["seed"],
+            **counts,
+        )
+        started = last = time.perf_counter()
+
+        def progress(kind, rows):
+            nonlocal last
+            now = time.perf_counter()
+            self.stdout.write(
+                f"{kind}: {rows} in {now - last:.1f}s "
+                f"({rows / max(now - last, 1e-9):.0f}/s)"
+            )
+            last = now
+
+        seed(plan, options["workers"], options["chunk_size"], progress)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded in {time.perf_counter() - started:.1f}s"
+            )
+        )
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from api.slow_queries import collect
+
+ORDERINGS = {
+    "total": "total_ms",
+    "count": "count",
+    "max": "max_ms",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the slow queries logged by every worker (see "
+        "SLOW_QUERY_THRESHOLD_MS), added up per fingerprint, worst first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=10)
+        parser.add_argument(
+            "--order-by", choices=sorted(ORDERINGS), default="total"
+        )
+        parser.add_argument(
+            "--plans", action="store_true", help="Print the EXPLAIN plans."
+        )
+
+    def handle(self, *args, **options):
+        entries = sorted(
+            collect().values(),
+            key=lambda entry: entry[ORDERINGS[options["order_by"]]],
+            reverse=True,
+        )
+        if not entries:
+            self.stdout.write("No slow queries.")
+        for rank, entry in enumerate(entries[: options["limit"]], 1):
+            self.stdout.write(
+                f"{rank}. {entry['fingerprint']}: {entry['count']} queries, "
+                f"{entry['total_ms']:.1f} ms total, "
+                f"{entry['total_ms'] / entry['count']:.1f} ms mean, "
+                f"{entry['max_ms']:.1f} ms max"
+            )
+            self.stdout.write(f"   {entry['normalized']}")
+            for frame in entry["stack"] or ["(no project code on the stack)"]:
+                self.stdout.write(f"   at {frame}")
+            if options["plans"]:
+                for line in (entry["plan"] or "(no plan)").splitlines():
+                    self.stdout.write(f"   | {line}")
@@ -0,0 +1,162 @@
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .models import Book
+
+# Names given by ContentAddressedStorage: their content never changes
+HASHED_NAME = re.compile(r"(?:^|/)([0-9a-f]{64})(?:\.[^/]*)?$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class FileRange:
+    """
+    ``length`` bytes of an open file from ``start``. Keeps the file's
+    fileno(), so a WSGI server's file wrapper can still sendfile() it: it
+    sends Content-Length bytes from the current offset.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def media_etag(name, stat_result):
+    """
+    Strong ETag: the content hash for content-addressed names, else
+    modification time and size, like nginx.
+    """
+    match = HASHED_NAME.search(name)
+    if match:
+        return f'"{match.group(1)}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    (start, length) of a single-range Range header, None to ignore it
+    (malformed or several ranges, which are answered with the whole file)
+    and ValueError when it can't be satisfied.
+    """
+    match = RANGE.match(header)
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # The last N bytes
+        length = min(int(last), size)
+        if length == 0:
+            raise ValueError(header)
+        return size - length, length
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end - start + 1
+
+
+def not_modified(request, etag, mtime):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since is not None:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and int(mtime) <= since
+    return False
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve a MEDIA_ROOT file with strong validators, Range support and,
+    for content-addressed names, immutable caching. With MEDIA_OFFLOAD
+    set the proxy or server sends the file itself.
+    """
+    storage = Book._meta.get_field("image").storage
+    if any(part.startswith(".") for part in path.split("/")):
+        raise Http404("No such file.")
+    try:
+        full_path = storage.path(path)
+        stat_result = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404("No such file.")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404("No such file.")
+
+    etag = media_etag(path, stat_result)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(stat_result.st_mtime),
+        "Cache-Control": (
+            IMMUTABLE
+            if HASHED_NAME.search(path)
+            else f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}"
+        ),
+        "Accept-Ranges": "bytes",
+    }
+    if not_modified(request, etag, stat_result.st_mtime):
+        return HttpResponse(status=304, headers=headers)
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or "application/octet-stream"
+
+    offload = settings.MEDIA_OFFLOAD
+    if offload == "x-accel-redirect":
+        # nginx handles Range and conditional requests from here on
+        headers["X-Accel-Redirect"] = settings.MEDIA_OFFLOAD_PREFIX + path
+        return HttpResponse(content_type=content_type, headers=headers)
+    if offload == "x-sendfile":
+        headers["X-Sendfile"] = full_path
+        return HttpResponse(content_type=content_type, headers=headers)
+
+    size = stat_result.st_size
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return HttpResponse(status=416, headers=headers)
+
+    file = open(full_path, "rb")
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, length = byte_range
+        response = FileResponse(
+            FileRange(file, start, length), content_type=content_type
+        )
+        response.status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{start + length - 1}/{size}"
+        headers["Content-Length"] = str(length)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    for header, value in headers.items():
+        response.headers[header] = value
+    return response
@@ -0,0 +1,496 @@
+import bisect
+import fcntl
+import hmac
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_safe
+
+from .slow_queries import explaining
+
+# Prometheus' default latency buckets, in seconds
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.075,
+    0.1,
+    0.25,
+    0.5,
+    0.75,
+    1.0,
+    2.5,
+    5.0,
+    7.5,
+    10.0,
+)
+BUCKET_LABELS = [repr(bucket) for bucket in LATENCY_BUCKETS] + ["+Inf"]
+
+# name: (type, help)
+METRICS = {
+    "api_requests_total": (
+        "counter",
+        "Requests handled, by route, method and status code.",
+    ),
+    "api_request_duration_seconds": (
+        "histogram",
+        "Time taken to return a response, by route.",
+    ),
+    "api_db_queries_total": ("counter", "Database queries run, by route."),
+    "api_cache_hits_total": ("counter", "Cache hits, by cache and route."),
+    "api_cache_misses_total": ("counter", "Cache misses, by cache and route."),
+}
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Request methods labelled as they are, any other is "other": the method
+# comes from the client, and each label value is a new series
+KNOWN_METHODS = frozenset(
+    ["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+)
+
+# The RequestMetrics of the request being handled
+_current = ContextVar("request_metrics", default=None)
+
+HEADER = struct.Struct("<Q")  # bytes in use
+KEY_LENGTH = struct.Struct("<I")
+VALUE = struct.Struct("<d")
+INITIAL_SIZE = 64 * 1024
+
+PROCESS_FILE = re.compile(r"^metrics_(\d+)\.db$")
+# What the processes that are gone had recorded, see archive_dead_files()
+ARCHIVE_FILE = "metrics_archive.db"
+LOCK_FILE = "metrics.lock"
+
+
+def _aligned(offset):
+    return (offset + 7) & ~7
+
+
+def decode_key(key):
+    name, labels = json.loads(key)
+    return name, tuple(map(tuple, labels))
+
+
+@contextmanager
+def locked(directory):
+    """
+    Hold the metrics directory's lock: one process at a time reads and
+    archives the files, or two could add the same file to the archive.
+    """
+    with open(os.path.join(directory, LOCK_FILE), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # Someone else's
+        return True
+    return True
+
+
+def read_entries(data):
+    """
+    (key, value offset, value) of each entry of a metrics file's content.
+    """
+    if len(data) < HEADER.size:
+        return
+    (used,) = HEADER.unpack_from(data, 0)
+    offset = HEADER.size
+    while offset < used:
+        (length,) = KEY_LENGTH.unpack_from(data, offset)
+        start = offset + KEY_LENGTH.size
+        key = bytes(data[start : start + length]).decode()
+        value_offset = _aligned(start + length)
+        (value,) = VALUE.unpack_from(data, value_offset)
+        yield key, value_offset, value
+        offset = value_offset + VALUE.size
+
+
+class MetricsFile:
+    """
+    The metrics of one process, in a memory-mapped file no other process
+    writes: a header with the number of bytes in use, then one entry per
+    time series (key length, JSON key, padding, float64 value), appended
+    the first time the series is recorded.
+
+    Other processes read the file without locking: an entry is complete
+    before the header counts it, and values are aligned 8-byte writes.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            if size < INITIAL_SIZE:
+                os.ftruncate(fd, INITIAL_SIZE)
+                size = INITIAL_SIZE
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self._values = memoryview(self._mmap).cast("d")
+        # A file left by a process with the same pid is added to
+        self._indexes = {
+            decode_key(key): offset // VALUE.size
+            for key, offset, _ in read_entries(self._mmap)
+        }
+        (self._used,) = HEADER.unpack_from(self._mmap, 0)
+        self._used = max(self._used, HEADER.size)
+
+    def index(self, key):
+        """
+        Where the value of ``key``, (metric name, ((label, value), ...)),
+        is in the file, for add().
+        """
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._append(key)
+            return index
+
+    def add(self, increments):
+        """
+        Add each amount of ``increments``, (index, amount) pairs.
+        """
+        with self._lock:
+            values = self._values
+            for index, amount in increments:
+                values[index] += amount
+
+    def _append(self, key):
+        encoded = json.dumps(key, separators=(",", ":")).encode()
+        start = self._used + KEY_LENGTH.size
+        value_offset = _aligned(start + len(encoded))
+        end = value_offset + VALUE.size
+        if end > len(self._mmap):
+            self._grow(end)
+        KEY_LENGTH.pack_into(self._mmap, self._used, len(encoded))
+        self._mmap[start : start + len(encoded)] = encoded
+        VALUE.pack_into(self._mmap, value_offset, 0.0)
+        # Last, so readers never see a partial entry
+        HEADER.pack_into(self._mmap, 0, end)
+        self._used = end
+        self._indexes[key] = value_offset // VALUE.size
+        return self._indexes[key]
+
+    def close(self):
+        with self._lock:
+            self._values.release()
+            self._mmap.close()
+
+    def _grow(self, needed):
+        size = len(self._mmap)
+        while size < needed:
+            size *= 2
+        self._values.release()
+        self._mmap.resize(size)
+        self._values = memoryview(self._mmap).cast("d")
+
+
+class Metrics:
+    """
+    Per-route request metrics of this process, written to its file in
+    METRICS_DIR, and the sum of every process's file for /metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = self._directory = None
+        # (route, method, status, bucket) -> their index() in _file
+        self._request_indexes = {}
+        # (cache, hit, route) -> index() in _file
+        self._cache_indexes = {}
+
+    def file(self):
+        # Forked workers and changed settings (tests) get their own file
+        pid, directory = os.getpid(), settings.METRICS_DIR
+        if pid != self._pid or directory is not self._directory:
+            with self._lock:
+                os.makedirs(directory, exist_ok=True)
+                self._file = MetricsFile(
+                    os.path.join(directory, f"metrics_{pid}.db")
+                )
+                self._request_indexes = {}
+                self._cache_indexes = {}
+                self._pid, self._directory = pid, directory
+        return self._file
+
+    def record_request(self, route, method, status, duration, current):
+        file = self.file()
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, duration)
+        indexes = self._request_indexes.get((route, method, status, bucket))
+        if indexes is None:
+            indexes = self._request_indexes[route, method, status, bucket] = (
+                self.request_indexes(file, route, method, status, bucket)
+            )
+        requests, bucket_count, duration_sum, queries = indexes
+        increments = [
+            (requests, 1),
+            (bucket_count, 1),
+            (duration_sum, duration),
+            (queries, current.queries),
+        ]
+        for (cache, hit), count in current.cache_lookups.items():
+            index = self._cache_indexes.get((cache, hit, route))
+            if index is None:
+                name = (
+                    "api_cache_hits_total" if hit else "api_cache_misses_total"
+                )
+                index = self._cache_indexes[cache, hit, route] = file.index(
+                    (name, (("cache", cache), ("route", route)))
+                )
+            increments.append((index, count))
+        file.add(increments)
+
+    def request_indexes(self, file, route, method, status, bucket):
+        route_label = (("route", route),)
+        return (
+            file.index(
+                (
+                    "api_requests_total",
+                    (("method", method), ("route", route), ("status", status)),
+                )
+            ),
+            file.index(
+                (
+                    "api_request_duration_seconds_bucket",
+                    (("le", BUCKET_LABELS[bucket]), ("route", route)),
+                )
+            ),
+            file.index(("api_request_duration_seconds_sum", route_label)),
+            file.index(("api_db_queries_total", route_label)),
+        )
+
+    def collect(self):
+        """
+        {(name, labels): value} summed over the files of every process.
+        """
+        totals = defaultdict(float)
+        directory = settings.METRICS_DIR
+        if not os.path.isdir(directory):
+            return totals
+        # Under the lock, so no file is archived while it's being read
+        with locked(directory):
+            self.archive_dead_files(directory)
+            for entry in os.scandir(directory):
+                if not entry.name.startswith("metrics_"):
+                    continue
+                try:
+                    with open(entry.path, "rb") as stream:
+                        data = stream.read()
+                except FileNotFoundError:
+                    continue
+                for key, _, value in read_entries(data):
+                    totals[decode_key(key)] += value
+        return totals
+
+    def archive_dead_files(self, directory):
+        """
+        Add the files of the processes that are gone to the archive file,
+        and delete them: they'd pile up as workers come and go. The caller
+        holds the directory's lock (see locked()).
+        """
+        archive = None
+        try:
+            for entry in os.scandir(directory):
+                match = PROCESS_FILE.match(entry.name)
+                if match is None or process_alive(int(match[1])):
+                    continue
+                try:
+                    with open(entry.path, "rb") as stream:
+                        data = stream.read()
+                except FileNotFoundError:
+                    continue
+                if archive is None:
+                    archive = MetricsFile(
+                        os.path.join(directory, ARCHIVE_FILE)
+                    )
+                archive.add(
+                    [
+                        (archive.index(decode_key(key)), value)
+                        for key, _, value in read_entries(data)
+                    ]
+                )
+                os.remove(entry.path)
+        finally:
+            if archive is not None:
+                archive.close()
+
+    def render(self):
+        """
+        Everything collect()ed, in the Prometheus text format.
+        """
+        series = defaultdict(list)
+        histograms = defaultdict(lambda: defaultdict(float))
+        for (name, labels), value in sorted(self.collect().items()):
+            if name == "api_request_duration_seconds_bucket":
+                labels = dict(labels)
+                bucket = labels.pop("le")
+                histograms[tuple(labels.items())][bucket] += value
+            else:
+                series[name].append((labels, value))
+
+        lines = []
+        for name, (kind, help) in METRICS.items():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            if kind != "histogram":
+                for labels, value in series[name]:
+                    lines.append(f"{name}{format_labels(labels)} {value!r}")
+                continue
+            sums = dict(series[f"{name}_sum"])
+            for labels, buckets in sorted(histograms.items()):
+                count = 0.0
+                for bucket in BUCKET_LABELS:
+                    count += buckets.get(bucket, 0.0)
+                    lines.append(
+                        f"{name}_bucket"
+                        f"{format_labels((('le', bucket),) + labels)} "
+                        f"{count!r}"
+                    )
+                lines.append(
+                    f"{name}_sum{format_labels(labels)} "
+                    f"{sums.get(labels, 0.0)!r}"
+                )
+                lines.append(f"{name}_count{format_labels(labels)} {count!r}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (
+            name,
+            value.replace("\\", r"\\")
+            .replace('"', r"\"")
+            .replace("\n", r"\n"),
+        )
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+metrics = Metrics()
+
+
+class RequestMetrics:
+    """
+    What the request being handled did, for Metrics.record_request().
+    """
+
+    __slots__ = ("queries", "cache_lookups")
+
+    def __init__(self):
+        self.queries = 0
+        # (cache, hit): count
+        self.cache_lookups = defaultdict(int)
+
+
+def count_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting the queries of the current request,
+    installed on every connection (see api/signals.py).
+    """
+    current = _current.get()
+    if current is not None and not explaining():
+        current.queries += 1
+    return execute(sql, params, many, context)
+
+
+def count_cache_lookup(cache, hit):
+    current = _current.get()
+    if current is not None:
+        current.cache_lookups[cache, hit] += 1
+
+
+class MetricsMiddleware:
+    """
+    Record every request in ``metrics``, labelled with the name of the
+    URL pattern it matched ("unmatched" when there is none).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        current = RequestMetrics()
+        token = _current.set(current)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, time.perf_counter() - start, current)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        current = RequestMetrics()
+        token = _current.set(current)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, time.perf_counter() - start, current)
+        return response
+
+    def record(self, request, response, duration, current):
+        match = request.resolver_match
+        route = (match.url_name if match else None) or "unmatched"
+        method = request.method
+        if method not in KNOWN_METHODS:
+            method = "other"
+        metrics.record_request(
+            route, method, str(response.status_code), duration, current
+        )
+
+
+def may_scrape(request):
+    if request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    if not token:
+        return False
+    scheme, _, credentials = request.headers.get(
+        "Authorization", ""
+    ).partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(
+        credentials.encode(), token.encode()
+    )
+
+
+@require_safe
+def metrics_view(request):
+    """
+    The metrics of every worker process, for Prometheus to scrape from
+    METRICS_ALLOWED_IPS or with the METRICS_TOKEN bearer token.
+    """
+    if not may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,146 @@
+from asgiref.sync import (
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async,
+)
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.decorators import sync_and_async_middleware
+
+from .profiling import (
+    RequestProfile,
+    get_profile_store,
+    may_profile,
+    profiler_slot,
+    profiling_requested,
+)
+from .timing import RequestTimer, sampled
+
+
+@sync_and_async_middleware
+def asgi_urlconf_middleware(get_response):
+    """
+    Resolve requests coming through base/asgi.py with ASGI_URLCONF, so
+    they get the async versions of the views that have one.
+    """
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            if isinstance(request, ASGIRequest):
+                request.urlconf = settings.ASGI_URLCONF
+            return await get_response(request)
+
+    else:
+
+        def middleware(request):
+            if isinstance(request, ASGIRequest):
+                request.urlconf = settings.ASGI_URLCONF
+            return get_response(request)
+
+    return middleware
+
+
+class RequestTimingMiddleware:
+    """
+    Time a sample of the requests (REQUEST_TIMING_SAMPLE_RATE): their
+    query count, SQL, serializer and render time go in a Server-Timing
+    header and a log line on the api.timing logger. Requests left out
+    cost one random() call.
+
+    Streamed responses are timed until their first byte.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not sampled():
+            return self.get_response(request)
+        timer = request._timer = RequestTimer()
+        with timer.activate():
+            response = self.get_response(request)
+        return self.report(request, response, timer)
+
+    async def __acall__(self, request):
+        if not sampled():
+            return await self.get_response(request)
+        timer = request._timer = RequestTimer()
+        with timer.activate():
+            response = await self.get_response(request)
+        return self.report(request, response, timer)
+
+    def process_template_response(self, request, response):
+        timer = getattr(request, "_timer", None)
+        if timer is not None:
+            timer.time_render(response)
+        return response
+
+    def report(self, request, response, timer):
+        timer.finish()
+        response["Server-Timing"] = timer.server_timing()
+        timer.log(request, response)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Run the requests asking for it (see may_profile()) under cProfile,
+    and store the profile and their SQL in the profile store. The
+    response says where in an X-Profile-Id header. Other requests cost
+    two dictionary lookups.
+
+    One request is profiled at a time per process (see profiler_slot()),
+    others asking meanwhile are run unprofiled. Streamed responses are
+    profiled until their first byte. Under ASGI, only the event loop
+    thread is profiled: sync code run in threads shows up as time waiting
+    for it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not (profiling_requested(request) and may_profile(request)):
+            return self.get_response(request)
+        with profiler_slot() as free:
+            if not free:
+                return self.get_response(request)
+            profile = RequestProfile()
+            with profile.activate():
+                response = self.get_response(request)
+        return self.save(request, response, profile)
+
+    async def __acall__(self, request):
+        if not (
+            profiling_requested(request)
+            and await sync_to_async(may_profile)(request)
+        ):
+            return await self.get_response(request)
+        with profiler_slot() as free:
+            if not free:
+                return await self.get_response(request)
+            profile = RequestProfile()
+            with profile.activate():
+                response = await self.get_response(request)
+        return await sync_to_async(self.save)(request, response, profile)
+
+    def save(self, request, response, profile):
+        profile_id = get_profile_store().save(request, response, profile)
+        response["X-Profile-Id"] = profile_id
+        return response
@@ -0,0 +1,95 @@
+from django.db import migrations
+
+# FTS5 index over the searchable book fields. Kept in sync with api_book
+# and api_category by triggers, so bulk writes are covered as well.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE api_book_fts USING fts5(
+        title, description, category, author,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER api_book_fts_ai AFTER INSERT ON api_book BEGIN
+        INSERT INTO api_book_fts (rowid, title, description, category, author)
+        VALUES (
+            new.id, new.title, new.description,
+            (SELECT name FROM api_category WHERE id = new.category_id),
+            new.author
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER api_book_fts_au
+    AFTER UPDATE OF title, description, author, category_id ON api_book BEGIN
+        DELETE FROM api_book_fts WHERE rowid = old.id;
+        INSERT INTO api_book_fts (rowid, title, description, category, author)
+        VALUES (
+            new.id, new.title, new.description,
+            (SELECT name FROM api_category WHERE id = new.category_id),
+            new.author
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER api_book_fts_ad AFTER DELETE ON api_book BEGIN
+        DELETE FROM api_book_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER api_category_fts_au AFTER UPDATE OF name ON api_category
+    BEGIN
+        UPDATE api_book_fts SET category = new.name
+        WHERE rowid IN (SELECT id FROM api_book WHERE category_id = new.id);
+    END
+    """,
+    """
+    INSERT INTO api_book_fts (rowid, title, description, category, author)
+    SELECT b.id, b.title, b.description, c.name, b.author
+    FROM api_book b LEFT JOIN api_category c ON c.id = b.category_id
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS api_category_fts_au",
+    "DROP TRIGGER IF EXISTS api_book_fts_ad",
+    "DROP TRIGGER IF EXISTS api_book_fts_au",
+    "DROP TRIGGER IF EXISTS api_book_fts_ai",
+    "DROP TABLE IF EXISTS api_book_fts",
+]
+
+
+def fts5_supported(connection):
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        options = {row[0] for row in cursor.fetchall()}
+    return "ENABLE_FTS5" in options
+
+
+def create_book_fts(apps, schema_editor):
+    # Other backends keep using the plain SearchFilter
+    if not fts5_supported(schema_editor.connection):
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_book_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_cart_order_profile_orderitem_cartitem"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_book_fts, drop_book_fts),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_book_created_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="image_variants",
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_book_image_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Blob",
+            fields=[
+                (
+                    "created",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, editable=False
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, editable=False
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        max_length=255, primary_key=True, serialize=False
+                    ),
+                ),
+                ("size", models.PositiveBigIntegerField(default=0)),
+                ("refcount", models.IntegerField(default=0)),
+                (
+                    "released_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, null=True
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["refcount", "released_at"],
+                        name="blob_garbage_idx",
+                    )
+                ],
+            },
+        ),
+    ]
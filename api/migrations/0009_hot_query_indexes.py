@@ -0,0 +1,51 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_blob"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="blob",
+            name="blob_garbage_idx",
+        ),
+        migrations.AddIndex(
+            model_name="blob",
+            index=models.Index(
+                condition=models.Q(("refcount__lte", 0)),
+                fields=["released_at"],
+                name="blob_garbage_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["category", "-created", "-id"],
+                name="book_category_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["updated_at", "category"], name="book_updated_at_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cartitem",
+            index=models.Index(
+                fields=["cart", "book"], name="cartitem_cart_book_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["buyer", "ordered_at", "id"],
+                name="order_buyer_ordered_idx",
+            ),
+        ),
+    ]
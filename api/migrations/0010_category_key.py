@@ -0,0 +1,47 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:46
+
+from django.db import migrations, models
+
+
+def fill_category_keys(apps, schema_editor):
+    """
+    Key every category, merging the ones whose names only differed in
+    case or spacing (name__iexact lookups created those) into the oldest.
+    """
+    Book = apps.get_model("api", "Book")
+    Category = apps.get_model("api", "Category")
+    kept = {}
+    for category in Category.objects.order_by("pk"):
+        key = " ".join(category.name.split()).casefold()
+        if key in kept:
+            Book.objects.filter(category_id=category.pk).update(
+                category_id=kept[key]
+            )
+            category.delete()
+        else:
+            Category.objects.filter(pk=category.pk).update(key=key)
+            kept[key] = category.pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="key",
+            field=models.CharField(editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(fill_category_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="category",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("key__isnull", False)),
+                fields=("key",),
+                name="category_key_unique",
+            ),
+        ),
+    ]
@@ -1,11 +1,51 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.dispatch import Signal
 from django.utils import timezone
 
+from . import hashing
 from .manager import CustomUserManager
 
 # Create your models here.
 
+# Sent after QuerySet.update()/bulk_update()/bulk_create() on a
+# TimestampModel, which bypass post_save. Receivers get the model as sender.
+bulk_updated = Signal()
+
+
+class TimestampQuerySet(models.QuerySet):
+    """
+    Keeps updated_at current on bulk writes too.
+    """
+
+    def update(self, **kwargs):
+        kwargs.setdefault("updated_at", timezone.now())
+        rows = super().update(**kwargs)
+        bulk_updated.send(sender=self.model)
+        return rows
+
+    update.alters_data = True
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs = list(objs)
+        now = timezone.now()
+        for obj in objs:
+            obj.updated_at = now
+        if "updated_at" not in fields:
+            fields = [*fields, "updated_at"]
+        rows = super().bulk_update(objs, fields, batch_size=batch_size)
+        bulk_updated.send(sender=self.model)
+        return rows
+
+    bulk_update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        bulk_updated.send(sender=self.model)
+        return objs
+
+    bulk_create.alters_data = True
+
 
 class TimestampModel(models.Model):
     created = models.DateTimeField(
@@ -15,18 +55,93 @@ class TimestampModel(models.Model):
         default=timezone.now, editable=False
     )  # Automatically set when updated
 
+    objects = TimestampQuerySet.as_manager()
+
     class Meta:
         abstract = True
 
+    def save(self, *args, update_fields=None, **kwargs):
+        self.updated_at = timezone.now()
+        if update_fields is not None and "updated_at" not in update_fields:
+            update_fields = [*update_fields, "updated_at"]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+
+def category_key(name):
+    """
+    What category names are compared by: neither case nor runs of
+    whitespace tell two categories apart.
+    """
+    return " ".join(name.split()).casefold()
+
+
+class CategoryQuerySet(TimestampQuerySet):
+    """
+    Keeps Category.key current on bulk writes too.
+    """
+
+    def update(self, **kwargs):
+        # bulk_update() sets both, with an expression each
+        if "name" in kwargs and "key" not in kwargs:
+            if not isinstance(kwargs["name"], str):
+                raise TypeError(
+                    "Category names must be strings in update(), their "
+                    "key is computed in Python."
+                )
+            kwargs["key"] = category_key(kwargs["name"])
+        return super().update(**kwargs)
+
+    update.alters_data = True
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs = list(objs)
+        if "name" in fields:
+            for obj in objs:
+                obj.key = category_key(obj.name)
+            if "key" not in fields:
+                fields = [*fields, "key"]
+        return super().bulk_update(objs, fields, batch_size=batch_size)
+
+    bulk_update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.key = category_key(obj.name)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    bulk_create.alters_data = True
+
 
 class Category(TimestampModel):
     name = models.CharField(max_length=100)
+    # category_key(name), kept current by save() and CategoryQuerySet
+    key = models.CharField(max_length=255, null=True, editable=False)
     # slug = models.SlugField(max_length=100 , unique= True , null = True)
     # cat_image = models.ImageField(upload_to= "media/categories" , blank = True)
 
+    objects = CategoryQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Partial only so SQLite can add it without rebuilding the
+            # table (and dropping its FTS triggers); saved rows have a key
+            models.UniqueConstraint(
+                fields=["key"],
+                condition=models.Q(key__isnull=False),
+                name="category_key_unique",
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, update_fields=None, **kwargs):
+        self.key = category_key(self.name)
+        if update_fields is not None and "key" not in update_fields:
+            update_fields = [*update_fields, "key"]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
 
 USER_TYPE_CHOICES = [
     ("buyer", "Buyer"),
@@ -46,11 +161,29 @@ class User(AbstractUser, TimestampModel):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["first_name", "last_name"]
 
-    objects = CustomUserManager()
+    # With TimestampQuerySet's bulk writes, which drop cached tokens too
+    objects = CustomUserManager.from_queryset(TimestampQuerySet)()
 
     def __str__(self):
         return self.email
 
+    # The async views hash passwords on the bounded pool in api.hashing,
+    # through these; they raise HashingPoolBusy when it's full.
+
+    async def aset_password(self, raw_password):
+        self.password = await hashing.amake_password(raw_password)
+        self._password = raw_password
+
+    async def acheck_password(self, raw_password):
+        is_correct, must_update = await hashing.averify_password(
+            raw_password, self.password
+        )
+        if is_correct and must_update:
+            await self.aset_password(raw_password)
+            self._password = None
+            await self.asave(update_fields=["password"])
+        return is_correct
+
 
 class Book(TimestampModel):
     title = models.CharField(max_length=100, blank=False)
@@ -61,9 +194,29 @@ class Book(TimestampModel):
     )
     price = models.DecimalField(max_digits=6, decimal_places=2)
     image = models.ImageField(upload_to="media", null=True)
+    # Derivatives of image, see api.images; null until they're generated
+    image_variants = models.JSONField(null=True, blank=True, editable=False)
     description = models.TextField(blank=True, null=True)
     is_available = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # Ordering used by keyset pagination of the catalog
+            models.Index(
+                fields=["-created", "-id"], name="book_created_id_idx"
+            ),
+            # A category's books, newest first (CategoryDetailView)
+            models.Index(
+                fields=["category", "-created", "-id"],
+                name="book_category_created_idx",
+            ),
+            # Incremental exports (?updated_since=), and covers the
+            # catalog's Last-Modified aggregate
+            models.Index(
+                fields=["updated_at", "category"], name="book_updated_at_idx"
+            ),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -86,6 +239,14 @@ class CartItem(TimestampModel):
     quantity = models.IntegerField()
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # A cart's line for a book, see CartSerializer.create()
+            models.Index(
+                fields=["cart", "book"], name="cartitem_cart_book_idx"
+            ),
+        ]
+
     def __str__(self):
         return self.book.title
 
@@ -101,6 +262,15 @@ class Order(TimestampModel):
         auto_now_add=True
     )  # Total price of the order
 
+    class Meta:
+        indexes = [
+            # A buyer's orders, in the order they were placed
+            models.Index(
+                fields=["buyer", "ordered_at", "id"],
+                name="order_buyer_ordered_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.buyer} "
 
@@ -125,6 +295,35 @@ class OrderItem(TimestampModel):
         return self.quantity * self.unit_price
 
 
+class Blob(TimestampModel):
+    """
+    A file in content-addressed storage (api.storage), with the number of
+    references to it from Book rows. Unreferenced blobs are deleted by
+    api.storage.collect_garbage().
+    """
+
+    name = models.CharField(max_length=255, primary_key=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    # When it was stored or last released, garbage is only collected
+    # after a grace period so a fresh upload isn't deleted before the
+    # book referencing it is saved
+    released_at = models.DateTimeField(null=True, default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Only unreferenced blobs, oldest release first
+            models.Index(
+                fields=["released_at"],
+                condition=models.Q(refcount__lte=0),
+                name="blob_garbage_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
 class Profile(TimestampModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
@@ -1,6 +1,242 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Largest number of rows counted when estimating on backends that can't
+# report a planner estimate.
+ESTIMATE_COUNT_CAP = 1000
+
 
 class CustomPagination(PageNumberPagination):
     page_size = 5  # Number of items per page
-    page_size_query_param = 'page_size'  # Allow clients to set page size
+    page_size_query_param = "page_size"  # Allow clients to set page size
     max_page_size = 50  # Maximum limit for page size
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset() with the count and the page fetched through
+        the async ORM.
+        """
+        self.request = request
+        paginator = self.django_paginator_class(
+            queryset, self.get_page_size(request)
+        )
+        # Paginator.count is a cached_property, prime it asynchronously
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            )
+            raise NotFound(msg)
+        self.page.object_list = [obj async for obj in self.page.object_list]
+        return list(self.page)
+
+
+def estimate_count(queryset, cap=ESTIMATE_COUNT_CAP):
+    """
+    Cheap row count for a queryset, without scanning all of it.
+
+    PostgreSQL reports the planner's row estimate; other backends count
+    at most ``cap`` rows, so large results come back as ``cap``.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    return queryset[:cap].count()
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on ``(created, id)``, newest first.
+
+    Each page is a single indexed range query, so deep pages cost the same
+    as the first one. No COUNT is run unless the client asks for one with
+    ``?count=exact`` or ``?count=estimate``.
+    """
+
+    page_size = CustomPagination.page_size
+    page_size_query_param = CustomPagination.page_size_query_param
+    max_page_size = CustomPagination.max_page_size
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count, self.count_is_estimate = self.get_count(queryset, request)
+        page_queryset = self.get_page_queryset(queryset, request)
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset() through the async ORM.
+        """
+        self.count, self.count_is_estimate = await self.aget_count(
+            queryset, request
+        )
+        page_queryset = self.get_page_queryset(queryset, request)
+        return self.set_page([obj async for obj in page_queryset])
+
+    def get_page_queryset(self, queryset, request):
+        """
+        The (lazy) query for the requested page, plus one row to tell
+        whether there is a page after it.
+        """
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.position, self.reverse = self.decode_cursor(request)
+
+        if self.position is not None:
+            created, pk = self.position
+            if self.reverse:
+                queryset = queryset.filter(created__gte=created).filter(
+                    Q(created__gt=created) | Q(created=created, id__gt=pk)
+                )
+            else:
+                queryset = queryset.filter(created__lte=created).filter(
+                    Q(created__lt=created) | Q(created=created, id__lt=pk)
+                )
+        if self.reverse:
+            ordering = ("created", "id")
+        else:
+            ordering = ("-created", "-id")
+        return queryset.order_by(*ordering)[: self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        came_from_page = self.position is not None
+
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = came_from_page, has_more
+        else:
+            self.has_next, self.has_previous = has_more, came_from_page
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response["count"] = self.count
+            response["count_is_estimate"] = self.count_is_estimate
+        response["next"] = self.get_next_link()
+        response["previous"] = self.get_previous_link()
+        response["results"] = data
+        return Response(response)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == "exact":
+            return queryset.count(), False
+        if mode == "estimate":
+            return estimate_count(queryset), True
+        return None, False
+
+    async def aget_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == "exact":
+            return await queryset.acount(), False
+        if mode == "estimate":
+            return await sync_to_async(estimate_count)(queryset), True
+        return None, False
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        return self.build_link(last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        first = self.page[0]
+        return self.build_link(first, reverse=True)
+
+    def build_link(self, obj, reverse):
+        url = remove_query_param(self.base_url, self.count_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(obj, reverse)
+        )
+
+    def encode_cursor(self, obj, reverse):
+        # obj is a model instance or a named row (see api/rows.py)
+        payload = {"c": obj.created.isoformat(), "i": obj.id}
+        if reverse:
+            payload["r"] = 1
+        encoded = json.dumps(payload, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(encoded).decode()
+
+    def decode_cursor(self, request):
+        """
+        Return ``((created, id), reverse)`` for the requested cursor, or
+        ``(None, False)`` for the first page.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            created = parse_datetime(payload["c"])
+            pk = int(payload["i"])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if created is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (created, pk), bool(payload.get("r"))
+
+
+class CatalogPagination(BasePagination):
+    """
+    Page numbers by default; keyset pages once the client sends ``cursor``
+    (an empty ``?cursor=`` starts at the first page).
+
+    Searches always get page numbers: their results are ranked, and
+    keyset pages would put them in date order instead.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.select_paginator(request)
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.select_paginator(request)
+        return await self.paginator.apaginate_queryset(queryset, request, view)
+
+    def select_paginator(self, request):
+        if KeysetPagination.cursor_query_param in request.query_params and (
+            not request.query_params.get(api_settings.SEARCH_PARAM)
+        ):
+            return KeysetPagination()
+        return CustomPagination()
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
@@ -0,0 +1,261 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from rest_framework import exceptions
+
+from .authentication import CachedTokenAuthentication
+from .slow_queries import explaining
+
+PROFILE_HEADER = "HTTP_X_PROFILE_TOKEN"
+PROFILE_PARAM = "profile"
+PROFILE_ID = re.compile(r"^\d+-[0-9a-f]{8}$")
+SIGNING_SALT = "api.profiling"
+# Functions listed in the report, by cumulative time
+REPORT_FUNCTIONS = 40
+
+# The RequestProfile of the request being handled, None when not profiled
+_profile = ContextVar("request_profile", default=None)
+
+# Held while a request is profiled. A second cProfile profiler fails to
+# start on Python 3.12+, and under ASGI, where requests share the event
+# loop thread, it would record the other request's calls as well.
+_profiler_busy = threading.Lock()
+
+
+def make_token():
+    """
+    A value for the X-Profile-Token header, valid for
+    PROFILING_TOKEN_MAX_AGE seconds.
+    """
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign(PROFILE_PARAM)
+
+
+def valid_token(token):
+    try:
+        value = signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+            token, max_age=settings.PROFILING_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return value == PROFILE_PARAM
+
+
+def profiling_requested(request):
+    """
+    Whether the request asks to be profiled. Cheap, every request is
+    checked; may_profile() then decides.
+    """
+    return PROFILE_HEADER in request.META or (
+        f"{PROFILE_PARAM}=" in request.META.get("QUERY_STRING", "")
+    )
+
+
+def may_profile(request):
+    """
+    Whether the request has a valid X-Profile-Token header, or comes from
+    a staff user (session or token) with ?profile=1.
+    """
+    if PROFILE_HEADER in request.META:
+        return valid_token(request.META[PROFILE_HEADER])
+    if request.GET.get(PROFILE_PARAM) != "1":
+        return False
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        try:
+            authenticated = CachedTokenAuthentication().authenticate(request)
+        except exceptions.AuthenticationFailed:
+            return False
+        user = authenticated[0] if authenticated else None
+    return user is not None and user.is_staff
+
+
+@contextmanager
+def profiler_slot():
+    """
+    Whether the profiler is free, reserving it until the block ends if
+    it is. Requests asking to be profiled while it isn't are run as usual.
+    """
+    acquired = _profiler_busy.acquire(blocking=False)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            _profiler_busy.release()
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper recording the queries of a profiled request,
+    installed on every connection (see api/signals.py).
+    """
+    profile = _profile.get()
+    if profile is None or explaining():
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries.append(
+            {
+                "sql": sql,
+                "many": many,
+                "ms": round((time.perf_counter() - start) * 1000, 3),
+            }
+        )
+
+
+class RequestProfile:
+    """
+    cProfile statistics and the SQL queries of one request. Query
+    parameters are left out, they can hold credentials.
+    """
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.queries = []
+        self.started_at = timezone.now()
+        self.duration = 0.0
+
+    @contextmanager
+    def activate(self):
+        token = _profile.set(self)
+        start = time.perf_counter()
+        self.profiler.enable()
+        try:
+            yield self
+        finally:
+            self.profiler.disable()
+            self.duration = time.perf_counter() - start
+            _profile.reset(token)
+
+    def report(self):
+        """
+        The slowest functions, by cumulative time, then what each called.
+        """
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE)
+        stats.print_stats(REPORT_FUNCTIONS)
+        stats.print_callees(REPORT_FUNCTIONS)
+        return stream.getvalue()
+
+
+class ProfileStore:
+    """
+    The latest ``max_profiles`` profiles, in ``directory``: a JSON file
+    per profile (request, SQL and report) and its pstats dump, for tools
+    like snakeviz. Shared by the worker processes.
+    """
+
+    # Fields of the JSON files listed by summaries()
+    SUMMARY_FIELDS = (
+        "id",
+        "started_at",
+        "method",
+        "path",
+        "route",
+        "status",
+        "duration_ms",
+        "queries",
+        "sql_ms",
+    )
+
+    def __init__(self, directory, max_profiles):
+        self.directory = str(directory)
+        self.max_profiles = max_profiles
+
+    def path(self, profile_id, extension):
+        return os.path.join(self.directory, f"{profile_id}.{extension}")
+
+    def save(self, request, response, profile):
+        """
+        Store the profile of a request, return its id.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        match = request.resolver_match
+        data = {
+            "id": profile_id,
+            "started_at": profile.started_at.isoformat(),
+            "method": request.method,
+            # Without the query string, which can hold tokens
+            "path": request.path,
+            "route": match.url_name if match else None,
+            "status": response.status_code,
+            "duration_ms": round(profile.duration * 1000, 3),
+            "queries": len(profile.queries),
+            "sql_ms": round(sum(query["ms"] for query in profile.queries), 3),
+            "sql": profile.queries,
+            "report": profile.report(),
+        }
+        profile.profiler.dump_stats(self.path(profile_id, "pstats"))
+        # Written under another name first: readers never see it partial
+        temporary = self.path(profile_id, "json.tmp")
+        with open(temporary, "w") as stream:
+            json.dump(data, stream)
+        os.replace(temporary, self.path(profile_id, "json"))
+        self.rotate()
+        return profile_id
+
+    def ids(self):
+        """
+        Ids of the stored profiles, newest first.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        ids = [
+            name[: -len(".json")]
+            for name in names
+            if name.endswith(".json") and PROFILE_ID.match(name[:-5])
+        ]
+        return sorted(ids, key=lambda id: int(id.split("-")[0]), reverse=True)
+
+    def rotate(self):
+        for profile_id in self.ids()[self.max_profiles :]:
+            for extension in ("json", "pstats"):
+                try:
+                    os.remove(self.path(profile_id, extension))
+                except FileNotFoundError:  # Rotated by another worker
+                    pass
+
+    def get(self, profile_id):
+        """
+        A stored profile, None when there is no such profile.
+        """
+        if not PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(self.path(profile_id, "json")) as stream:
+                return json.load(stream)
+        except FileNotFoundError:
+            return None
+
+    def summaries(self):
+        summaries = []
+        for profile_id in self.ids():
+            profile = self.get(profile_id)
+            if profile is not None:
+                summaries.append(
+                    {field: profile[field] for field in self.SUMMARY_FIELDS}
+                )
+        return summaries
+
+
+def get_profile_store():
+    return ProfileStore(
+        settings.PROFILING_DIR, settings.PROFILING_MAX_PROFILES
+    )
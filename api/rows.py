@@ -0,0 +1,259 @@
+"""
+Serialization of read-only list endpoints straight from database rows.
+
+A RowSerializer gives the exact representation its ModelSerializer
+would, from values_list() rows of only the columns it needs: no model
+instance and no serializer field is made per row, each output field is
+taken from its column by an accessor compiled once per request.
+"""
+
+import decimal
+import re
+from functools import partial
+
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .models import OrderItem
+from .serializer import (
+    BookListSerializer,
+    CategoryListSerializer,
+    ImageVariantField,
+    OrderItemSerializer,
+    OrderSerializer,
+)
+from .timing import timed_serialization
+
+# Fields whose to_representation() returns a column's value unchanged;
+# StringRelatedField columns must look up what __str__() returns
+UNCHANGED_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.StringRelatedField,
+)
+
+# A path, not "//host...", of characters iri_to_uri() leaves as they are
+PLAIN_PATH = re.compile(r"/(?!/)[A-Za-z0-9\-._~/#%\[\]=:;$&()+,!?*@']*")
+
+
+def absolute_url_builder(request):
+    """
+    request.build_absolute_uri(), without parsing the URL when it's a
+    path made only of characters iri_to_uri() keeps: the scheme and host
+    are then simply prepended. None when there is no request.
+    """
+    if request is None:
+        return None
+    build_absolute_uri = request.build_absolute_uri
+    plain_path = PLAIN_PATH.fullmatch
+    origin = None
+
+    def absolute_url(url):
+        nonlocal origin
+        if plain_path(url) and "/./" not in url and "/../" not in url:
+            if origin is None:
+                # Only now: it validates the Host header
+                origin = build_absolute_uri("/")[:-1]
+            return origin + url
+        return build_absolute_uri(url)
+
+    return absolute_url
+
+
+def file_accessor(field, model_field, absolute_url):
+    """
+    FileField.to_representation() for a file name column.
+    """
+    if not getattr(field, "use_url", api_settings.UPLOADED_FILES_USE_URL):
+        return lambda name: name or None
+    url = model_field.storage.url
+    if absolute_url is None:
+        return lambda name: url(name) if name else None
+    return lambda name: absolute_url(url(name)) if name else None
+
+
+def decimal_accessor(field):
+    """
+    DecimalField.to_representation() for a decimal column, with the
+    quantization context built once instead of for every value.
+    """
+    coerce_to_string = getattr(
+        field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING
+    )
+    if (
+        not coerce_to_string
+        or field.decimal_places is None
+        or field.normalize_output
+        or field.localize
+    ):
+        return field.to_representation
+    quantum = decimal.Decimal(".1") ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+    return lambda value: format(
+        value.quantize(quantum, rounding=rounding, context=context), "f"
+    )
+
+
+class RowSerializer:
+    """
+    The representation ``serializer_class`` gives model instances, for
+    the rows of ``rows(queryset)``.
+
+    ``columns`` are (field name, values() lookup), in the order of the
+    serializer's fields; ``extra_lookups`` are fetched as well but not
+    output (what pagination or nested rows need).
+    """
+
+    serializer_class = None
+    columns = ()
+    extra_lookups = ()
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        fields = self.serializer_class(context=self.context).fields
+        model = self.serializer_class.Meta.model
+        self.absolute_url = absolute_url_builder(self.context.get("request"))
+        self.lookups = tuple(lookup for _, lookup in self.columns) + tuple(
+            self.extra_lookups
+        )
+        # (name, index in the row, accessor or None when unchanged)
+        self.accessors = tuple(
+            (name, index, self.compile(fields[name], model))
+            for index, (name, _) in enumerate(self.columns)
+        )
+
+    def compile(self, field, model):
+        if isinstance(field, serializers.FileField):
+            model_field = model._meta.get_field(field.source)
+            return file_accessor(field, model_field, self.absolute_url)
+        if isinstance(field, ImageVariantField):
+            return partial(field.urls, absolute_url=self.absolute_url)
+        if isinstance(field, serializers.DecimalField):
+            return decimal_accessor(field)
+        if isinstance(field, UNCHANGED_FIELDS):
+            return None
+        return field.to_representation
+
+    def rows(self, queryset):
+        """
+        The queryset as named rows of the columns to serialize.
+        """
+        return queryset.values_list(*self.lookups, named=True)
+
+    def to_representation(self, row):
+        # Like Serializer.to_representation(), null stays null
+        return {
+            name: (
+                row[index]
+                if accessor is None
+                else None if (value := row[index]) is None else accessor(value)
+            )
+            for name, index, accessor in self.accessors
+        }
+
+    def serialize(self, rows):
+        with timed_serialization():
+            to_representation = self.to_representation
+            return [to_representation(row) for row in rows]
+
+    async def aserialize(self, rows):
+        """
+        serialize() for async views, ``rows`` already fetched.
+        """
+        return self.serialize(rows)
+
+
+class BookListRowSerializer(RowSerializer):
+    serializer_class = BookListSerializer
+    columns = (
+        ("title", "title"),
+        ("image", "image"),
+        ("thumbnail", "image_variants"),
+        ("price", "price"),
+        ("author", "author"),
+    )
+    # KeysetPagination's cursor
+    extra_lookups = ("created", "id")
+
+
+class CategoryListRowSerializer(RowSerializer):
+    serializer_class = CategoryListSerializer
+    columns = (("name", "name"),)
+
+
+class OrderItemRowSerializer(RowSerializer):
+    serializer_class = OrderItemSerializer
+    columns = (
+        ("book", "book__title"),
+        ("quantity", "quantity"),
+        ("unit_price", "unit_price"),
+    )
+    extra_lookups = ("order_id",)
+
+    def for_orders(self, order_ids):
+        """
+        The items of the orders, in one query like the prefetch of
+        orders_with_items().
+        """
+        return self.rows(OrderItem.objects.filter(order_id__in=order_ids))
+
+
+class OrderRowSerializer(RowSerializer):
+    serializer_class = OrderSerializer
+    columns = (
+        ("buyer", "buyer__email"),
+        ("total_price", "total_price"),
+        ("ordered_at", "ordered_at"),
+    )
+    extra_lookups = ("id",)
+
+    def __init__(self, context=None):
+        super().__init__(context)
+        self.items = OrderItemRowSerializer(self.context)
+
+    def serialize(self, rows):
+        rows = list(rows)
+        items = self.items.for_orders([row.id for row in rows])
+        return self.with_items(rows, list(items))
+
+    async def aserialize(self, rows):
+        items = self.items.for_orders([row.id for row in rows])
+        return self.with_items(rows, [item async for item in items])
+
+    def with_items(self, rows, items):
+        with timed_serialization():
+            by_order = {row.id: [] for row in rows}
+            to_representation = self.items.to_representation
+            for item in items:
+                by_order[item.order_id].append(to_representation(item))
+            orders = []
+            for row in rows:
+                order = self.to_representation(row)
+                order["order_items"] = by_order[row.id]
+                orders.append(order)
+            return orders
+
+
+class RowListMixin:
+    """
+    ListModelMixin.list() with the page serialized by
+    ``row_serializer_class`` from rows of the filtered queryset.
+    """
+
+    row_serializer_class = None
+
+    def get_row_serializer(self):
+        return self.row_serializer_class(self.get_serializer_context())
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_row_serializer()
+        rows = serializer.rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(rows))
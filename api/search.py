@@ -0,0 +1,78 @@
+import re
+
+from django.db import connections
+from rest_framework import filters
+
+from .models import Book
+
+FTS_TABLE = "api_book_fts"
+
+# bm25() column weights, in the column order of the FTS table:
+# title, description, category, author.
+FTS_WEIGHTS = (10.0, 1.0, 2.0, 5.0)
+
+_fts_aliases = set()  # database aliases where the FTS table was found
+
+
+def fts_available(using="default"):
+    """
+    Return True if the FTS5 book index exists on the given database.
+    """
+    if using in _fts_aliases:
+        return True
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [FTS_TABLE],
+        )
+        found = cursor.fetchone() is not None
+    if found:
+        _fts_aliases.add(using)
+    return found
+
+
+def build_match_query(search):
+    """
+    Turn free text into an FTS5 MATCH expression.
+
+    Every word is quoted (so user input can't inject FTS syntax) and
+    prefix matched, and all words must match, like SearchFilter does.
+    """
+    terms = re.findall(r"\w+", search)
+    return " ".join('"%s"*' % term for term in terms)
+
+
+def search_books(queryset, match):
+    """
+    Restrict a Book queryset to the FTS matches, best (BM25) first.
+    """
+    weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f"{FTS_TABLE}.rowid = {Book._meta.db_table}.id",
+            f"{FTS_TABLE} MATCH %s",
+        ],
+        params=[match],
+        select={"search_rank": f"bm25({FTS_TABLE}, {weights})"},
+        order_by=["search_rank", "id"],
+    )
+
+
+class BookSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter backed by the FTS5 index when the database has one.
+
+    Falls back to the regular icontains search on other backends, or
+    when the search text has no indexable words in it.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search = request.query_params.get(self.search_param, "")
+        match = build_match_query(search)
+        if not match or not fts_available(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+        return search_books(queryset, match)
@@ -0,0 +1,511 @@
+import itertools
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.crypto import RANDOM_STRING_CHARS
+from faker import Faker
+
+from .models import (
+    Book,
+    Cart,
+    CartItem,
+    Category,
+    Order,
+    OrderItem,
+    User,
+    bulk_updated,
+    category_key,
+)
+from .search import FTS_TABLE, fts_available
+
+# Generated data ends here rather than now, so a seed always gives the
+# same rows
+SEED_END = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+SEED_SPAN = timedelta(days=730)
+# Rows per task handed to a worker, and per insert transaction
+SEED_CHUNK_SIZE = 10_000
+# The k-th most popular book (seller, category, buyer) is 1 / k ** skew
+# as likely to be picked as the most popular one
+POPULARITY_SKEW = 1.0
+
+# Columns written for each model, in the order the generator yields them
+COLUMNS = {
+    Category: ("id", "name", "key", "created", "updated_at"),
+    User: (
+        "id",
+        "password",
+        "last_login",
+        "is_superuser",
+        "first_name",
+        "last_name",
+        "is_staff",
+        "is_active",
+        "date_joined",
+        "created",
+        "updated_at",
+        "phone_number",
+        "address",
+        "email",
+        "user_type",
+    ),
+    Book: (
+        "id",
+        "title",
+        "author",
+        "seller",
+        "category",
+        "price",
+        "image",
+        "image_variants",
+        "description",
+        "is_available",
+        "created",
+        "updated_at",
+    ),
+    Cart: ("id", "buyer", "created", "updated_at"),
+    CartItem: (
+        "cart",
+        "book",
+        "quantity",
+        "is_active",
+        "created",
+        "updated_at",
+    ),
+    Order: (
+        "id",
+        "buyer",
+        "total_price",
+        "ordered_at",
+        "created",
+        "updated_at",
+    ),
+    OrderItem: (
+        "order",
+        "book",
+        "quantity",
+        "unit_price",
+        "created",
+        "updated_at",
+    ),
+}
+
+
+def password_salt(seed, length=22):
+    """
+    Salt of the password hash every user gets, derived from the seed so
+    that a seed always gives the same rows. As long as the salts Django
+    makes (128 bits), or logins would rehash the passwords.
+    """
+    rng = random.Random(f"{seed}:password")
+    return "".join(rng.choice(RANDOM_STRING_CHARS) for _ in range(length))
+
+
+class SeedPlan:
+    """
+    What to generate: how many of each, the random seed, the first id of
+    each table and the password hash every user gets (hashing one per
+    user would take hours). Picklable, it's what the workers start from.
+    """
+
+    def __init__(
+        self,
+        books,
+        buyers,
+        sellers,
+        categories,
+        carts,
+        orders,
+        seed,
+        password_hash,
+        first_ids,
+        category_keys=(),
+    ):
+        self.books = books
+        self.buyers = buyers
+        self.sellers = sellers
+        self.categories = categories
+        self.carts = min(carts, buyers)
+        self.orders = orders
+        self.seed = seed
+        self.password_hash = password_hash
+        self.first_ids = first_ids
+        # Keys of the categories already there, not to be generated again
+        self.category_keys = frozenset(category_keys)
+
+    @classmethod
+    def for_database(cls, password_hash, **counts):
+        """
+        A plan adding to the rows already in the database.
+        """
+        first_ids = {
+            model: (model.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+            for model in (Category, User, Book, Cart, Order)
+        }
+        return cls(
+            password_hash=password_hash,
+            first_ids=first_ids,
+            category_keys=Category.objects.exclude(key=None).values_list(
+                "key", flat=True
+            ),
+            **counts,
+        )
+
+    def tasks(self, kind, total, chunk_size):
+        return [
+            (kind, start, min(start + chunk_size, total))
+            for start in range(0, total, chunk_size)
+        ]
+
+
+class Popularity:
+    """
+    Draws indexes of range(n), skewed like real popularity (see
+    POPULARITY_SKEW). Which indexes are the popular ones is shuffled.
+    """
+
+    def __init__(self, n, rng, skew=POPULARITY_SKEW):
+        self.ranked = list(range(n))
+        rng.shuffle(self.ranked)
+        self.cum_weights = list(
+            itertools.accumulate(1 / rank**skew for rank in range(1, n + 1))
+        )
+
+    def draw(self, rng, k=1):
+        return rng.choices(self.ranked, cum_weights=self.cum_weights, k=k)
+
+
+def timestamp(moment):
+    """
+    A datetime as naive UTC text: what Django stores on SQLite, and what
+    the other backends read in the UTC session time zone Django sets.
+    """
+    return (
+        moment.astimezone(dt_timezone.utc).replace(tzinfo=None).isoformat(" ")
+    )
+
+
+def money(cents):
+    return f"{cents // 100}.{cents % 100:02d}"
+
+
+class Generator:
+    """
+    The rows of a plan, a chunk at a time. Words and names are drawn once
+    from Faker, the library behind api.factories, and recombined per
+    row, which is far faster than asking Faker for each value. Each chunk
+    has its own random stream, so the rows don't depend on the number of
+    workers or the order chunks are made in.
+    """
+
+    def __init__(self, plan):
+        self.plan = plan
+        faker = Faker()
+        faker.seed_instance(plan.seed)
+        self.words = sorted(set(faker.words(5000)))
+        self.first_names = sorted({faker.first_name() for _ in range(500)})
+        self.last_names = sorted({faker.last_name() for _ in range(1000)})
+
+        rng = random.Random(plan.seed)
+        # Book prices, in cents, mostly between 5 and 40
+        self.prices = [
+            min(int(rng.lognormvariate(7.3, 0.6)) // 10 * 10 + 99, 999_999)
+            for _ in range(1024)
+        ]
+        self.book_popularity = Popularity(plan.books, rng)
+        self.seller_popularity = Popularity(plan.sellers, rng)
+        self.category_popularity = Popularity(plan.categories, rng)
+        self.buyer_popularity = Popularity(plan.buyers, rng)
+        self.authors = max(1, plan.books // 20)
+        self.author_popularity = Popularity(self.authors, rng)
+
+    def generate(self, kind, start, end):
+        """
+        {model: rows} for rows ``start`` to ``end`` of ``kind``.
+        """
+        rng = random.Random(f"{self.plan.seed}:{kind}:{start}")
+        return getattr(self, f"generate_{kind}")(rng, start, end)
+
+    def first_id(self, model):
+        return self.plan.first_ids[model]
+
+    def book_price(self, book_index):
+        # A function of the book alone, so orders can price their items
+        return self.prices[(book_index * 2654435761 + self.plan.seed) % 1024]
+
+    def random_moment(self, rng, after=SEED_END - SEED_SPAN):
+        return after + (SEED_END - after) * rng.random()
+
+    def sentence(self, rng, low, high):
+        words = rng.choices(self.words, k=rng.randint(low, high))
+        return " ".join(words).capitalize() + "."
+
+    def generate_categories(self, rng, start, end):
+        rows, keys = [], set(self.plan.category_keys)
+        for index in range(start, end):
+            name = rng.choice(self.words).title()
+            while category_key(name) in keys:
+                name = f"{name} {rng.choice(self.words)}"
+            keys.add(category_key(name))
+            moment = timestamp(self.random_moment(rng))
+            row = (self.first_id(Category) + index, name)
+            rows.append(row + (category_key(name), moment, moment))
+        return {Category: rows}
+
+    def generate_users(self, rng, start, end):
+        rows = []
+        for index in range(start, end):
+            user_id = self.first_id(User) + index
+            first = rng.choice(self.first_names)
+            last = rng.choice(self.last_names)
+            joined = timestamp(self.random_moment(rng))
+            rows.append(
+                (
+                    user_id,
+                    self.plan.password_hash,
+                    None,
+                    False,
+                    first,
+                    last,
+                    False,
+                    True,
+                    joined,
+                    joined,
+                    joined,
+                    None,
+                    None,
+                    f"{first}.{last}.{user_id}@example.com".lower(),
+                    "seller" if index < self.plan.sellers else "buyer",
+                )
+            )
+        return {User: rows}
+
+    def generate_books(self, rng, start, end):
+        rows = []
+        span = SEED_SPAN / self.plan.books
+        first_seller = self.first_id(User)
+        for index in range(start, end):
+            # Newer books have higher ids, like in a real catalog
+            created = SEED_END - SEED_SPAN + span * (index + rng.random())
+            updated = min(
+                created + timedelta(days=rng.expovariate(1 / 7)), SEED_END
+            )
+            (author,) = self.author_popularity.draw(rng)
+            (seller,) = self.seller_popularity.draw(rng)
+            (category,) = self.category_popularity.draw(rng)
+            title = " ".join(rng.choices(self.words, k=rng.randint(1, 5)))
+            rows.append(
+                (
+                    self.first_id(Book) + index,
+                    title.title()[:100],
+                    (
+                        f"{self.first_names[author % len(self.first_names)]} "
+                        f"{self.last_names[author % len(self.last_names)]}"
+                    )[:50],
+                    first_seller + seller,
+                    self.first_id(Category) + category,
+                    money(self.book_price(index)),
+                    "",
+                    None,
+                    self.sentence(rng, 8, 40),
+                    rng.random() < 0.95,
+                    timestamp(created),
+                    timestamp(updated),
+                )
+            )
+        return {Book: rows}
+
+    def buyer_id(self, buyer_index):
+        return self.first_id(User) + self.plan.sellers + buyer_index
+
+    def generate_carts(self, rng, start, end):
+        carts, items = [], []
+        for index in range(start, end):
+            cart_id = self.first_id(Cart) + index
+            moment = timestamp(self.random_moment(rng))
+            carts.append((cart_id, self.buyer_id(index), moment, moment))
+            books = set(self.book_popularity.draw(rng, rng.randint(1, 5)))
+            for book in sorted(books):
+                items.append(
+                    (
+                        cart_id,
+                        self.first_id(Book) + book,
+                        rng.choice((1, 1, 1, 2, 3)),
+                        True,
+                        moment,
+                        moment,
+                    )
+                )
+        return {Cart: carts, CartItem: items}
+
+    def generate_orders(self, rng, start, end):
+        orders, items = [], []
+        for index in range(start, end):
+            order_id = self.first_id(Order) + index
+            moment = timestamp(self.random_moment(rng))
+            (buyer,) = self.buyer_popularity.draw(rng)
+            books = set(self.book_popularity.draw(rng, rng.randint(1, 4)))
+            total = 0
+            for book in sorted(books):
+                quantity = rng.choice((1, 1, 1, 2, 3))
+                price = self.book_price(book)
+                total += price * quantity
+                items.append(
+                    (
+                        order_id,
+                        self.first_id(Book) + book,
+                        quantity,
+                        money(price),
+                        moment,
+                        moment,
+                    )
+                )
+            orders.append(
+                (
+                    order_id,
+                    self.buyer_id(buyer),
+                    money(total),
+                    moment,
+                    moment,
+                    moment,
+                )
+            )
+        return {Order: orders, OrderItem: items}
+
+
+def insert_rows(model, rows):
+    """
+    Insert generated rows with one executemany(). Several times faster
+    than bulk_create(), which builds a model instance per row and, on
+    SQLite, one statement per 83 rows.
+    """
+    meta = model._meta
+    quote = connection.ops.quote_name
+    columns = ", ".join(
+        quote(meta.get_field(name).column) for name in COLUMNS[model]
+    )
+    placeholders = ", ".join(["%s"] * len(COLUMNS[model]))
+    sql = (
+        f"INSERT INTO {quote(meta.db_table)} ({columns}) "
+        f"VALUES ({placeholders})"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+@contextmanager
+def fts_indexed_in_bulk(rows):
+    """
+    Index the books of ``rows`` in the FTS table with one INSERT ...
+    SELECT instead of the per-row insert trigger, which makes seeding
+    books about five times slower. Run it inside a transaction: SQLite
+    DDL is transactional, so no other connection sees the trigger gone.
+    """
+    if not rows or not fts_available(connection.alias):
+        yield
+        return
+    trigger = f"{FTS_TABLE}_ai"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' "
+            "AND name = %s",
+            [trigger],
+        )
+        (create_trigger,) = cursor.fetchone()
+        cursor.execute(f"DROP TRIGGER {trigger}")
+        yield
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} "
+            "(rowid, title, description, category, author) "
+            "SELECT book.id, book.title, book.description, category.name, "
+            "book.author FROM api_book book "
+            "LEFT JOIN api_category category "
+            "ON category.id = book.category_id "
+            "WHERE book.id BETWEEN %s AND %s",
+            [rows[0][0], rows[-1][0]],
+        )
+        cursor.execute(create_trigger)
+
+
+# The Generator of a worker process
+_generator = None
+
+
+def _start_worker(plan):
+    global _generator
+    _generator = Generator(plan)
+
+
+def _generate(task):
+    return _generator.generate(*task)
+
+
+def bounded_map(executor, function, tasks, window):
+    """
+    executor.map() with at most ``window`` tasks in flight, so workers
+    can't get far ahead of the inserts and pile rows up in memory.
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(function, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def seed(plan, workers=1, chunk_size=SEED_CHUNK_SIZE, progress=None):
+    """
+    Insert the rows of ``plan``, generated in ``workers`` processes.
+    ``progress(kind, rows)`` is called after each kind is inserted.
+    """
+    kinds = [
+        ("categories", plan.categories),
+        ("users", plan.sellers + plan.buyers),
+        ("books", plan.books),
+        ("carts", plan.carts),
+        ("orders", plan.orders),
+    ]
+    executor = generator = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=_start_worker, initargs=(plan,)
+        )
+    else:
+        generator = Generator(plan)
+
+    def generate(tasks):
+        if executor is not None:
+            return bounded_map(executor, _generate, tasks, 2 * workers)
+        return (generator.generate(*task) for task in tasks)
+
+    try:
+        for kind, total in kinds:
+            # Categories are one chunk, their names must all differ
+            size = total if kind == "categories" else chunk_size
+            for chunk in generate(plan.tasks(kind, total, max(size, 1))):
+                with transaction.atomic(), fts_indexed_in_bulk(
+                    chunk.get(Book)
+                ):
+                    for model, rows in chunk.items():
+                        insert_rows(model, rows)
+            if progress is not None:
+                progress(kind, total)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Explicit ids don't advance sequences (PostgreSQL, Oracle)
+    models = list(COLUMNS)
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    # The rows bypassed the ORM, invalidate what they'd have invalidated
+    for model in models:
+        bulk_updated.send(sender=model)
@@ -1,5 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from django.db import transaction
+from django.db.models import Prefetch, Q, prefetch_related_objects
+from .categories import get_category
+from .images import IMAGE_FORMATS, variant_url
+from .timing import TimedSerializerMixin
 from .models import (
     Book,
     Category,
@@ -12,13 +17,15 @@ from .models import (
 )
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ("first_name",)
 
 
-class UserRegistrationSerializer(serializers.ModelSerializer):
+class UserRegistrationSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     user_type = serializers.ChoiceField(
         choices=USER_TYPE_CHOICES, default="buyer"
     )
@@ -46,11 +53,11 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             )
         return data
 
-    def create(self, validated_data):
-        validated_data.pop(
-            "confirm_password"
-        )  # Remove confirm_password before creating the user
-        user = User(
+    def build_user(self, validated_data):
+        """
+        The unsaved user, without a password yet.
+        """
+        return User(
             email=validated_data["email"],
             first_name=validated_data["first_name"],
             last_name=validated_data["last_name"],
@@ -58,6 +65,12 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
                 "user_type", "buyer"
             ),  # Default to 'buyer'
         )
+
+    def create(self, validated_data):
+        validated_data.pop(
+            "confirm_password"
+        )  # Remove confirm_password before creating the user
+        user = self.build_user(validated_data)
         user.set_password(validated_data["password"])  # Hash the password
         user.save()
         return user
@@ -83,29 +96,70 @@ class LoginSerializer(serializers.Serializer):
         return attrs
 
 
-class BookListSerializer(serializers.ModelSerializer):
+class ImageVariantField(serializers.Field):
+    """
+    URLs of one derivative of Book.image by extension, null until the
+    derivatives are generated.
+    """
+
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        kwargs["source"] = "image_variants"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, variants):
+        request = self.context.get("request")
+        if request is None:
+            return self.urls(variants)
+        return self.urls(variants, request.build_absolute_uri)
+
+    def urls(self, variants, absolute_url=None):
+        """
+        The variant's URL by extension, passed through ``absolute_url``
+        when given.
+        """
+        urls = {}
+        for extension, _ in IMAGE_FORMATS.values():
+            url = variant_url(variants, self.variant, extension)
+            if url is not None and absolute_url is not None:
+                url = absolute_url(url)
+            urls[extension] = url
+        return urls
+
+
+class BookListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    thumbnail = ImageVariantField("thumbnail")
+
     class Meta:
         model = Book
-        fields = ("title", "image", "price", "author")
+        fields = ("title", "image", "thumbnail", "price", "author")
 
 
-class CategoryListSerializer(serializers.ModelSerializer):
+class CategoryListSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     class Meta:
         model = Category
         fields = ("name",)
 
 
-class CategoryDetailSerializer(serializers.ModelSerializer):
-    books = BookListSerializer(many=True, read_only=True)
+class CategoryDetailSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
+    # The view sets book_page to one page of the category's books
+    books = BookListSerializer(many=True, read_only=True, source="book_page")
 
     class Meta:
         model = Category
         fields = ("name", "books")  # or specify fields explicitly
 
 
-class BookDetailSerializer(serializers.ModelSerializer):
+class BookDetailSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     category = serializers.StringRelatedField()
     seller = UserSerializer(read_only=True)
+    detail_image = ImageVariantField("detail")
+    thumbnail = ImageVariantField("thumbnail")
 
     class Meta:
         model = Book
@@ -113,6 +167,8 @@ class BookDetailSerializer(serializers.ModelSerializer):
             "title",
             "author",
             "image",
+            "detail_image",
+            "thumbnail",
             "seller",
             "description",
             "price",
@@ -131,10 +187,7 @@ class BookDetailSerializer(serializers.ModelSerializer):
 
         if category_name:
             # Get or create the category instance
-            category, _ = Category.objects.get_or_create(
-                name__iexact=category_name
-            )
-            self.validated_data["category"] = category
+            self.validated_data["category"] = get_category(category_name)
 
         # Call the parent save method to create or update the instance
         return super().save(**kwargs)
@@ -142,30 +195,78 @@ class BookDetailSerializer(serializers.ModelSerializer):
     # replacing the save method with create and update hence reducing code duplication
 
 
-class CartItemSerializer(serializers.ModelSerializer):
-    book = serializers.CharField()
+def resolve_books(items):
+    """
+    The book each of ``items`` refers to, by "book_id" or else by title
+    under "book", all fetched in one query. A title matches the books
+    whose title contains it, ignoring case, and must match exactly one.
+    """
+    ids = {item["book_id"] for item in items if "book_id" in item}
+    titles = {item["book"] for item in items if "book_id" not in item}
+    lookup = Q(pk__in=ids)
+    for title in titles:
+        lookup |= Q(title__icontains=title)
+    books = list(Book.objects.filter(lookup).only("title"))
+
+    by_id = {book.pk: book for book in books}
+    by_title = {
+        title: [book for book in books if title.lower() in book.title.lower()]
+        for title in titles
+    }
+
+    resolved = []
+    for item in items:
+        if "book_id" in item:
+            book = by_id.get(item["book_id"])
+            if book is None:
+                raise serializers.ValidationError(
+                    {"book_id": f"Book {item['book_id']} does not exist."}
+                )
+        else:
+            matches = by_title[item["book"]]
+            if not matches:
+                raise serializers.ValidationError(
+                    {"book": f"Book '{item['book']}' does not exist."}
+                )
+            if len(matches) > 1:
+                raise serializers.ValidationError(
+                    {
+                        "book": f"Several books match '{item['book']}', "
+                        "use book_id."
+                    }
+                )
+            book = matches[0]
+        resolved.append(book)
+    return resolved
+
+
+class CartItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    book_id = serializers.IntegerField(required=False)
+    book = serializers.CharField(required=False)
 
     class Meta:
         model = CartItem
-        fields = ("book", "quantity")
+        fields = ("book_id", "book", "quantity")
+
+    def validate(self, attrs):
+        if self.instance is None and not (
+            "book_id" in attrs or attrs.get("book")
+        ):
+            raise serializers.ValidationError(
+                {"book_id": "Give a book_id or a book title."}
+            )
+        return attrs
 
     def update(self, instance, validated_data):
-        book_title = validated_data.pop("book", None)
-        if book_title:
-            try:
-                book_instance = Book.objects.get(title__icontains=book_title)
-                instance.book = book_instance
-            except Book.DoesNotExist:
-                raise serializers.ValidationError(
-                    {"book": "Book does not exist."}
-                )
+        if "book_id" in validated_data or validated_data.get("book"):
+            (instance.book,) = resolve_books([validated_data])
 
         instance.quantity = validated_data.get("quantity", instance.quantity)
         instance.save()
         return instance
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True)
     buyer = serializers.StringRelatedField()
 
@@ -173,34 +274,54 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = ("buyer", "items")
 
+    def validate_items(self, items):
+        books = resolve_books(items)
+        return [
+            {"book": book, "quantity": item["quantity"]}
+            for item, book in zip(items, books)
+        ]
+
     def create(self, validated_data):
         items_data = validated_data.pop("items")
-        # Extract the items data
-        buyer = validated_data["buyer"]
 
-        cart, created = Cart.objects.get_or_create(
-            **validated_data
-        )  # Create the cart instance
-
-        # Now create CartItem instances for each item
+        # One line per book, repeated books add up
+        quantities = {}
         for item_data in items_data:
-            book_title = item_data.pop("book")  # Extract book title
-            try:
-                book_instance = Book.objects.get(
-                    title__icontains=book_title
-                )  # Look up the book by title
-            except Book.DoesNotExist:
-                raise serializers.ValidationError(
-                    {"book": f"Book '{book_title}' does not exist."}
-                )
+            book_id = item_data["book"].pk
+            quantities[book_id] = (
+                quantities.get(book_id, 0) + item_data["quantity"]
+            )
 
-            # Create CartItem and associate it with the newly created cart
-            CartItem.objects.create(cart=cart, book=book_instance, **item_data)
+        with transaction.atomic():
+            cart, created = Cart.objects.get_or_create(**validated_data)
+            existing = []
+            if not created:
+                existing = list(
+                    cart.items.select_for_update().filter(
+                        book_id__in=quantities
+                    )
+                )
+                for item in existing:
+                    item.quantity += quantities.pop(item.book_id, 0)
+                CartItem.objects.bulk_update(existing, ["quantity"])
+            CartItem.objects.bulk_create(
+                [
+                    CartItem(cart=cart, book_id=book_id, quantity=quantity)
+                    for book_id, quantity in quantities.items()
+                ]
+            )
 
+        # The response lists the items, with their books
+        prefetch_related_objects(
+            [cart],
+            Prefetch(
+                "items", queryset=CartItem.objects.select_related("book")
+            ),
+        )
         return cart
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     book = serializers.StringRelatedField()
 
     class Meta:
@@ -209,12 +330,10 @@ class OrderItemSerializer(serializers.ModelSerializer):
         read_only = "unit_price"
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     order_items = OrderItemSerializer(many=True)
     buyer = serializers.StringRelatedField()
 
     class Meta:
         model = Order
         fields = ("buyer", "total_price", "ordered_at", "order_items")
-
-
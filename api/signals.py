@@ -0,0 +1,122 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import images
+from .authentication import invalidate_all_tokens, invalidate_tokens
+from .cache import bump_versions
+from .metrics import count_query
+from .profiling import record_query
+from .slow_queries import log_slow_queries
+from .models import Book, Category, User, bulk_updated
+from .storage import release, retain
+from .timing import time_query
+
+
+@receiver([post_save, post_delete], sender=Book)
+def invalidate_book_responses(sender, instance, **kwargs):
+    bump_versions("books", f"book:{instance.pk}")
+
+
+@receiver(post_save, sender=Book)
+def generate_image_variants(sender, instance, raw, **kwargs):
+    if not raw and images.needs_variants(instance):
+        transaction.on_commit(lambda: images.schedule_variants(instance))
+
+
+@receiver(pre_save, sender=Book)
+def remember_book_blobs(sender, instance, raw, update_fields, **kwargs):
+    # None means the references can't change in this save
+    instance._stored_blobs = None
+    if raw:
+        return
+    if update_fields is not None and not (
+        {"image", "image_variants"} & set(update_fields)
+    ):
+        return
+    row = (
+        Book.objects.filter(pk=instance.pk)
+        .values_list("image", "image_variants")
+        .first()
+        if instance.pk is not None
+        else None
+    )
+    instance._stored_blobs = images.book_blobs(*row) if row else []
+
+
+@receiver(post_save, sender=Book)
+def count_book_blobs(sender, instance, **kwargs):
+    if instance._stored_blobs is None:
+        return
+    previous = Counter(instance._stored_blobs)
+    current = Counter(
+        images.book_blobs(instance.image.name, instance.image_variants)
+    )
+    retain((current - previous).elements())
+    release((previous - current).elements())
+
+
+@receiver(post_delete, sender=Book)
+def release_book_blobs(sender, instance, **kwargs):
+    release(images.book_blobs(instance.image.name, instance.image_variants))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_responses(sender, instance, **kwargs):
+    bump_versions("categories", f"category:{instance.pk}")
+
+
+@receiver(bulk_updated, sender=Book)
+def invalidate_bulk_book_responses(sender, **kwargs):
+    bump_versions("books", "books:bulk")
+
+
+@receiver(bulk_updated, sender=Category)
+def invalidate_bulk_category_responses(sender, **kwargs):
+    bump_versions("categories", "categories:bulk")
+
+
+@receiver(post_save, sender=User)
+def invalidate_seller_responses(sender, instance, created, raw, **kwargs):
+    # Book details embed their seller; buyers show up in no response
+    if created or raw:
+        return
+    if Book.objects.filter(seller=instance).exists():
+        bump_versions("sellers")
+
+
+@receiver(bulk_updated, sender=User)
+def invalidate_bulk_seller_responses(sender, **kwargs):
+    bump_versions("sellers")
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, raw, **kwargs):
+    if created or raw:
+        return
+    keys = Token.objects.filter(user=instance).values_list("key", flat=True)
+    if keys:
+        invalidate_tokens(*keys)
+
+
+@receiver(bulk_updated, sender=User)
+def invalidate_bulk_user_tokens(sender, **kwargs):
+    # Which users changed isn't known: drop every cached token
+    invalidate_all_tokens()
+
+
+@receiver(connection_created)
+def install_execute_wrappers(sender, connection, **kwargs):
+    # First: execute_wrapper() blocks pop the last wrapper when they end
+    for wrapper in (log_slow_queries, count_query, time_query, record_query):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, wrapper)
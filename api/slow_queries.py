@@ -0,0 +1,286 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Set while EXPLAINing, so the EXPLAIN itself is never looked at
+_explaining = ContextVar("explaining_slow_query", default=False)
+
+# Fingerprints kept per process, the ones with the least total time go
+MAX_FINGERPRINTS = 1000
+# Seconds between two saves of a process's stats to its file
+FLUSH_INTERVAL = 10
+# Project frames kept from the stack of a slow query, innermost first
+STACK_DEPTH = 5
+# Modules whose frames are never where a query comes from: they hold the
+# execute wrappers
+WRAPPER_MODULES = (
+    "api/metrics.py",
+    "api/profiling.py",
+    "api/slow_queries.py",
+    "api/timing.py",
+)
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDERS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+VALUES = re.compile(r"VALUES\s*\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+", re.I)
+WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """
+    (fingerprint, normalized SQL): the same for every run of a query,
+    whatever its parameters and however many values are in its IN lists.
+    """
+    normalized = STRING.sub("?", sql)
+    normalized = normalized.replace("%s", "?")
+    normalized = NUMBER.sub("?", normalized)
+    normalized = PLACEHOLDERS.sub("(...)", normalized)
+    normalized = VALUES.sub("VALUES (...)", normalized)
+    normalized = WHITESPACE.sub(" ", normalized).strip()
+    digest = hashlib.sha1(normalized.encode()).hexdigest()[:16]
+    return digest, normalized
+
+
+def project_stack():
+    """
+    The innermost frames of the current stack in project code, as
+    "path:line in function", innermost first.
+    """
+    base = f"{settings.BASE_DIR}{os.sep}"
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None and len(frames) < STACK_DEPTH:
+        filename = frame.f_code.co_filename
+        if (
+            filename.startswith(base)
+            and "site-packages" not in filename
+            and not filename.endswith(WRAPPER_MODULES)
+        ):
+            frames.append(
+                f"{filename[len(base):]}:{frame.f_lineno} "
+                f"in {frame.f_code.co_name}"
+            )
+        frame = frame.f_back
+    return frames
+
+
+def explaining():
+    """
+    Whether the query being run is the EXPLAIN of a slow query: the
+    other execute wrappers leave it out of the request's queries.
+    """
+    return _explaining.get()
+
+
+def explain(connection, sql, params):
+    """
+    The query plan of a SELECT, None for other statements or when the
+    database can't explain it.
+    """
+    words = sql.split(None, 1)
+    if not words or words[0].upper() not in ("SELECT", "WITH"):
+        return None
+    token = _explaining.set(True)
+    try:
+        # In a savepoint: a failed EXPLAIN mustn't break the transaction
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"{connection.ops.explain_query_prefix()} {sql}", params
+                )
+                rows = cursor.fetchall()
+    except DatabaseError:
+        return None
+    finally:
+        _explaining.reset(token)
+    if connection.vendor == "sqlite":
+        # (id, parent, notused, detail)
+        return "\n".join(row[-1] for row in rows)
+    return "\n".join(" ".join(str(column) for column in row) for row in rows)
+
+
+class SlowQueryStats:
+    """
+    Slow queries of this process per fingerprint: how many, their total
+    and maximum time, and the slowest one's SQL, origin and plan. Kept
+    in memory and saved to a file of its own in SLOW_QUERY_DIR at most
+    every FLUSH_INTERVAL seconds and at exit, for manage.py slow_queries
+    to add up with the other processes'.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = None
+        self._path = None
+        self._dirty = False
+        self._flushed = time.monotonic()
+
+    def _load(self):
+        directory = str(settings.SLOW_QUERY_DIR)
+        path = os.path.join(directory, f"slow_queries_{os.getpid()}.json")
+        if path != self._path:
+            self._flush()
+            os.makedirs(directory, exist_ok=True)
+            self._path = path
+            # A file left by a process with the same pid is added to
+            self._entries = read_stats_file(path)
+
+    def record(self, query):
+        with self._lock:
+            self._load()
+            entry = self._entries.get(query["fingerprint"])
+            if entry is None:
+                if len(self._entries) >= MAX_FINGERPRINTS:
+                    # Before adding the new one, or it would be the one
+                    # to go: its total is a single query's
+                    least = min(
+                        self._entries.values(), key=lambda e: e["total_ms"]
+                    )
+                    del self._entries[least["fingerprint"]]
+                entry = self._entries[query["fingerprint"]] = {
+                    "fingerprint": query["fingerprint"],
+                    "normalized": query["normalized"],
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                }
+            entry["count"] += 1
+            entry["total_ms"] += query["ms"]
+            entry["last_seen"] = query["at"]
+            if query["ms"] >= entry["max_ms"]:
+                entry["max_ms"] = query["ms"]
+                entry.update(
+                    sql=query["sql"],
+                    stack=query["stack"],
+                    plan=query["plan"],
+                )
+            self._dirty = True
+            if time.monotonic() - self._flushed >= FLUSH_INTERVAL:
+                self._flush()
+
+    def flush(self):
+        """
+        Save the stats recorded since the last save.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._dirty:
+            return
+        temporary = f"{self._path}.tmp"
+        try:
+            with open(temporary, "w") as stream:
+                json.dump(self._entries, stream)
+            os.replace(temporary, self._path)
+        except FileNotFoundError:
+            # SLOW_QUERY_DIR was removed, which resets the stats
+            self._entries = self._path = None
+        except OSError:
+            logger.exception(
+                "Could not save the slow queries to %s", self._path
+            )
+        self._dirty = False
+        self._flushed = time.monotonic()
+
+
+def read_stats_file(path):
+    try:
+        with open(path) as stream:
+            return json.load(stream)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+stats = SlowQueryStats()
+atexit.register(stats.flush)
+
+
+def collect():
+    """
+    Every process's slow queries, added up per fingerprint.
+    """
+    # This process's latest ones too
+    stats.flush()
+    totals = {}
+    directory = str(settings.SLOW_QUERY_DIR)
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return totals
+    for name in names:
+        if not (name.startswith("slow_queries_") and name.endswith(".json")):
+            continue
+        for key, entry in read_stats_file(
+            os.path.join(directory, name)
+        ).items():
+            total = totals.get(key)
+            if total is None:
+                totals[key] = dict(entry)
+                continue
+            total["count"] += entry["count"]
+            total["total_ms"] += entry["total_ms"]
+            total["last_seen"] = max(total["last_seen"], entry["last_seen"])
+            if entry["max_ms"] > total["max_ms"]:
+                total.update(
+                    {
+                        field: entry[field]
+                        for field in ("max_ms", "sql", "stack", "plan")
+                    }
+                )
+    return totals
+
+
+def log_slow_queries(execute, sql, params, many, context):
+    """
+    Database execute wrapper logging the queries slower than
+    SLOW_QUERY_THRESHOLD_MS, installed on every connection (see
+    api/signals.py).
+    """
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    if threshold is None or _explaining.get():
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    elapsed = (time.perf_counter() - start) * 1000
+    if elapsed >= threshold:
+        record_slow_query(context["connection"], sql, params, many, elapsed)
+    return result
+
+
+def record_slow_query(connection, sql, params, many, elapsed):
+    digest, normalized = fingerprint(sql)
+    query = {
+        "fingerprint": digest,
+        "normalized": normalized,
+        "sql": sql,
+        "ms": round(elapsed, 3),
+        "at": timezone.now().isoformat(),
+        "stack": project_stack(),
+        "plan": None if many else explain(connection, sql, params),
+    }
+    origin = query["stack"][0] if query["stack"] else "unknown"
+    logger.warning(
+        "Slow query (%.1f ms, %s) from %s: %s\n%s",
+        elapsed,
+        digest,
+        origin,
+        normalized,
+        query["plan"] or "(no plan)",
+        extra={"slow_query": query},
+    )
+    stats.record(query)
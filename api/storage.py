@@ -0,0 +1,208 @@
+import hashlib
+import os
+import posixpath
+import uuid
+from collections import Counter
+from datetime import timedelta
+from urllib.parse import urljoin
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.encoding import filepath_to_uri
+
+from .models import Blob
+
+# Unreferenced blobs younger than this are kept, see Blob.released_at
+BLOB_GC_GRACE = timedelta(hours=1)
+BLOB_GC_BATCH_SIZE = 500
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each distinct file once, named after the SHA-256 of its
+    content under the top directory of the name it's saved as (the
+    field's upload_to): ``media/3f/a2/3fa2…9c.jpg``.
+    Saving content that is already stored returns the existing name, and
+    since a name's content never changes, its URL can be cached forever.
+
+    Files are never deleted by their users: references are counted on
+    Blob rows (retain()/release()) and collect_garbage() deletes the
+    unreferenced ones.
+    """
+
+    # base_url -> whether urljoin() just appends plain paths to it
+    _plain_base_urls = {}
+
+    def get_available_name(self, name, max_length=None):
+        # _save() picks the name, and taking an existing one is the point
+        return name
+
+    def url(self, name):
+        """
+        FileSystemStorage.url() without its urljoin(), which is slow and
+        only appends names like the ones this storage makes to base_url.
+        List endpoints build several URLs per row.
+        """
+        base_url = self.base_url
+        path = filepath_to_uri(name) if name is not None else None
+        if path and base_url is not None:
+            path = path.lstrip("/")
+            segments = path.split("/")
+            plain = self._plain_base_urls.get(base_url)
+            if plain is None:
+                plain = urljoin(base_url, "x") == base_url + "x"
+                self._plain_base_urls[base_url] = plain
+            # urljoin() would resolve "." and ".." and drop empty segments
+            if plain and not {"", ".", ".."}.intersection(segments):
+                return base_url + path
+        return super().url(name)
+
+    def _save(self, name, content):
+        directory = name.split("/")[0] if "/" in name else ""
+        extension = os.path.splitext(name)[1].lower()
+
+        # Hash while streaming to a temporary file next to the final
+        # location, so it can be moved there atomically
+        os.makedirs(self.location, exist_ok=True)
+        temporary = os.path.join(self.location, f".upload-{uuid.uuid4().hex}")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            fd = os.open(
+                temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666
+            )
+            with os.fdopen(fd, "wb") as stream:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    stream.write(chunk)
+                    size += len(chunk)
+
+            hexdigest = digest.hexdigest()
+            name = posixpath.join(
+                directory, hexdigest[:2], hexdigest[2:4], hexdigest + extension
+            )
+            path = self.path(name)
+            # Under the blob's row lock, which collect_garbage() deletes
+            # files with: an existing file can't go before it's reused
+            with transaction.atomic():
+                register(name, size)
+                if os.path.exists(path):
+                    os.remove(temporary)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(temporary, self.file_permissions_mode)
+                    os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
+
+
+def register(name, size):
+    """
+    Record a stored blob, and lock its row until the end of the
+    transaction. A new one starts unreferenced, so it is collected if
+    nothing retains it within the grace period; an unreferenced existing
+    one gets a new grace period.
+    """
+    blob, created = Blob.objects.select_for_update().get_or_create(
+        name=name, defaults={"size": size}
+    )
+    if not created and blob.refcount <= 0:
+        # A write, which waits for a collection holding the lock (SQLite
+        # has no row locks) and finds no row when it deleted this one
+        rows = Blob.objects.filter(name=name).update(
+            released_at=timezone.now()
+        )
+        if not rows:
+            Blob.objects.create(name=name, size=size)
+
+
+def retain(names):
+    """
+    Add a reference to each of the blobs ``names`` (repeats count).
+    """
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    # Files stored before refcounting have no row yet
+    Blob.objects.bulk_create(
+        [Blob(name=name) for name in counts], ignore_conflicts=True
+    )
+    for count, group in group_by_count(counts):
+        Blob.objects.filter(name__in=group).update(
+            refcount=F("refcount") + count, released_at=None
+        )
+
+
+def release(names):
+    """
+    Drop a reference to each of the blobs ``names`` (repeats count).
+    """
+    counts = Counter(name for name in names if name)
+    now = timezone.now()
+    for count, group in group_by_count(counts):
+        Blob.objects.filter(name__in=group).update(
+            refcount=F("refcount") - count, released_at=now
+        )
+
+
+def group_by_count(counts):
+    groups = {}
+    for name, count in counts.items():
+        groups.setdefault(count, []).append(name)
+    return groups.items()
+
+
+def collect_garbage(
+    storage, grace=BLOB_GC_GRACE, batch_size=BLOB_GC_BATCH_SIZE
+):
+    """
+    Delete the blobs unreferenced for longer than ``grace``, a batch at a
+    time, and return how many were deleted.
+    """
+    cutoff = timezone.now() - grace
+    garbage = Blob.objects.filter(refcount__lte=0, released_at__lt=cutoff)
+    deleted = 0
+    while True:
+        names = list(
+            garbage.order_by("released_at").values_list("name", flat=True)[
+                :batch_size
+            ]
+        )
+        if not names:
+            break
+        with transaction.atomic():
+            # Whatever was retained since is no longer garbage
+            locked = list(
+                garbage.select_for_update()
+                .filter(name__in=names)
+                .values_list("name", flat=True)
+            )
+            Blob.objects.filter(name__in=locked).delete()
+            # Still under the locks, which _save() takes before reusing
+            # a file: content saved again meanwhile is written anew
+            for name in locked:
+                storage.delete(name)
+        deleted += len(locked)
+        # A full batch may be followed by more, even if some of it was
+        # retained in between
+        if len(names) < batch_size:
+            break
+    return deleted
+
+
+def rebuild_refcounts(references):
+    """
+    Recount the references to every blob from ``references``, an iterable
+    of blob names, e.g. after adopting storage that was already in use.
+    """
+    counts = Counter(name for name in references if name)
+    with transaction.atomic():
+        Blob.objects.filter(refcount__gt=0).update(released_at=timezone.now())
+        Blob.objects.update(refcount=0)
+        retain(counts.elements())
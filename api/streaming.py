@@ -0,0 +1,120 @@
+import csv
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+# Rows fetched from the database and serialized per round trip
+STREAM_CHUNK_SIZE = 500
+
+# Same output as DRF's JSONRenderer with its default settings
+json_encoder = JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def iter_batches(queryset, batch_size=STREAM_CHUNK_SIZE):
+    """
+    Yield lists of at most ``batch_size`` objects from a server-side
+    iterator, so the full queryset is never held in memory.
+    """
+    batch = []
+    for obj in queryset.iterator(chunk_size=batch_size):
+        batch.append(obj)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def aiter_batches(queryset, batch_size=STREAM_CHUNK_SIZE):
+    """
+    iter_batches() over the async ORM.
+    """
+    batch = []
+    async for obj in queryset.aiterator(chunk_size=batch_size):
+        batch.append(obj)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def json_object_head(fields, list_key):
+    """
+    The start of ``{**fields, list_key: [``, up to the list itself.
+    """
+    head = json_encoder.encode(fields)[:-1]
+    separator = "," if fields else ""
+    return head + separator + json_encoder.encode(list_key) + ":"
+
+
+def iter_json_list(queryset, serializer_class, context):
+    """
+    Yield the JSON array of ``serializer_class`` representations of the
+    queryset, one batch at a time.
+    """
+    yield "["
+    first = True
+    for batch in iter_batches(queryset):
+        for item in serializer_class(batch, many=True, context=context).data:
+            yield ("" if first else ",") + json_encoder.encode(item)
+            first = False
+    yield "]"
+
+
+def stream_json_object(fields, list_key, queryset, serializer_class, context):
+    """
+    StreamingHttpResponse for ``{**fields, list_key: [...]}`` where the
+    list is streamed from the queryset.
+    """
+
+    def content():
+        yield json_object_head(fields, list_key)
+        yield from iter_json_list(queryset, serializer_class, context)
+        yield "}"
+
+    return StreamingHttpResponse(content(), content_type="application/json")
+
+
+def astream_json_object(fields, list_key, queryset, serializer_class, context):
+    """
+    stream_json_object() for async views: the rows come from the async
+    ORM, so the response is streamed without blocking the event loop.
+    """
+
+    async def content():
+        yield json_object_head(fields, list_key)
+        yield "["
+        first = True
+        async for batch in aiter_batches(queryset):
+            serializer = serializer_class(batch, many=True, context=context)
+            for item in serializer.data:
+                yield ("" if first else ",") + json_encoder.encode(item)
+                first = False
+        yield "]}"
+
+    return StreamingHttpResponse(content(), content_type="application/json")
+
+
+class Echo:
+    """
+    File-like object for csv.writer that hands back what is written.
+    """
+
+    def write(self, value):
+        return value
+
+
+def ndjson_chunk(rows):
+    """
+    Newline-delimited JSON for a batch of dict ``rows``.
+    """
+    return "".join(json_encoder.encode(row) + "\n" for row in rows)
+
+
+def csv_chunk(rows):
+    """
+    CSV lines for a batch of sequence ``rows``.
+    """
+    writer = csv.writer(Echo())
+    return "".join(writer.writerow(row) for row in rows)
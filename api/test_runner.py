@@ -0,0 +1,41 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    The test runner of manage.py test: what the processes write to disk
+    goes to a temporary directory instead of the project's, and only the
+    tests asking for it log slow queries (their EXPLAINs would add to the
+    queries of the others).
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._directory = tempfile.TemporaryDirectory()
+        directory = self._directory.name
+        caches = {
+            alias: (
+                {**cache, "LOCATION": os.path.join(directory, alias)}
+                if cache["BACKEND"] == "api.cache.SharedFileCache"
+                else cache
+            )
+            for alias, cache in settings.CACHES.items()
+        }
+        self._settings = override_settings(
+            CACHES=caches,
+            METRICS_DIR=os.path.join(directory, "metrics"),
+            PROFILING_DIR=os.path.join(directory, "profiles"),
+            SLOW_QUERY_DIR=os.path.join(directory, "slow_queries"),
+            SLOW_QUERY_THRESHOLD_MS=None,
+        )
+        self._settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._settings.disable()
+        self._directory.cleanup()
+        super().teardown_test_environment(**kwargs)
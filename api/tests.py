@@ -1,20 +1,81 @@
 # tests.py
-from django.test import TestCase
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+import warnings
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.paginator import UnorderedObjectListWarning
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
 from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
 from .models import User
-from .serializer import UserRegistrationSerializer
+from .serializer import BookDetailSerializer, UserRegistrationSerializer
+from .serializer import (
+    BookListSerializer,
+    CategoryListSerializer,
+    OrderSerializer,
+)
 from rest_framework.test import APITestCase, APIRequestFactory, APIClient
 from django.urls import reverse
-from .models import User, Book, Cart, CartItem, Order, Category
+from .models import User, Book, Cart, CartItem, Order, OrderItem, Category
+from .models import Blob
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import get_user_model
 from rest_framework import status
-from .views import CartListView, CheckoutView
+from .views import CartListView, CheckoutView, orders_with_items
+from .pagination import KeysetPagination
+from .cache import (
+    get_cache,
+    get_stats,
+    get_version_cache,
+    get_versions,
+    version_key,
+)
+from .storage import collect_garbage, retain
+from .authentication import get_generation, get_token_cache, token_cache_key
+from . import hashing, images, media
+from .categories import category_cache, get_category
+from .hashing import HashingPool, HashingPoolBusy
+from .async_views import AsyncBookListView, AsyncLoginView
+from .benchmarks import ApiBenchmark, percentile, route_names, run_scenario
+from .rows import BookListRowSerializer, absolute_url_builder
+from .search import fts_available
+from .seeding import Generator, SeedPlan
+from .timing import RequestTimer
+from .metrics import MetricsFile, RequestMetrics, metrics
+from .profiling import make_token, profiler_slot
+from . import slow_queries
+from .slow_queries import SlowQueryStats, fingerprint
 from api.factories import (
     UserFactory,
     OrderFactory,
+    OrderItemFactory,
     CategoryFactory,
     BookFactory,
+    CartFactory,
+    CartItemFactory,
 )
 
 
@@ -411,3 +472,2481 @@ class CategoryViewTests(APITestCase):
         # Check if the 'books' field contains the correct books
         self.assertEqual(len(response.data["books"]), 1)
         self.assertEqual(response.data["books"][0]["title"], self.book1.title)
+
+
+class BookSearchTests(APITestCase):
+    def setUp(self):
+        self.fantasy = CategoryFactory(name="Fantasy")
+        self.wizard_book = BookFactory(
+            title="Wizards of the North",
+            author="Ann Leckie",
+            description="A quiet story.",
+            category=self.fantasy,
+        )
+        self.mention_book = BookFactory(
+            title="Gardening",
+            author="Tom Reed",
+            description="No wizards were harmed writing this.",
+            category=CategoryFactory(name="Home"),
+        )
+        self.url = reverse("book-list")
+
+    def search(self, term):
+        response = self.client.get(self.url, {"search": term})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book["title"] for book in response.data["results"]]
+
+    def test_search_prefix_match(self):
+        self.assertEqual(
+            self.search("wiz"), [self.wizard_book.title, "Gardening"]
+        )
+        self.assertEqual(self.search("leck"), [self.wizard_book.title])
+
+    def test_search_all_terms_must_match(self):
+        self.assertEqual(self.search("wizards harmed"), ["Gardening"])
+
+    def test_search_ranks_title_matches_first(self):
+        titles = self.search("wizards")
+        self.assertEqual(titles[0], self.wizard_book.title)
+
+    def test_search_keeps_its_ranking_with_a_cursor(self):
+        response = self.client.get(
+            self.url, {"search": "wizards", "cursor": ""}
+        )
+        titles = [book["title"] for book in response.data["results"]]
+        self.assertEqual(titles, self.search("wizards"))
+        self.assertEqual(titles[0], self.wizard_book.title)
+
+    def test_search_follows_category_writes(self):
+        self.assertEqual(self.search("fantasy"), [self.wizard_book.title])
+
+        self.fantasy.name = "Speculative"
+        self.fantasy.save()
+        self.assertEqual(self.search("fantasy"), [])
+        self.assertEqual(self.search("specul"), [self.wizard_book.title])
+
+        self.wizard_book.delete()
+        self.assertEqual(self.search("specul"), [])
+
+    def test_search_ignores_fts_syntax(self):
+        self.assertEqual(self.search('wiz" OR *'), [])
+
+
+class BookKeysetPaginationTests(APITestCase):
+    def setUp(self):
+        seller = UserFactory(user_type="seller")
+        category = CategoryFactory()
+        now = timezone.now()
+        self.books = [
+            # Pairs of books share a timestamp so ties are exercised
+            BookFactory(
+                seller=seller,
+                category=category,
+                created=now - timedelta(minutes=index // 2),
+            )
+            for index in range(12)
+        ]
+        self.url = reverse("book-list")
+
+    def test_cursor_pages_walk_whole_catalog(self):
+        expected = [
+            book.title
+            for book in sorted(
+                self.books, key=lambda b: (b.created, b.id), reverse=True
+            )
+        ]
+        titles = []
+        url = self.url + "?cursor="
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data["results"]), 5)
+            self.assertNotIn("count", response.data)
+            titles += [book["title"] for book in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(titles, expected)
+
+    def test_page_numbers_walk_whole_catalog_in_the_same_order(self):
+        keyset_titles = []
+        url = self.url + "?cursor="
+        while url:
+            response = self.client.get(url)
+            keyset_titles += [
+                book["title"] for book in response.data["results"]
+            ]
+            url = response.data["next"]
+
+        titles = []
+        url = self.url
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", UnorderedObjectListWarning)
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                titles += [book["title"] for book in response.data["results"]]
+                url = response.data["next"]
+        self.assertEqual(titles, keyset_titles)
+
+    def test_previous_link_returns_previous_page(self):
+        first = self.client.get(self.url, {"cursor": ""}).data
+        second = self.client.get(first["next"]).data
+        self.assertIsNone(first["previous"])
+        back = self.client.get(second["previous"]).data
+        self.assertEqual(back["results"], first["results"])
+
+    def test_deep_pages_cost_the_same(self):
+        response = self.client.get(self.url, {"cursor": "", "page_size": 2})
+        for _ in range(4):
+            # The page only: the ETag comes from the cache versions
+            with self.assertNumQueries(1):
+                response = self.client.get(response.data["next"])
+
+    def test_page_size_limits_carry_over(self):
+        response = self.client.get(self.url, {"cursor": "", "page_size": 100})
+        self.assertEqual(len(response.data["results"]), 12)
+
+        get_cache().clear()  # Same URL, so it would be served from cache
+        with mock.patch.object(KeysetPagination, "max_page_size", 3):
+            response = self.client.get(
+                self.url, {"cursor": "", "page_size": 100}
+            )
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_count_modes(self):
+        response = self.client.get(self.url, {"cursor": "", "count": "exact"})
+        self.assertEqual(response.data["count"], 12)
+        self.assertFalse(response.data["count_is_estimate"])
+
+        response = self.client.get(
+            self.url, {"cursor": "", "count": "estimate"}
+        )
+        self.assertEqual(response.data["count"], 12)
+        self.assertTrue(response.data["count_is_estimate"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_numbers_still_default(self):
+        response = self.client.get(self.url, {"page": 2})
+        self.assertEqual(response.data["count"], 12)
+        self.assertEqual(len(response.data["results"]), 5)
+
+
+class CheckoutQueryCountTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("checkout")
+        self.seller = UserFactory(user_type="seller")
+        self.category = CategoryFactory()
+
+    def checkout_queries(self, item_count):
+        buyer = UserFactory()
+        cart = Cart.objects.create(buyer=buyer)
+        for book in BookFactory.create_batch(
+            item_count, seller=self.seller, category=self.category
+        ):
+            CartItem.objects.create(cart=cart, book=book, quantity=2)
+        self.client.force_authenticate(user=buyer)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        order = Order.objects.get(pk=response.data["order_id"])
+        self.assertEqual(order.order_items.count(), item_count)
+        self.assertEqual(order.total_price, response.data["total_price"])
+        self.assertFalse(CartItem.objects.filter(cart_id=cart.id).exists())
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        self.assertEqual(self.checkout_queries(1), self.checkout_queries(30))
+
+    def test_failed_checkout_leaves_cart_untouched(self):
+        buyer = UserFactory()
+        cart = Cart.objects.create(buyer=buyer)
+        book = BookFactory(seller=self.seller, category=self.category)
+        CartItem.objects.create(cart=cart, book=book, quantity=1)
+        self.client.force_authenticate(user=buyer)
+
+        with mock.patch.object(
+            OrderItem.objects, "bulk_create", side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                self.client.post(self.url)
+
+        self.assertFalse(Order.objects.filter(buyer=buyer).exists())
+        self.assertEqual(cart.items.count(), 1)
+
+
+class CartCreateTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("cart")
+        self.buyer = UserFactory()
+        self.seller = UserFactory(user_type="seller")
+        self.category = CategoryFactory()
+        self.client.force_authenticate(user=self.buyer)
+
+    def seed_books(self, count):
+        return BookFactory.create_batch(
+            count, seller=self.seller, category=self.category
+        )
+
+    def create_queries(self, item_count):
+        buyer = UserFactory()
+        self.client.force_authenticate(user=buyer)
+        books = self.seed_books(item_count)
+        items = [{"book_id": book.pk, "quantity": 1} for book in books]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                self.url, {"items": items}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["items"]), item_count)
+        self.assertEqual(
+            CartItem.objects.filter(cart__buyer=buyer).count(), item_count
+        )
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_item_count(self):
+        self.assertEqual(self.create_queries(2), self.create_queries(20))
+
+    def test_duplicate_lines_are_merged(self):
+        first, second = self.seed_books(2)
+        items = [
+            {"book_id": first.pk, "quantity": 1},
+            {"book": second.title.upper(), "quantity": 2},
+            {"book_id": first.pk, "quantity": 3},
+        ]
+        response = self.client.post(self.url, {"items": items}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        quantities = dict(
+            CartItem.objects.filter(cart__buyer=self.buyer).values_list(
+                "book_id", "quantity"
+            )
+        )
+        self.assertEqual(quantities, {first.pk: 4, second.pk: 2})
+
+    def test_existing_lines_are_added_to(self):
+        book, other = self.seed_books(2)
+        cart = Cart.objects.create(buyer=self.buyer)
+        CartItem.objects.create(cart=cart, book=book, quantity=1)
+        items = [
+            {"book_id": book.pk, "quantity": 2},
+            {"book_id": other.pk, "quantity": 1},
+        ]
+        response = self.client.post(self.url, {"items": items}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            dict(cart.items.values_list("book_id", "quantity")),
+            {book.pk: 3, other.pk: 1},
+        )
+
+    def test_unknown_and_ambiguous_books(self):
+        book = self.seed_books(1)[0]
+        BookFactory(title="Twice", seller=self.seller, category=self.category)
+        BookFactory(title="twice", seller=self.seller, category=self.category)
+        for item in (
+            {"book_id": book.pk + 1000, "quantity": 1},
+            {"book": "No such book", "quantity": 1},
+            {"book": "Twice", "quantity": 1},
+            {"quantity": 1},
+        ):
+            response = self.client.post(
+                self.url, {"items": [item]}, format="json"
+            )
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST, item
+            )
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_titles_match_part_of_the_title(self):
+        book = BookFactory(
+            title="The Left Hand of Darkness",
+            seller=self.seller,
+            category=self.category,
+        )
+        items = [{"book": "hand of dark", "quantity": 1}]
+        response = self.client.post(self.url, {"items": items}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            list(CartItem.objects.values_list("book_id", flat=True)),
+            [book.pk],
+        )
+
+        BookFactory(
+            title="Hand of Fate", seller=self.seller, category=self.category
+        )
+        items = [{"book": "hand of", "quantity": 1}]
+        response = self.client.post(self.url, {"items": items}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_update_item_by_book_id(self):
+        book, other = self.seed_books(2)
+        cart = Cart.objects.create(buyer=self.buyer)
+        item = CartItem.objects.create(cart=cart, book=book, quantity=1)
+        response = self.client.patch(
+            reverse("cart-update", kwargs={"pk": item.pk}),
+            {"book_id": other.pk, "quantity": 5},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        item.refresh_from_db()
+        self.assertEqual((item.book_id, item.quantity), (other.pk, 5))
+
+
+# Maximum number of queries each endpoint may run, whatever the data size
+QUERY_BUDGETS = {
+    "book-list": 3,
+    "book-detail": 2,
+    "category-list": 1,
+    "category-detail": 3,
+    "cart": 2,
+    "order_list": 2,
+    "order_confirmation": 2,
+}
+
+
+class QueryBudgetMixin:
+    """
+    Assert that an endpoint stays within its query budget while the data
+    behind it grows. ``seed(n)`` is called before each request and should
+    add ``n`` more rows for the endpoint to return.
+    """
+
+    budget_sizes = (1, 5, 15)
+
+    def assertQueryBudget(self, url_name, seed, **url_kwargs):
+        budget = QUERY_BUDGETS[url_name]
+        url = reverse(url_name, kwargs=url_kwargs or None)
+        for size in self.budget_sizes:
+            seed(size)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(
+                len(queries),
+                budget,
+                f"{url_name} ran {len(queries)} queries after seeding "
+                f"{size} more rows (budget {budget}):\n"
+                + "\n".join(query["sql"] for query in queries),
+            )
+
+
+class QueryBudgetTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.buyer = UserFactory()
+        self.seller = UserFactory(user_type="seller")
+        self.category = CategoryFactory()
+        self.client.force_authenticate(user=self.buyer)
+
+    def seed_books(self, count):
+        return BookFactory.create_batch(
+            count, seller=self.seller, category=self.category
+        )
+
+    def seed_orders(self, count):
+        books = self.seed_books(3)
+        for order in OrderFactory.create_batch(count, buyer=self.buyer):
+            for book in books:
+                OrderItemFactory(order=order, book=book)
+
+    def test_book_list(self):
+        self.assertQueryBudget("book-list", self.seed_books)
+
+    def test_book_detail(self):
+        book = self.seed_books(1)[0]
+        self.assertQueryBudget("book-detail", self.seed_books, pk=book.pk)
+
+    def test_category_list(self):
+        self.assertQueryBudget("category-list", CategoryFactory.create_batch)
+
+    def test_category_detail(self):
+        self.assertQueryBudget(
+            "category-detail", self.seed_books, pk=self.category.pk
+        )
+
+    def test_cart(self):
+        cart = CartFactory(buyer=self.buyer)
+
+        def seed(count):
+            for book in self.seed_books(count):
+                CartItemFactory(cart=cart, book=book)
+
+        self.assertQueryBudget("cart", seed)
+
+    def test_order_list(self):
+        self.assertQueryBudget("order_list", self.seed_orders)
+
+    def test_order_detail(self):
+        order = OrderFactory(buyer=self.buyer)
+
+        def seed(count):
+            for book in self.seed_books(count):
+                OrderItemFactory(order=order, book=book)
+
+        self.assertQueryBudget(
+            "order_confirmation", seed, order_id=order.pk
+        )
+
+
+def explain(sql):
+    """
+    SQLite's EXPLAIN QUERY PLAN details for a statement.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+@skipUnless(connection.vendor == "sqlite", "Reads SQLite query plans")
+class QueryPlanTests(APITestCase):
+    """
+    EXPLAIN every query the hot endpoints run on seeded data, and fail
+    when one reads a whole table, or sorts rows that an index should
+    return in order.
+    """
+
+    # Steps reading a table, or an index, from start to end: any SCAN
+    # but of a virtual table with constraints (an FTS MATCH)
+    FULL_SCAN = re.compile(r"^SCAN (?!\S+ VIRTUAL TABLE INDEX \d+:\S)")
+    # An index read in order, stopped by the LIMIT when the query has one
+    INDEX_SCAN = re.compile(r"^SCAN \S+ USING (COVERING )?INDEX \S+$")
+
+    def setUp(self):
+        self.buyer = UserFactory()
+        self.seller = UserFactory(user_type="seller")
+        self.categories = CategoryFactory.create_batch(3)
+        self.books = []
+        for category in self.categories:
+            self.books += BookFactory.create_batch(
+                10, seller=self.seller, category=category
+            )
+        for buyer in [self.buyer, *UserFactory.create_batch(3)]:
+            for order in OrderFactory.create_batch(3, buyer=buyer):
+                for book in self.books[:3]:
+                    OrderItemFactory(order=order, book=book)
+            cart = CartFactory(buyer=buyer)
+            for book in self.books[:3]:
+                CartItemFactory(cart=cart, book=book)
+        self.client.force_authenticate(user=self.buyer)
+
+    def query_plans(self, method, url, data=None):
+        """
+        (sql, plan) of each query a request runs.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format="json")
+        self.assertLess(response.status_code, 400)
+        return [
+            (query["sql"], explain(query["sql"]))
+            for query in queries
+            if query["sql"].startswith(("SELECT", "UPDATE", "DELETE"))
+            # The FTS table lookup, once per process
+            and "sqlite_master" not in query["sql"]
+        ]
+
+    def assertNoFullScans(self, plans):
+        for sql, plan in plans:
+            ordered = (
+                " ORDER BY " in sql
+                and " LIMIT " in sql
+                and "USE TEMP B-TREE FOR ORDER BY" not in plan
+            )
+            scans = [
+                step
+                for step in plan
+                if self.FULL_SCAN.match(step)
+                and not (ordered and self.INDEX_SCAN.match(step))
+            ]
+            self.assertFalse(scans, f"{sql}\n" + "\n".join(plan))
+
+    def assertOrderedByIndex(self, plans, order_by):
+        ordered = [(sql, plan) for sql, plan in plans if order_by in sql]
+        self.assertTrue(ordered, f"No query orders by {order_by}")
+        for sql, plan in ordered:
+            self.assertNotIn(
+                "USE TEMP B-TREE FOR ORDER BY",
+                plan,
+                f"{sql}\n" + "\n".join(plan),
+            )
+
+    def test_book_list(self):
+        plans = self.query_plans("get", reverse("book-list"), {"cursor": ""})
+        self.assertNoFullScans(plans)
+        self.assertOrderedByIndex(plans, 'ORDER BY "api_book"."created" DESC')
+
+    def test_book_search(self):
+        plans = self.query_plans("get", reverse("book-list"), {"search": "a"})
+        self.assertNoFullScans(plans)
+
+    def test_book_detail(self):
+        url = reverse("book-detail", kwargs={"pk": self.books[0].pk})
+        self.assertNoFullScans(self.query_plans("get", url))
+
+    def test_category_detail(self):
+        url = reverse("category-detail", kwargs={"pk": self.categories[1].pk})
+        plans = self.query_plans("get", url)
+        self.assertNoFullScans(plans)
+        self.assertOrderedByIndex(plans, 'ORDER BY "api_book"."created" DESC')
+
+    def test_cart(self):
+        self.assertNoFullScans(self.query_plans("get", reverse("cart")))
+
+    def test_add_to_cart(self):
+        items = [{"book_id": book.pk, "quantity": 1} for book in self.books]
+        plans = self.query_plans("post", reverse("cart"), {"items": items})
+        self.assertNoFullScans(plans)
+
+    def test_checkout(self):
+        self.assertNoFullScans(self.query_plans("post", reverse("checkout")))
+
+    def test_order_list(self):
+        plans = self.query_plans("get", reverse("order_list"))
+        self.assertNoFullScans(plans)
+        self.assertOrderedByIndex(
+            plans, 'ORDER BY "api_order"."ordered_at" ASC'
+        )
+
+    def test_garbage_collection(self):
+        for index in range(20):
+            Blob.objects.create(name=f"media/{index}.jpg", refcount=index % 2)
+        with CaptureQueriesContext(connection) as queries:
+            collect_garbage(mock.Mock(), grace=timedelta(0))
+        plans = [
+            (query["sql"], explain(query["sql"]))
+            for query in queries
+            if query["sql"].startswith(("SELECT", "DELETE"))
+        ]
+        self.assertNoFullScans(plans)
+        self.assertOrderedByIndex(
+            plans, 'ORDER BY "api_blob"."released_at" ASC'
+        )
+
+
+class CategoryDetailPaginationTests(APITestCase):
+    def setUp(self):
+        self.category = CategoryFactory()
+        seller = UserFactory(user_type="seller")
+        self.books = BookFactory.create_batch(
+            7, category=self.category, seller=seller
+        )
+        BookFactory(seller=seller)  # In another category
+        self.url = reverse("category-detail", args=[self.category.id])
+
+    def test_books_are_paginated(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["name"], self.category.name)
+        self.assertEqual(len(response.data["books"]), 5)
+        self.assertIsNone(response.data["previous"])
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["books"]), 2)
+        self.assertIsNone(response.data["next"])
+
+    def test_stream_returns_every_book(self):
+        response = self.client.get(self.url, {"stream": "true"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(data["name"], self.category.name)
+        self.assertEqual(
+            sorted(book["title"] for book in data["books"]),
+            sorted(book.title for book in self.books),
+        )
+
+
+class CatalogCacheTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        cache_stats = get_stats("catalog")
+        cache_stats.reset()
+        self.cache_stats = cache_stats
+        self.user = UserFactory()
+        self.category = CategoryFactory(name="Poetry")
+        self.book = BookFactory(category=self.category, title="Odes")
+
+    def test_repeat_reads_are_served_from_cache(self):
+        url = reverse("category-list")
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.data, [{"name": "Poetry"}])
+        self.assertEqual(
+            self.cache_stats.as_dict(),
+            {"hits": 1, "misses": 1, "evictions": 0},
+        )
+
+    def test_query_params_are_part_of_the_key(self):
+        url = reverse("book-list")
+        self.client.get(url, {"page_size": 1})
+        response = self.client.get(url, {"page_size": 2})
+        self.assertEqual(response["X-Cache"], "MISS")
+
+    def test_book_write_invalidates_book_responses(self):
+        detail_url = reverse("book-detail", args=[self.book.pk])
+        self.client.force_authenticate(user=self.user)
+        self.client.get(detail_url)
+        self.client.get(reverse("book-list"))
+
+        self.book.title = "Sonnets"
+        self.book.save()
+
+        response = self.client.get(detail_url)
+        self.assertEqual(response.data["title"], "Sonnets")
+        response = self.client.get(reverse("book-list"))
+        self.assertEqual(response.data["results"][0]["title"], "Sonnets")
+
+    def test_unrelated_book_write_keeps_detail_cached(self):
+        detail_url = reverse("book-detail", args=[self.book.pk])
+        self.client.force_authenticate(user=self.user)
+        self.client.get(detail_url)
+
+        BookFactory(category=self.category, seller=self.book.seller)
+
+        self.assertEqual(self.client.get(detail_url)["X-Cache"], "HIT")
+
+    def test_seller_write_invalidates_book_details(self):
+        detail_url = reverse("book-detail", args=[self.book.pk])
+        self.client.force_authenticate(user=self.user)
+        self.client.get(detail_url)
+
+        seller = self.book.seller
+        seller.first_name = "Sappho"
+        seller.save()
+        response = self.client.get(detail_url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["seller"]["first_name"], "Sappho")
+
+        User.objects.filter(pk=seller.pk).update(first_name="Alcaeus")
+        response = self.client.get(detail_url)
+        self.assertEqual(response.data["seller"]["first_name"], "Alcaeus")
+
+    def test_buyer_write_keeps_detail_cached(self):
+        detail_url = reverse("book-detail", args=[self.book.pk])
+        self.client.force_authenticate(user=self.user)
+        self.client.get(detail_url)
+
+        self.user.first_name = "Reader"
+        self.user.save()
+
+        self.assertEqual(self.client.get(detail_url)["X-Cache"], "HIT")
+
+    def test_category_write_invalidates_category_responses(self):
+        url = reverse("category-detail", args=[self.category.pk])
+        self.client.get(url)
+
+        self.category.name = "Verse"
+        self.category.save()
+
+        self.assertEqual(self.client.get(url).data["name"], "Verse")
+
+    def test_responses_cached_before_the_commit_are_invalidated(self):
+        url = reverse("category-detail", args=[self.category.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = "Verse"
+            self.category.save()
+            # Served to another request before the write is committed
+            self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+
+    def test_permissions_checked_before_cache(self):
+        url = reverse("book-detail", args=[self.book.pk])
+        self.client.force_authenticate(user=self.user)
+        self.client.get(url)
+        self.client.force_authenticate(user=None)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_evictions_are_counted(self):
+        with mock.patch.object(get_cache(), "_max_entries", 2):
+            for page_size in range(1, 6):
+                self.client.get(reverse("book-list"), {"page_size": page_size})
+        self.assertGreater(self.cache_stats.as_dict()["evictions"], 0)
+
+    def test_shared_file_cache_counts_evictions_listing_once(self):
+        cache = caches["auth"]
+        before = cache.stats.as_dict()["evictions"]
+        keys = [f"cull-test:{i}" for i in range(4)]
+        with mock.patch.object(cache, "_max_entries", 2), mock.patch.object(
+            cache, "_list_cache_files", wraps=cache._list_cache_files
+        ) as list_files:
+            for key in keys:
+                cache.set(key, 1)
+        cache.delete_many(keys)
+        # FileBasedCache.set() lists the directory once to cull
+        self.assertEqual(list_files.call_count, len(keys))
+        self.assertGreater(cache.stats.as_dict()["evictions"], before)
+
+    def test_versions_are_reused_for_the_ttl(self):
+        (version,) = get_versions(["books"])
+        # Another worker's write
+        get_version_cache().set(version_key("books"), version + 1)
+        with mock.patch.object(get_version_cache(), "get_many") as get_many:
+            self.assertEqual(get_versions(["books"]), [version])
+        get_many.assert_not_called()
+
+        expired = time.monotonic() + settings.CATALOG_VERSION_TTL + 1
+        with mock.patch("api.cache.time.monotonic", return_value=expired):
+            self.assertEqual(get_versions(["books"]), [version + 1])
+
+    def test_stats_endpoint_is_admin_only(self):
+        url = reverse("cache-stats")
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(
+            self.client.get(url).status_code, status.HTTP_403_FORBIDDEN
+        )
+
+        self.client.force_authenticate(user=UserFactory(is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {"catalog", "auth", "categories"})
+        self.assertEqual(
+            set(response.data["catalog"]), {"hits", "misses", "evictions"}
+        )
+
+
+class UpdatedAtTests(TestCase):
+    def setUp(self):
+        self.book = BookFactory()
+        self.stale = timezone.now() - timedelta(days=1)
+        Book.objects.filter(pk=self.book.pk).update(updated_at=self.stale)
+        self.book.refresh_from_db()
+
+    def assertBumped(self):
+        self.book.refresh_from_db()
+        self.assertGreater(self.book.updated_at, self.stale)
+
+    def test_save_bumps_updated_at(self):
+        self.book.save(update_fields=["price"])
+        self.assertBumped()
+
+    def test_serializer_save_bumps_updated_at(self):
+        serializer = BookDetailSerializer(
+            self.book, data={"price": 12}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertBumped()
+
+    def test_queryset_update_bumps_updated_at(self):
+        Book.objects.filter(pk=self.book.pk).update(price=12)
+        self.assertBumped()
+
+    def test_bulk_update_bumps_updated_at(self):
+        self.book.price = 12
+        Book.objects.bulk_update([self.book], ["price"])
+        self.assertBumped()
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.category = CategoryFactory()
+        self.book = BookFactory(category=self.category)
+        self.urls = [
+            reverse("book-detail", args=[self.book.pk]),
+            reverse("book-list"),
+            reverse("category-detail", args=[self.category.pk]),
+        ]
+
+    def test_if_none_match_returns_304_without_building_body(self):
+        # The list's ETag comes from the cache versions, not a query
+        for url, queries in zip(self.urls, [1, 0, 1]):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag = response["ETag"]
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response["ETag"], etag)
+            self.assertNotIn("X-Cache", response)
+
+    def test_if_modified_since_returns_304(self):
+        for url in [self.urls[0], self.urls[2]]:
+            last_modified = self.client.get(url)["Last-Modified"]
+            response = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=last_modified
+            )
+            self.assertEqual(response.status_code, 304, url)
+
+    def test_writes_change_the_etag(self):
+        etags = [self.client.get(url)["ETag"] for url in self.urls]
+
+        self.category.name = "Renamed"
+        self.category.save()
+
+        for url, etag in zip(self.urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+            self.assertNotEqual(response["ETag"], etag)
+
+    def test_bulk_update_changes_etag_and_cached_body(self):
+        url = self.urls[0]
+        etag = self.client.get(url)["ETag"]
+
+        Book.objects.filter(pk=self.book.pk).update(title="Bulk title")
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["title"], "Bulk title")
+
+    def test_cached_list_runs_no_queries(self):
+        url = self.urls[1]
+        self.client.get(url, {"cursor": ""})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {"cursor": ""})
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertNotIn("Last-Modified", response)
+
+    def test_delete_changes_list_etag(self):
+        url = self.urls[1]
+        etag = self.client.get(url)["ETag"]
+        self.book.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        get_token_cache().clear()
+        self.user = UserFactory()
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.url = reverse("order_list")
+
+    def test_token_lookup_is_cached(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        # Only the (empty) order list, no token lookup
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_logout_invalidates_token(self):
+        self.client.get(self.url)
+        response = self.client.post(reverse("user-logout"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_invalidates_token(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_bulk_deactivation_invalidates_token(self):
+        self.client.get(self.url)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_hash_is_not_cached(self):
+        self.client.get(self.url)
+        cache = get_token_cache()
+        entry = cache.get(
+            token_cache_key(self.token.key, get_generation(cache))
+        )
+        self.assertIn(self.user.email, entry["user"])
+        self.assertNotIn(self.user.password, entry["user"])
+
+    def test_user_type_change_is_seen_immediately(self):
+        self.client.get(self.url)
+        self.user.user_type = "seller"
+        self.user.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_invalid_token_is_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Token nope")
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class HashingPoolTests(TestCase):
+    def test_rejects_work_past_max_pending(self):
+        pool = HashingPool(workers=1, max_pending=1)
+        release = threading.Event()
+        first = pool.submit(release.wait)
+        with self.assertRaises(HashingPoolBusy):
+            pool.submit(release.wait)
+        release.set()
+        first.result()
+        self.assertEqual(pool.run(sum, [1, 2]), 3)
+
+    async def test_async_password_hashing_runs_on_pool(self):
+        user = UserFactory.build()
+        with mock.patch.object(
+            hashing.pool, "submit", wraps=hashing.pool.submit
+        ) as submit:
+            await user.aset_password("secret-pass")
+            self.assertTrue(await user.acheck_password("secret-pass"))
+            self.assertFalse(await user.acheck_password("wrong"))
+        self.assertEqual(submit.call_count, 3)
+
+    def test_sync_views_hash_without_the_pool(self):
+        User.objects.create_user(email="busy@example.com", password="pass")
+        with mock.patch.object(
+            hashing.pool, "submit", side_effect=HashingPoolBusy
+        ):
+            response = self.client.post(
+                reverse("user-login"),
+                {"email": "busy@example.com", "password": "pass"},
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class AsyncAuthViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="async@example.com", password="strong_password"
+        )
+
+    async def test_asgi_requests_use_async_views(self):
+        response = await self.async_client.post(
+            reverse("user-login"),
+            {"email": "async@example.com", "password": "strong_password"},
+            content_type="application/json",
+        )
+        self.assertEqual(
+            response.resolver_match.func.view_class, AsyncLoginView
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        token = await Token.objects.aget(user=self.user)
+        self.assertEqual(response.json()["token"], token.key)
+
+    async def test_async_login_invalid_credentials(self):
+        response = await self.async_client.post(
+            reverse("user-login"),
+            {"email": "async@example.com", "password": "wrong_password"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("non_field_errors", response.json())
+
+    async def test_async_login_accepts_form_data(self):
+        response = await self.async_client.post(
+            reverse("user-login"),
+            {"email": "async@example.com", "password": "strong_password"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("token", response.json())
+
+    async def test_async_errors_match_sync_views(self):
+        for body in ["{not json", '{"email": "async@example.com"}']:
+            with self.subTest(body=body):
+                sync_response = await sync_to_async(self.client.post)(
+                    reverse("user-login"),
+                    body,
+                    content_type="application/json",
+                )
+                async_response = await self.async_client.post(
+                    reverse("user-login"),
+                    body,
+                    content_type="application/json",
+                )
+                self.assertEqual(
+                    async_response.status_code, sync_response.status_code
+                )
+                self.assertEqual(async_response.content, sync_response.content)
+
+    async def test_async_register(self):
+        response = await self.async_client.post(
+            reverse("user-register"),
+            {
+                "first_name": "Ada",
+                "last_name": "Lovelace",
+                "email": "ada@example.com",
+                "password": "strong_password",
+                "confirm_password": "strong_password",
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        user = await User.objects.aget(email="ada@example.com")
+        self.assertTrue(await user.acheck_password("strong_password"))
+
+    async def test_async_login_when_pool_busy(self):
+        with mock.patch.object(
+            hashing.pool, "submit", side_effect=HashingPoolBusy
+        ):
+            response = await self.async_client.post(
+                reverse("user-login"),
+                {"email": "async@example.com", "password": "x"},
+                content_type="application/json",
+            )
+        self.assertEqual(
+            response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        self.assertEqual(response["Retry-After"], "1")
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        self.buyer = UserFactory()
+        self.token = Token.objects.create(user=self.buyer)
+        self.seller = UserFactory(user_type="seller")
+        self.category = CategoryFactory()
+        self.books = BookFactory.create_batch(
+            7, seller=self.seller, category=self.category
+        )
+        order = OrderFactory(buyer=self.buyer)
+        OrderItemFactory(order=order, book=self.books[0])
+        self.auth = {"Authorization": f"Token {self.token.key}"}
+
+    async def get_both(self, url, **headers):
+        get_cache().clear()
+        sync_response = await sync_to_async(self.client.get)(
+            url, headers=headers
+        )
+        get_cache().clear()
+        async_response = await self.async_client.get(url, headers=headers)
+        return sync_response, async_response
+
+    async def assertSameResponse(self, url, **headers):
+        sync_response, async_response = await self.get_both(url, **headers)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.content, sync_response.content)
+        self.assertEqual(async_response["Content-Type"], "application/json")
+        return async_response
+
+    async def test_asgi_requests_use_async_views(self):
+        response = await self.async_client.get(reverse("book-list"))
+        self.assertEqual(
+            response.resolver_match.func.view_class, AsyncBookListView
+        )
+
+    async def test_responses_match_sync_views(self):
+        book_url = reverse("book-detail", kwargs={"pk": self.books[0].pk})
+        category_url = reverse(
+            "category-detail", kwargs={"pk": self.category.pk}
+        )
+        for url in [
+            reverse("book-list"),
+            reverse("book-list") + "?search=" + self.books[0].title[:4],
+            reverse("book-list") + "?cursor=&count=exact",
+            reverse("category-list"),
+            category_url,
+            category_url + "?page_size=2",
+        ]:
+            with self.subTest(url=url):
+                await self.assertSameResponse(url)
+        await self.assertSameResponse(book_url, **self.auth)
+        await self.assertSameResponse(reverse("order_list"), **self.auth)
+
+    async def test_errors_match_sync_views(self):
+        response = await self.assertSameResponse(
+            reverse("book-detail", kwargs={"pk": self.books[0].pk})
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response["WWW-Authenticate"], "Token")
+
+        response = await self.assertSameResponse(
+            reverse("order_list"), Authorization="Token invalid"
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = await self.assertSameResponse(
+            reverse("category-detail", kwargs={"pk": 0})
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_cache_and_conditional_get(self):
+        get_cache().clear()
+        url = reverse("book-list")
+        first = await self.async_client.get(url)
+        self.assertEqual(first["X-Cache"], "MISS")
+        second = await self.async_client.get(url)
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(second.content, first.content)
+
+        response = await self.async_client.get(
+            url, headers={"If-None-Match": first["ETag"]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_writes_go_to_the_drf_view(self):
+        token = await Token.objects.acreate(user=self.seller)
+        headers = {"Authorization": f"Token {token.key}"}
+        url = reverse("book-detail", kwargs={"pk": self.books[0].pk})
+        response = await self.async_client.patch(
+            url,
+            {"price": "12.50"},
+            content_type="application/json",
+            headers=headers,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        await self.books[0].arefresh_from_db()
+        self.assertEqual(str(self.books[0].price), "12.50")
+
+        response = await self.async_client.delete(url, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(
+            await Book.objects.filter(pk=self.books[0].pk).aexists()
+        )
+
+        response = await self.async_client.delete(
+            reverse("book-detail", kwargs={"pk": self.books[1].pk}),
+            headers=self.auth,
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_category_stream(self):
+        url = reverse("category-detail", kwargs={"pk": self.category.pk})
+        response = await self.async_client.get(url + "?stream=1")
+        self.assertTrue(response.streaming)
+        content = b"".join(
+            [chunk async for chunk in response.streaming_content]
+        )
+        data = json.loads(content)
+        self.assertEqual(data["name"], self.category.name)
+        self.assertEqual(len(data["books"]), 7)
+
+
+class CategoryLookupTests(APITestCase):
+    def setUp(self):
+        category_cache.clear()
+        self.seller = UserFactory(user_type="seller")
+        self.client.force_authenticate(user=self.seller)
+
+    def create_book(self, category):
+        data = {
+            "title": "Ariel",
+            "author": "Sylvia Plath",
+            "price": 10,
+            "category": category,
+        }
+        response = self.client.post(reverse("book-create"), data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Book.objects.select_related("category").get(title="Ariel")
+
+    def test_case_and_spacing_are_ignored(self):
+        poetry = CategoryFactory(name="Poetry")
+        self.assertEqual(self.create_book("  POETRY ").category, poetry)
+        self.assertEqual(Category.objects.count(), 1)
+
+    def test_new_category_is_named_after_the_input(self):
+        category = self.create_book("Confessional  poetry").category
+        self.assertEqual(category.name, "Confessional poetry")
+        self.assertEqual(category.key, "confessional poetry")
+
+    def test_key_is_unique(self):
+        CategoryFactory(name="Poetry")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Category.objects.create(name="poetry")
+
+    def test_cached_lookups_skip_the_database(self):
+        CategoryFactory.create_batch(50)
+        poetry = CategoryFactory(name="Poetry")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(get_category("poetry"), poetry)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_category("POETRY"), poetry)
+        self.assertEqual(category_cache.stats.as_dict()["hits"], 1)
+
+    def test_category_writes_empty_the_cache(self):
+        poetry = CategoryFactory(name="Poetry")
+        with self.captureOnCommitCallbacks(execute=True):
+            get_category("Poetry")
+        poetry.name = "Verse"
+        poetry.save()
+        self.assertEqual(get_category("verse"), poetry)
+        self.assertNotEqual(get_category("poetry"), poetry)
+
+    def test_uncommitted_categories_are_not_cached(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            get_category("Poetry")
+        # Caching it, and bumping the "categories" version once more
+        self.assertEqual(len(callbacks), 2)
+        with self.assertNumQueries(1):
+            get_category("Poetry")
+
+    def test_bulk_writes_keep_the_key(self):
+        first, second = Category.objects.bulk_create(
+            [Category(name="Poetry"), Category(name="Drama")]
+        )
+        self.assertEqual(Category.objects.get(pk=first.pk).key, "poetry")
+
+        Category.objects.filter(pk=first.pk).update(name=" Verse ")
+        second.name = "Plays"
+        Category.objects.bulk_update([second], ["name"])
+        self.assertEqual(
+            sorted(Category.objects.values_list("key", flat=True)),
+            ["plays", "verse"],
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Category.objects.bulk_create([Category(name="VERSE")])
+
+    def test_migration_merges_duplicates(self):
+        migration = importlib.import_module("api.migrations.0010_category_key")
+        # Rows from before there was a key, which CategoryQuerySet sets
+        first, second = Category._base_manager.bulk_create(
+            [Category(name="Poetry"), Category(name=" poetry")]
+        )
+        book = BookFactory(category=second)
+
+        migration.fill_category_keys(django_apps, None)
+
+        self.assertEqual(
+            list(Category.objects.values_list("pk", "key")),
+            [(first.pk, "poetry")],
+        )
+        book.refresh_from_db()
+        self.assertEqual(book.category_id, first.pk)
+
+
+class BookImportTests(APITestCase):
+    CSV = (
+        "title,author,price,category,description\n"
+        "Dune,Frank Herbert,9.99,science fiction,Spice\n"
+        "Emma,Jane Austen,not a price,Classics,\n"
+        "Hyperion,Dan Simmons,12.50,Science Fiction,\n"
+        "Persuasion,Jane Austen,7.00,,\n"
+    )
+
+    def setUp(self):
+        self.seller = UserFactory(user_type="seller")
+        self.fiction = CategoryFactory(name="Science Fiction")
+
+    def test_command_imports_valid_rows_and_reports_the_rest(self):
+        path = self.write_file("books.csv", self.CSV)
+        out, err = StringIO(), StringIO()
+        call_command(
+            "import_books",
+            path,
+            seller=self.seller.email,
+            batch_size=2,
+            stdout=out,
+            stderr=err,
+        )
+
+        books = Book.objects.filter(seller=self.seller).order_by("title")
+        self.assertEqual(
+            [book.title for book in books], ["Dune", "Hyperion", "Persuasion"]
+        )
+        self.assertEqual(books[0].category, self.fiction)
+        self.assertEqual(books[1].category, self.fiction)
+        self.assertIsNone(books[2].category)
+        self.assertEqual(Category.objects.count(), 1)
+        self.assertIn("line 3:", err.getvalue())
+        self.assertIn("price", err.getvalue())
+        self.assertIn("Imported 3 books, 1 rows failed", out.getvalue())
+
+    def test_categories_resolved_once_per_name(self):
+        rows = "".join(
+            json.dumps(
+                {
+                    "title": f"Book {index}",
+                    "author": "Author",
+                    "price": "5.00",
+                    "category": ["Poetry", "POETRY", "Science fiction"][
+                        index % 3
+                    ],
+                }
+            )
+            + "\n"
+            for index in range(30)
+        )
+        path = self.write_file("books.jsonl", rows + "not json\n")
+        with CaptureQueriesContext(connection) as queries:
+            call_command(
+                "import_books",
+                path,
+                seller=self.seller.email,
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+        category_queries = [
+            query
+            for query in queries
+            if 'FROM "api_category"' in query["sql"]
+            or 'INTO "api_category"' in query["sql"]
+        ]
+        # Poetry looked up and created, Science fiction looked up
+        self.assertEqual(len(category_queries), 3)
+        self.assertEqual(Book.objects.filter(seller=self.seller).count(), 30)
+        self.assertEqual(
+            Book.objects.filter(category__name="Poetry").count(), 20
+        )
+
+    def test_upload_endpoint(self):
+        self.client.force_authenticate(user=self.seller)
+        upload = SimpleUploadedFile(
+            "books.csv", self.CSV.encode(), content_type="text/csv"
+        )
+        response = self.client.post(
+            reverse("book-import"), {"file": upload}, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["imported"], 3)
+        self.assertEqual(response.data["failed"], 1)
+        self.assertEqual(response.data["errors"][0]["line"], 3)
+        self.assertIn("price", response.data["errors"][0]["errors"])
+
+    def test_upload_endpoint_requires_seller(self):
+        self.client.force_authenticate(user=UserFactory())
+        upload = SimpleUploadedFile("books.csv", self.CSV.encode())
+        response = self.client.post(
+            reverse("book-import"), {"file": upload}, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_upload_endpoint_unknown_format(self):
+        self.client.force_authenticate(user=self.seller)
+        upload = SimpleUploadedFile("books.txt", self.CSV.encode())
+        response = self.client.post(
+            reverse("book-import"), {"file": upload}, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("format", response.data)
+
+    def write_file(self, name, content):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        path = os.path.join(directory, name)
+        with open(path, "w", encoding="utf-8") as stream:
+            stream.write(content)
+        return path
+
+
+class BookExportTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.seller = UserFactory(user_type="seller")
+        self.category = CategoryFactory(name="Poetry")
+        self.books = BookFactory.create_batch(
+            3, seller=self.seller, category=self.category
+        )
+        self.other = BookFactory(category=None)
+        self.client.force_authenticate(user=self.user)
+
+    def export(self, query=""):
+        response = self.client.get(reverse("book-export") + query)
+        content = b"".join(response.streaming_content).decode()
+        return response, content
+
+    def test_ndjson_export(self):
+        response, content = self.export()
+        self.assertEqual(
+            response["Content-Type"], "application/x-ndjson; charset=utf-8"
+        )
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            [row["id"] for row in rows],
+            [book.pk for book in [*self.books, self.other]],
+        )
+        book = self.books[0]
+        self.assertEqual(rows[0]["title"], book.title)
+        self.assertEqual(rows[0]["category"], "Poetry")
+        self.assertEqual(rows[0]["seller"], self.seller.pk)
+        self.assertEqual(
+            rows[0]["price"], BookDetailSerializer(book).data["price"]
+        )
+        self.assertEqual(
+            rows[0]["updated_at"],
+            book.updated_at.isoformat().replace("+00:00", "Z"),
+        )
+        self.assertIsNone(rows[3]["category"])
+
+    def test_csv_export(self):
+        response, content = self.export("?format=csv")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn("books.csv", response["Content-Disposition"])
+        lines = content.splitlines()
+        self.assertTrue(lines[0].startswith("id,title,author,price"))
+        self.assertEqual(len(lines), 5)
+
+    def test_filters(self):
+        _, content = self.export(f"?category={self.category.pk}")
+        self.assertEqual(len(content.splitlines()), 3)
+
+        _, content = self.export(f"?seller={self.other.seller_id}")
+        self.assertEqual(len(content.splitlines()), 1)
+
+        Book.objects.filter(pk=self.books[0].pk).update(
+            updated_at=timezone.now() + timedelta(days=1)
+        )
+        since = (timezone.now() + timedelta(hours=1)).isoformat()
+        _, content = self.export("?" + urlencode({"updated_since": since}))
+        self.assertEqual(
+            [json.loads(line)["id"] for line in content.splitlines()],
+            [self.books[0].pk],
+        )
+
+    def test_errors_are_json(self):
+        response = self.client.get(
+            reverse("book-export") + "?format=csv&category=poetry"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertIn("category", response.json())
+
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse("book-export"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_async_export_matches_sync(self):
+        _, content = self.export("?format=csv")
+        token = Token.objects.create(user=self.user)
+
+        async def export():
+            response = await self.async_client.get(
+                reverse("book-export") + "?format=csv",
+                headers={"Authorization": f"Token {token.key}"},
+            )
+            return b"".join(
+                [chunk async for chunk in response.streaming_content]
+            )
+
+        self.assertEqual(async_to_sync(export)().decode(), content)
+
+
+class ImageVariantTests(APITestCase):
+    def setUp(self):
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.book = BookFactory(image=self.cover("cover.png", (1200, 1800)))
+
+    def cover(self, name, size, mode="RGBA", color="red"):
+        buffer = BytesIO()
+        Image.new(mode, size, color).save(buffer, "PNG")
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def test_generate_variants(self):
+        variants = images.generate_variants(self.book)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.image_variants, variants)
+        self.assertEqual(variants["source"], self.book.image.name)
+        self.assertFalse(images.needs_variants(self.book))
+
+        storage = self.book.image.storage
+        expected = {"detail": (600, 900), "thumbnail": (200, 300)}
+        expected["icon"] = (50, 50)
+        for variant, size in expected.items():
+            for extension in ("jpg", "webp"):
+                path = variants[variant][extension]
+                self.assertTrue(path.endswith(f".{extension}"))
+                self.assertEqual(Blob.objects.get(name=path).refcount, 1)
+                with Image.open(storage.path(path)) as image:
+                    self.assertEqual(image.size, size)
+
+    def test_serializers_expose_variants(self):
+        response = self.client.get(reverse("book-list"))
+        self.assertIsNone(response.data["results"][0]["thumbnail"])
+
+        images.generate_variants(self.book)
+        get_cache().clear()
+        response = self.client.get(reverse("book-list"))
+        thumbnail = response.data["results"][0]["thumbnail"]
+        self.assertTrue(thumbnail["webp"].endswith(".webp"), thumbnail)
+        self.assertTrue(thumbnail["jpg"].startswith("http://testserver/"))
+
+        self.client.force_authenticate(user=UserFactory())
+        response = self.client.get(
+            reverse("book-detail", kwargs={"pk": self.book.pk})
+        )
+        self.assertEqual(
+            response.data["detail_image"]["jpg"],
+            "http://testserver/media/"
+            + self.book.image_variants["detail"]["jpg"],
+        )
+
+    def test_replacing_the_image_replaces_variants(self):
+        old = images.generate_variants(self.book)
+        self.book.image = self.cover("new.png", (300, 300), "RGB", "blue")
+        with mock.patch.object(images.pool, "submit") as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.book.save()
+        submit.assert_called_once_with(self.book)
+
+        new = images.generate_variants(self.book)
+        storage = self.book.image.storage
+        collect_garbage(storage, grace=timedelta(0))
+        self.assertTrue(storage.exists(new["icon"]["webp"]))
+        self.assertFalse(storage.exists(old["icon"]["webp"]))
+
+    def test_stale_variants_are_discarded(self):
+        name = self.book.image.name
+        rendered = images.render_variants(self.book.image.path)
+        Book.objects.filter(pk=self.book.pk).update(image="media/other.png")
+
+        self.assertIsNone(images.store_variants(self.book.pk, name, rendered))
+        self.book.refresh_from_db()
+        self.assertIsNone(self.book.image_variants)
+        self.assertEqual(
+            collect_garbage(self.book.image.storage, grace=timedelta(0)),
+            len(rendered),
+        )
+
+
+class ContentAddressedStorageTests(APITestCase):
+    def setUp(self):
+        self.media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.storage = Book._meta.get_field("image").storage
+
+    def upload(self, name, content=b"cover art"):
+        return SimpleUploadedFile(name, content)
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media_root)
+            for root, _, names in os.walk(self.media_root)
+            for name in names
+        )
+
+    def test_same_content_is_stored_once(self):
+        first = BookFactory(image=self.upload("a.JPG"))
+        second = BookFactory(image=self.upload("b.jpg"))
+        other = BookFactory(image=self.upload("c.jpg", b"other art"))
+
+        digest = hashlib.sha256(b"cover art").hexdigest()
+        expected = f"media/{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+        self.assertEqual(first.image.name, expected)
+        self.assertEqual(second.image.name, expected)
+        self.assertNotEqual(other.image.name, expected)
+        self.assertEqual(len(self.stored_files()), 2)
+        self.assertEqual(Blob.objects.get(name=expected).refcount, 2)
+        self.assertEqual(Blob.objects.get(name=expected).size, 9)
+
+    def test_urls_match_file_system_storage(self):
+        names = [
+            "media/3f/a2/3fa2.jpg",
+            "media/a b?.png",
+            "/media/a.png",
+            "media//a.png",
+            "media/../a.png",
+            "./a.png",
+            "médias/a.png",
+        ]
+        for base_url in ["/media/", "https://cdn.example.com/m/", "/m/./x/"]:
+            expected = FileSystemStorage(base_url=base_url)
+            with override_settings(MEDIA_URL=base_url):
+                for name in names:
+                    self.assertEqual(
+                        self.storage.url(name), expected.url(name)
+                    )
+
+    def test_unreferenced_blobs_are_collected(self):
+        first = BookFactory(image=self.upload("a.jpg"))
+        second = BookFactory(image=self.upload("b.jpg"))
+        name = first.image.name
+
+        first.delete()
+        self.assertEqual(collect_garbage(self.storage, timedelta(0)), 0)
+        second.image = self.upload("c.jpg", b"new art")
+        second.save()
+        self.assertEqual(Blob.objects.get(name=name).refcount, 0)
+
+        # Not before the grace period is over
+        self.assertEqual(collect_garbage(self.storage), 0)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(
+            collect_garbage(self.storage, timedelta(0), batch_size=1), 1
+        )
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+        self.assertEqual(self.stored_files(), [second.image.name])
+
+    def test_blobs_retained_during_a_full_batch_dont_end_collection(self):
+        books = [
+            BookFactory(image=self.upload(f"{n}.jpg", f"art {n}".encode()))
+            for n in range(3)
+        ]
+        names = [book.image.name for book in books]
+        for book in books:
+            book.delete()
+
+        atomic = transaction.atomic
+        retained = []
+
+        def retain_then_atomic(*args, **kwargs):
+            # The oldest blob is reused after the batch was fetched
+            if not retained:
+                retained.append(names[0])
+                retain(retained)
+            return atomic(*args, **kwargs)
+
+        with mock.patch("api.storage.transaction.atomic", retain_then_atomic):
+            deleted = collect_garbage(self.storage, timedelta(0), batch_size=2)
+        self.assertEqual(deleted, 2)
+        self.assertTrue(self.storage.exists(names[0]))
+        self.assertEqual(
+            list(Blob.objects.values_list("name", flat=True)), [names[0]]
+        )
+
+    def test_collected_content_saved_again_is_stored_anew(self):
+        book = BookFactory(image=self.upload("a.jpg"))
+        name = book.image.name
+        book.delete()
+        collect_garbage(self.storage, timedelta(0))
+
+        book = BookFactory(image=self.upload("b.jpg"))
+        self.assertEqual(book.image.name, name)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(Blob.objects.get(name=name).refcount, 1)
+
+    def test_saves_not_touching_the_image_skip_refcounting(self):
+        book = BookFactory(image=self.upload("a.jpg"))
+        with self.assertNumQueries(1):
+            book.save(update_fields=["title"])
+        self.assertEqual(Blob.objects.get(name=book.image.name).refcount, 1)
+
+    def test_variants_are_reused_for_the_same_image(self):
+        buffer = BytesIO()
+        Image.new("RGB", (400, 600), "green").save(buffer, "PNG")
+        first = BookFactory(image=self.upload("a.png", buffer.getvalue()))
+        variants = images.generate_variants(first)
+
+        second = BookFactory(image=self.upload("b.png", buffer.getvalue()))
+        with mock.patch.object(images.pool, "submit") as submit:
+            images.schedule_variants(second)
+        submit.assert_not_called()
+        second.refresh_from_db()
+        self.assertEqual(second.image_variants, variants)
+        thumbnail = variants["thumbnail"]["jpg"]
+        self.assertEqual(Blob.objects.get(name=thumbnail).refcount, 2)
+
+    def test_collect_blobs_command_rebuilds_refcounts(self):
+        book = BookFactory(image=self.upload("a.jpg"))
+        Blob.objects.all().delete()
+        orphan = self.storage.save(
+            "media/orphan.jpg", self.upload("o.jpg", b"orphan")
+        )
+        Blob.objects.filter(name=orphan).update(
+            released_at=timezone.now() - timedelta(days=1)
+        )
+
+        out = StringIO()
+        call_command(
+            "collect_blobs",
+            rebuild_refcounts=True,
+            grace_minutes=0,
+            stdout=out,
+        )
+        self.assertIn("Deleted 1 unreferenced files", out.getvalue())
+        self.assertEqual(Blob.objects.get(name=book.image.name).refcount, 1)
+        self.assertEqual(self.stored_files(), [book.image.name])
+
+
+class MediaServingTests(APITestCase):
+    CONTENT = b"0123456789" * 10
+
+    def setUp(self):
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        storage = Book._meta.get_field("image").storage
+        self.name = storage.save(
+            "media/cover.jpg", SimpleUploadedFile("c.jpg", self.CONTENT)
+        )
+        self.url = "/media/" + self.name
+        os.makedirs(os.path.join(media_root, "media"), exist_ok=True)
+        with open(os.path.join(media_root, "media", "old.png"), "wb") as f:
+            f.write(b"legacy")
+
+    def get(self, url=None, **headers):
+        return self.client.get(url or self.url, headers=headers)
+
+    def test_content_addressed_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), self.CONTENT)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(response["Content-Length"], "100")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        digest = hashlib.sha256(self.CONTENT).hexdigest()
+        self.assertEqual(response["ETag"], f'"{digest}"')
+        self.assertEqual(response["Cache-Control"], media.IMMUTABLE)
+
+    def test_other_files_are_cached_briefly(self):
+        response = self.get("/media/media/old.png")
+        self.assertEqual(b"".join(response.streaming_content), b"legacy")
+        self.assertEqual(response["Cache-Control"], "public, max-age=3600")
+        self.assertRegex(response["ETag"], r'^"[0-9a-f]+-6"$')
+
+    def test_conditional_requests(self):
+        etag = self.get()["ETag"]
+        response = self.get(**{"If-None-Match": f'"other", {etag}'})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+        last_modified = self.get()["Last-Modified"]
+        response = self.get(**{"If-Modified-Since": last_modified})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_ranges(self):
+        for header, content_range, content in [
+            ("bytes=2-5", "bytes 2-5/100", b"2345"),
+            ("bytes=95-", "bytes 95-99/100", b"56789"),
+            ("bytes=-3", "bytes 97-99/100", b"789"),
+            ("bytes=98-200", "bytes 98-99/100", b"89"),
+        ]:
+            with self.subTest(header):
+                response = self.get(Range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response["Content-Range"], content_range)
+                self.assertEqual(response["Content-Length"], str(len(content)))
+                self.assertEqual(b"".join(response.streaming_content), content)
+
+    def test_ranges_ignored_or_refused(self):
+        response = self.get(Range="bytes=100-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */100")
+
+        for headers in [
+            {"Range": "bytes=0-1,5-6"},
+            {"Range": "bytes=0-1", "If-Range": '"stale"'},
+        ]:
+            with self.subTest(headers):
+                response = self.get(**headers)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response["Content-Length"], "100")
+
+    def test_missing_and_unsafe_paths(self):
+        for url in [
+            "/media/media/missing.jpg",
+            "/media/media",
+            "/media/../base/settings.py",
+            "/media/.upload-abc",
+        ]:
+            with self.subTest(url):
+                self.assertEqual(self.get(url).status_code, 404)
+        response = self.client.post(self.url)
+        self.assertEqual(
+            response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED
+        )
+
+    @override_settings(MEDIA_OFFLOAD="x-accel-redirect")
+    def test_accel_redirect_offload(self):
+        response = self.get()
+        self.assertEqual(
+            response["X-Accel-Redirect"], "/protected-media/" + self.name
+        )
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["Cache-Control"], media.IMMUTABLE)
+
+
+class ApiBenchmarkTests(APITestCase):
+    def setUp(self):
+        self.benchmark = ApiBenchmark(scale=20)
+
+    def test_every_route_has_a_scenario(self):
+        routes = {scenario.route for scenario in self.benchmark.scenarios()}
+        self.assertEqual(routes, route_names())
+
+    def test_scenarios_succeed(self):
+        for scenario in self.benchmark.scenarios():
+            if scenario.slow:
+                continue
+            result = run_scenario(scenario, requests=3, concurrency=1)
+            self.assertEqual(result["errors"], 0, scenario.name)
+            self.assertEqual(result["requests"], 3)
+            # Profiles are files, read once the admin's token is cached
+            if not scenario.route.startswith("profile-"):
+                self.assertGreater(result["queries"], 0, scenario.name)
+            self.assertLessEqual(
+                result["latency_ms"]["p50"], result["latency_ms"]["p99"]
+            )
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertIsNone(percentile([], 50))
+
+
+class SeedTests(TestCase):
+    def plan(self, seed=0):
+        return SeedPlan.for_database(
+            password_hash="unused",
+            books=50,
+            buyers=10,
+            sellers=2,
+            categories=3,
+            carts=2,
+            orders=20,
+            seed=seed,
+        )
+
+    def test_same_seed_same_rows(self):
+        for kind in ("categories", "users", "books", "carts", "orders"):
+            rows = Generator(self.plan()).generate(kind, 0, 10)
+            self.assertEqual(
+                rows, Generator(self.plan()).generate(kind, 0, 10), kind
+            )
+            self.assertNotEqual(
+                rows, Generator(self.plan(seed=1)).generate(kind, 0, 10), kind
+            )
+
+    def test_command_adds_consistent_data(self):
+        existing = BookFactory()
+        for workers in (1, 2):
+            call_command(
+                "seed",
+                books=300,
+                categories=5,
+                workers=workers,
+                chunk_size=100,
+                stdout=StringIO(),
+            )
+        self.assertEqual(Book.objects.count(), 601)
+        self.assertEqual(Category.objects.count(), 11)
+        self.assertEqual(User.objects.filter(user_type="seller").count(), 3)
+        self.assertEqual(User.objects.filter(user_type="buyer").count(), 60)
+        self.assertEqual(Cart.objects.count(), 12)
+        self.assertEqual(Order.objects.count(), 120)
+        self.assertTrue(Book.objects.filter(pk=existing.pk).exists())
+
+        order = Order.objects.prefetch_related("order_items").last()
+        self.assertEqual(
+            order.total_price,
+            sum(i.quantity * i.unit_price for i in order.order_items.all()),
+        )
+        buyer = User.objects.filter(user_type="buyer").last()
+        password = buyer.password
+        self.assertTrue(buyer.check_password("password123"))
+        # Not rehashed on login
+        self.assertEqual(buyer.password, password)
+        # Both runs had the same seed, so the same hash
+        self.assertEqual(
+            set(
+                User.objects.exclude(pk=existing.seller_id).values_list(
+                    "password", flat=True
+                )
+            ),
+            {password},
+        )
+        # Ids continue from the seeded ones
+        self.assertEqual(BookFactory().pk, Book.objects.count())
+
+        if fts_available():
+            book = Book.objects.last()
+            response = self.client.get(
+                reverse("book-list"), {"search": book.author}
+            )
+            self.assertGreaterEqual(response.data["count"], 1)
+
+
+@override_settings(REQUEST_TIMING_SAMPLE_RATE=1)
+class RequestTimingTests(APITestCase):
+    def setUp(self):
+        BookFactory.create_batch(3)
+        get_cache().clear()
+
+    def server_timing(self, response):
+        return dict(
+            re.match(r"(\w+);.*dur=([\d.]+)", metric.strip()).groups()
+            for metric in response["Server-Timing"].split(",")
+        )
+
+    def test_timings_are_reported(self):
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertLogs("api.timing", "INFO") as logs:
+                response = self.client.get(reverse("book-list"))
+        timings = self.server_timing(response)
+        self.assertEqual(set(timings), {"db", "serialize", "render", "total"})
+        self.assertGreater(float(timings["serialize"]), 0)
+        self.assertGreater(float(timings["render"]), 0)
+        self.assertIn(
+            f'desc="{len(queries)} queries"', response["Server-Timing"]
+        )
+
+        (record,) = logs.records
+        self.assertEqual(record.timing["route"], "book-list")
+        self.assertEqual(record.timing["status"], 200)
+        self.assertEqual(record.timing["queries"], len(queries))
+        self.assertIn("route=book-list", record.getMessage())
+
+    def test_cached_responses_skip_serializers(self):
+        self.client.get(reverse("category-list"))
+        response = self.client.get(reverse("category-list"))
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(float(self.server_timing(response)["serialize"]), 0)
+
+    def test_async_requests(self):
+        get = async_to_sync(self.async_client.get)
+        with CaptureQueriesContext(connection) as queries:
+            response = get(reverse("category-list"))
+        self.assertGreater(len(queries), 0)
+        self.assertIn(
+            f'desc="{len(queries)} queries"', response["Server-Timing"]
+        )
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=0)
+    def test_disabled(self):
+        with mock.patch.object(RequestTimer, "activate") as activate:
+            response = self.client.get(reverse("book-list"))
+        self.assertNotIn("Server-Timing", response)
+        activate.assert_not_called()
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(METRICS_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        BookFactory.create_batch(2)
+        get_cache().clear()
+
+    def scrape(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        values = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith("#"):
+                series, value = line.rsplit(" ", 1)
+                values[series] = float(value)
+        return values
+
+    def test_requests_are_recorded_per_route(self):
+        self.client.get(reverse("book-list"))
+        self.client.get(reverse("book-list"))
+        self.client.get("/api/no-such-route/")
+        values = self.scrape()
+
+        self.assertEqual(
+            values[
+                'api_requests_total{method="GET",route="book-list",'
+                'status="200"}'
+            ],
+            2,
+        )
+        self.assertEqual(
+            values[
+                'api_requests_total{method="GET",route="unmatched",'
+                'status="404"}'
+            ],
+            1,
+        )
+        self.assertEqual(
+            values['api_request_duration_seconds_count{route="book-list"}'],
+            2,
+        )
+        self.assertEqual(
+            values[
+                'api_request_duration_seconds_bucket{le="+Inf",'
+                'route="book-list"}'
+            ],
+            2,
+        )
+        self.assertGreater(
+            values['api_request_duration_seconds_sum{route="book-list"}'], 0
+        )
+        self.assertGreater(
+            values['api_db_queries_total{route="book-list"}'], 0
+        )
+        self.assertEqual(
+            values[
+                'api_cache_misses_total{cache="catalog",route="book-list"}'
+            ],
+            1,
+        )
+        self.assertEqual(
+            values['api_cache_hits_total{cache="catalog",route="book-list"}'],
+            1,
+        )
+
+    def test_unknown_methods_share_a_label(self):
+        for method in ["BREW", "PROPFIND"]:
+            self.client.generic(method, reverse("book-list"))
+        values = self.scrape()
+        self.assertEqual(
+            values[
+                'api_requests_total{method="other",route="book-list",'
+                'status="405"}'
+            ],
+            2,
+        )
+        self.assertFalse(any('method="BREW"' in series for series in values))
+
+    def test_scraping_is_restricted(self):
+        response = self.client.get("/metrics", REMOTE_ADDR="203.0.113.5")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        with override_settings(METRICS_TOKEN="scrape-secret"):
+            response = self.client.get(
+                "/metrics",
+                REMOTE_ADDR="203.0.113.5",
+                HTTP_AUTHORIZATION="Bearer wrong",
+            )
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get(
+                "/metrics",
+                REMOTE_ADDR="203.0.113.5",
+                HTTP_AUTHORIZATION="Bearer scrape-secret",
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_vanished_files_are_skipped(self):
+        self.client.get(reverse("book-list"))
+        # Listed, then archived by another process before it's read
+        gone = mock.Mock(
+            path=os.path.join(settings.METRICS_DIR, "metrics_1.db")
+        )
+        gone.name = "metrics_1.db"
+        scandir = os.scandir
+
+        def scandir_with_gone(path):
+            return [*scandir(path), gone]
+
+        with mock.patch("api.metrics.os.scandir", scandir_with_gone):
+            values = self.scrape()
+        self.assertEqual(
+            values[
+                'api_requests_total{method="GET",route="book-list",'
+                'status="200"}'
+            ],
+            1,
+        )
+
+    def test_query_count_matches(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("category-list"))
+        # Before the next request resets the captured queries
+        count = len(queries)
+        values = self.scrape()
+        self.assertEqual(
+            values['api_db_queries_total{route="category-list"}'], count
+        )
+
+    def test_workers_are_added_up(self):
+        def record_in_worker():
+            current = RequestMetrics()
+            current.queries = 3
+            metrics.record_request("book-list", "GET", "200", 0.02, current)
+
+        # Before forking, so the worker doesn't inherit this process' file
+        metrics.file()
+        worker = multiprocessing.get_context("fork").Process(
+            target=record_in_worker
+        )
+        worker.start()
+        worker.join()
+        self.assertEqual(worker.exitcode, 0)
+        self.client.get(reverse("book-list"))
+
+        values = self.scrape()
+        # The worker is gone: its file was added to the archive
+        self.assertCountEqual(
+            os.listdir(settings.METRICS_DIR),
+            [
+                f"metrics_{os.getpid()}.db",
+                "metrics_archive.db",
+                "metrics.lock",
+            ],
+        )
+        self.assertEqual(
+            values[
+                'api_requests_total{method="GET",route="book-list",'
+                'status="200"}'
+            ],
+            2,
+        )
+        self.assertEqual(
+            values[
+                'api_request_duration_seconds_bucket{le="+Inf",'
+                'route="book-list"}'
+            ],
+            2,
+        )
+        self.assertEqual(
+            values['api_request_duration_seconds_count{route="book-list"}'],
+            2,
+        )
+        # Still counted once, in the archive
+        values = self.scrape()
+        self.assertEqual(
+            values['api_request_duration_seconds_count{route="book-list"}'],
+            2,
+        )
+
+    def test_file_grows_and_reopens(self):
+        path = os.path.join(settings.METRICS_DIR, "metrics_1.db")
+        file = MetricsFile(path)
+        keys = [
+            ("api_db_queries_total", (("route", f"r{n}"),))
+            for n in range(2000)
+        ]
+        file.add([(file.index(key), n) for n, key in enumerate(keys)])
+
+        reopened = MetricsFile(path)
+        reopened.add([(reopened.index(keys[-1]), 1)])
+        values = self.scrape()
+        self.assertEqual(values['api_db_queries_total{route="r1999"}'], 2000)
+        self.assertEqual(values['api_db_queries_total{route="r7"}'], 7)
+
+
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(
+            PROFILING_DIR=directory.name, PROFILING_MAX_PROFILES=2
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.admin = UserFactory(is_staff=True)
+        self.buyer = UserFactory()
+        BookFactory.create_batch(2)
+        get_cache().clear()
+
+    def auth(self, user):
+        token, _ = Token.objects.get_or_create(user=user)
+        return {"Authorization": f"Token {token.key}"}
+
+    def test_staff_can_profile_a_request(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("book-list"),
+                {"profile": "1"},
+                headers=self.auth(self.admin),
+            )
+        count = len(queries)
+        self.assertEqual(response.status_code, 200)
+        profile_id = response["X-Profile-Id"]
+
+        response = self.client.get(
+            reverse("profile-detail", kwargs={"profile_id": profile_id}),
+            headers=self.auth(self.admin),
+        )
+        profile = response.json()
+        self.assertEqual(profile["route"], "book-list")
+        self.assertEqual(profile["status"], 200)
+        # Authenticating the staff user comes before the profile
+        self.assertLess(profile["queries"], count)
+        self.assertEqual(len(profile["sql"]), profile["queries"])
+        self.assertIn("api_book", profile["sql"][-1]["sql"])
+        self.assertIn("cumulative", profile["report"])
+
+        response = self.client.get(
+            reverse("profile-list"), headers=self.auth(self.admin)
+        )
+        self.assertEqual([p["id"] for p in response.json()], [profile_id])
+
+        response = self.client.get(
+            reverse("profile-detail", kwargs={"profile_id": profile_id}),
+            {"download": "pstats"},
+            headers=self.auth(self.admin),
+        )
+        with tempfile.NamedTemporaryFile() as dump:
+            dump.write(b"".join(response.streaming_content))
+            dump.flush()
+            self.assertGreater(pstats.Stats(dump.name).total_calls, 0)
+
+    def test_async_requests(self):
+        response = async_to_sync(self.async_client.get)(
+            reverse("category-list"),
+            headers={"X-Profile-Token": make_token()},
+        )
+        profile_id = response["X-Profile-Id"]
+        response = self.client.get(
+            reverse("profile-detail", kwargs={"profile_id": profile_id}),
+            headers=self.auth(self.admin),
+        )
+        profile = response.json()
+        self.assertGreater(profile["queries"], 0)
+        self.assertEqual(len(profile["sql"]), profile["queries"])
+        self.assertIn("api_category", profile["sql"][-1]["sql"])
+
+    def test_one_request_profiled_at_a_time(self):
+        with profiler_slot() as free:
+            self.assertTrue(free)
+            response = async_to_sync(self.async_client.get)(
+                reverse("category-list"),
+                headers={"X-Profile-Token": make_token()},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Id", response)
+
+        response = async_to_sync(self.async_client.get)(
+            reverse("category-list"),
+            headers={"X-Profile-Token": make_token()},
+        )
+        self.assertIn("X-Profile-Id", response)
+
+    def test_query_string_is_not_stored(self):
+        response = self.client.get(
+            reverse("book-list"),
+            {"profile": "1", "search": "secret"},
+            headers=self.auth(self.admin),
+        )
+        response = self.client.get(
+            reverse(
+                "profile-detail",
+                kwargs={"profile_id": response["X-Profile-Id"]},
+            ),
+            headers=self.auth(self.admin),
+        )
+        self.assertEqual(response.json()["path"], reverse("book-list"))
+
+    def test_others_are_not_profiled(self):
+        for headers in ({}, self.auth(self.buyer)):
+            response = self.client.get(
+                reverse("book-list"), {"profile": "1"}, headers=headers
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("X-Profile-Id", response)
+        response = self.client.get(
+            reverse("book-list"), headers=self.auth(self.admin)
+        )
+        self.assertNotIn("X-Profile-Id", response)
+
+    def test_signed_header(self):
+        response = self.client.get(
+            reverse("book-list"), headers={"X-Profile-Token": make_token()}
+        )
+        self.assertIn("X-Profile-Id", response)
+        response = self.client.get(
+            reverse("book-list"), headers={"X-Profile-Token": "profile:x:y"}
+        )
+        self.assertNotIn("X-Profile-Id", response)
+        with override_settings(PROFILING_TOKEN_MAX_AGE=-1):
+            response = self.client.get(
+                reverse("book-list"),
+                headers={"X-Profile-Token": make_token()},
+            )
+        self.assertNotIn("X-Profile-Id", response)
+
+    def test_store_rotates(self):
+        ids = [
+            self.client.get(
+                reverse("category-list"),
+                headers={"X-Profile-Token": make_token()},
+            )["X-Profile-Id"]
+            for _ in range(3)
+        ]
+        response = self.client.get(
+            reverse("profile-list"), headers=self.auth(self.admin)
+        )
+        self.assertEqual([p["id"] for p in response.json()], ids[:0:-1])
+        self.assertEqual(len(os.listdir(settings.PROFILING_DIR)), 4)
+        response = self.client.get(
+            reverse("profile-detail", kwargs={"profile_id": ids[0]}),
+            headers=self.auth(self.admin),
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_profiles_are_for_admins(self):
+        for url in [
+            reverse("profile-list"),
+            reverse("profile-detail", kwargs={"profile_id": "1-0123abcd"}),
+        ]:
+            response = self.client.get(url, headers=self.auth(self.buyer))
+            self.assertEqual(response.status_code, 403)
+
+
+class SlowQueryLogTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(SLOW_QUERY_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.category = CategoryFactory()
+        BookFactory.create_batch(3, category=self.category)
+        get_cache().clear()
+
+    def test_fingerprint_ignores_parameters(self):
+        first, normalized = fingerprint(
+            'SELECT "id" FROM "api_book" WHERE "id" IN (%s, %s, %s) '
+            "AND \"title\" = 'x' LIMIT 21"
+        )
+        second, _ = fingerprint(
+            'SELECT "id"  FROM "api_book" WHERE "id" IN (%s) '
+            "AND \"title\" = 'it''s'\nLIMIT 5"
+        )
+        self.assertEqual(first, second)
+        self.assertEqual(
+            normalized,
+            'SELECT "id" FROM "api_book" WHERE "id" IN (...) '
+            'AND "title" = ? LIMIT ?',
+        )
+        self.assertNotEqual(
+            first, fingerprint('SELECT "id" FROM "api_category"')[0]
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_are_logged_and_added_up(self):
+        url = reverse("category-detail", kwargs={"pk": self.category.pk})
+        with self.assertLogs("api.slow_queries", "WARNING") as logs:
+            self.client.get(url)
+            get_cache().clear()
+            self.client.get(url)
+
+        queries = [record.slow_query for record in logs.records]
+        books = [q for q in queries if 'FROM "api_book"' in q["sql"]]
+        self.assertTrue(books)
+        self.assertIn("api_book", books[0]["plan"])
+        self.assertTrue(books[0]["stack"][0].startswith("api/"))
+        self.assertTrue(all("EXPLAIN" not in q["sql"] for q in queries))
+
+        out = StringIO()
+        call_command("slow_queries", plans=True, limit=100, stdout=out)
+        report = out.getvalue()
+        self.assertIn(f"{books[0]['fingerprint']}: 2 queries", report)
+        self.assertIn(books[0]["stack"][0], report)
+        self.assertIn(f"| {books[0]['plan'].splitlines()[0]}", report)
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=1)
+    def test_explains_are_not_counted(self):
+        def query_count(response):
+            timing = response["Server-Timing"]
+            return int(re.search(r"(\d+) queries", timing)[1])
+
+        url = reverse("category-detail", kwargs={"pk": self.category.pk})
+        expected = query_count(self.client.get(url))
+        get_cache().clear()
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0):
+            with self.assertLogs("api.slow_queries", "WARNING") as logs:
+                response = self.client.get(url)
+        self.assertEqual(query_count(response), expected)
+        # Every query is logged once, and the EXPLAINs aren't
+        queries = [record.slow_query for record in logs.records]
+        self.assertEqual(len(queries), expected)
+        self.assertTrue(all("EXPLAIN" not in q["sql"] for q in queries))
+
+    def test_new_fingerprints_get_in(self):
+        stats = SlowQueryStats()
+        self.enterContext(
+            mock.patch.object(slow_queries, "MAX_FINGERPRINTS", 2)
+        )
+        for digest, ms in [("a", 50.0), ("b", 20.0), ("c", 1.0)]:
+            stats.record(
+                {
+                    "fingerprint": digest,
+                    "normalized": "SELECT ?",
+                    "sql": "SELECT 1",
+                    "ms": ms,
+                    "at": timezone.now().isoformat(),
+                    "stack": [],
+                    "plan": None,
+                }
+            )
+        self.assertFalse(os.listdir(settings.SLOW_QUERY_DIR))
+        stats.flush()
+        (name,) = os.listdir(settings.SLOW_QUERY_DIR)
+        entries = slow_queries.read_stats_file(
+            os.path.join(settings.SLOW_QUERY_DIR, name)
+        )
+        self.assertEqual(set(entries), {"a", "c"})
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=None)
+    def test_disabled(self):
+        with self.assertNoLogs("api.slow_queries"):
+            self.client.get(reverse("category-list"))
+        out = StringIO()
+        call_command("slow_queries", stdout=out)
+        self.assertEqual(out.getvalue(), "No slow queries.\n")
+
+
+class RowSerializerTests(APITestCase):
+    def setUp(self):
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.buyer = UserFactory()
+        self.client.force_authenticate(user=self.buyer)
+        buffer = BytesIO()
+        Image.new("RGB", (300, 450), "red").save(buffer, "PNG")
+        cover = BookFactory(
+            image=SimpleUploadedFile("cover.png", buffer.getvalue()),
+            price="1234.50",
+        )
+        images.generate_variants(cover)
+        self.books = [
+            cover,
+            BookFactory(image=SimpleUploadedFile("a.png", b"a"), price=5),
+            BookFactory(title="Ünïcode ✓", price="0.99"),
+        ]
+        self.categories = CategoryFactory.create_batch(3)
+        for order in OrderFactory.create_batch(3, buyer=self.buyer):
+            for book in self.books[: order.pk % 3]:
+                OrderItemFactory(order=order, book=book)
+        OrderFactory()
+        get_cache().clear()
+
+    def expected(self, response, serializer_class, instances):
+        """
+        What ``serializer_class`` renders for the instances.
+        """
+        context = {"request": response.wsgi_request}
+        serializer = serializer_class(instances, many=True, context=context)
+        return JSONRenderer().render(serializer.data)
+
+    def test_lists_match_model_serializers(self):
+        response = self.client.get(reverse("book-list"), {"page_size": 50})
+        self.assertEqual(
+            JSONRenderer().render(response.data["results"]),
+            self.expected(
+                response,
+                BookListSerializer,
+                Book.objects.order_by("-created", "-id"),
+            ),
+        )
+        # The cover, the oldest book
+        self.assertIsNotNone(response.data["results"][-1]["thumbnail"]["jpg"])
+
+        response = self.client.get(reverse("category-list"))
+        self.assertEqual(
+            response.content,
+            self.expected(
+                response, CategoryListSerializer, Category.objects.all()
+            ),
+        )
+
+        response = self.client.get(reverse("order_list"))
+        self.assertEqual(
+            response.content,
+            self.expected(
+                response, OrderSerializer, orders_with_items(self.buyer)
+            ),
+        )
+        self.assertEqual(
+            [len(order["order_items"]) for order in response.data], [1, 2, 0]
+        )
+
+    def test_keyset_pages(self):
+        url = reverse("book-list")
+        response = self.client.get(url, {"cursor": "", "page_size": 2})
+        titles = [book["title"] for book in response.data["results"]]
+        response = self.client.get(response.data["next"])
+        titles += [book["title"] for book in response.data["results"]]
+        self.assertEqual(titles, [book.title for book in reversed(self.books)])
+
+    def test_no_model_instances_are_made(self):
+        request = APIRequestFactory().get("/")
+        serializer = BookListRowSerializer({"request": request})
+        with mock.patch.object(
+            Book, "from_db", side_effect=AssertionError
+        ), mock.patch.object(
+            BookListSerializer, "to_representation", side_effect=AssertionError
+        ):
+            data = serializer.serialize(serializer.rows(Book.objects.all()))
+        self.assertEqual(len(data), 3)
+
+    def test_absolute_urls(self):
+        request = APIRequestFactory().get("/", secure=True)
+        absolute_url = absolute_url_builder(request)
+        for url in [
+            "/media/a.png",
+            "/media/a b.png",
+            "/media/é.png",
+            "/media/./a.png",
+            "//cdn.example.com/a.png",
+            "https://cdn.example.com/a.png",
+            "media/a.png",
+        ]:
+            self.assertEqual(
+                absolute_url(url), request.build_absolute_uri(url), url
+            )
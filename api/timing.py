@@ -0,0 +1,165 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .slow_queries import explaining
+
+logger = logging.getLogger(__name__)
+
+# The RequestTimer of the request being handled, None when not sampled
+_timer = ContextVar("request_timer", default=None)
+
+
+def sampled():
+    """
+    Whether to time this request, see REQUEST_TIMING_SAMPLE_RATE.
+    """
+    rate = settings.REQUEST_TIMING_SAMPLE_RATE
+    return rate > 0 and (rate >= 1 or random.random() < rate)
+
+
+def current_timer():
+    return _timer.get()
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper timing the queries of a timed request,
+    installed on every connection (see api/signals.py).
+    """
+    timer = _timer.get()
+    if timer is None or explaining():
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.sql += time.perf_counter() - start
+        timer.queries += 1
+
+
+@contextmanager
+def timed_serialization():
+    """
+    Count the time spent in the block, its own queries excluded, towards
+    the serializer time of a timed request, like TimedSerializerMixin
+    does for serializers.
+    """
+    timer = _timer.get()
+    if timer is None or timer.serializing:
+        yield
+        return
+    timer.serializing = True
+    start, sql = time.perf_counter(), timer.sql
+    try:
+        yield
+    finally:
+        timer.serializing = False
+        elapsed = time.perf_counter() - start
+        timer.serialize += elapsed - (timer.sql - sql)
+
+
+class RequestTimer:
+    """
+    Where one request spent its time: the queries it ran and how long
+    they took, time in serializers (their own queries excluded) and in
+    rendering the response. Seconds.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        self.total = 0.0
+        self.serializing = False
+        self._render_started = None
+
+    @contextmanager
+    def activate(self):
+        """
+        Collect the timings of the code run in the block.
+        """
+        token = _timer.set(self)
+        try:
+            yield self
+        finally:
+            _timer.reset(token)
+
+    def time_render(self, response):
+        """
+        Time the rendering of a template response about to be rendered.
+        """
+        self._render_started = time.perf_counter()
+        response.add_post_render_callback(self._rendered)
+
+    def _rendered(self, response):
+        self.render += time.perf_counter() - self._render_started
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def as_dict(self):
+        """
+        The timings in milliseconds.
+        """
+        return {
+            "queries": self.queries,
+            "sql_ms": round(self.sql * 1000, 3),
+            "serialize_ms": round(self.serialize * 1000, 3),
+            "render_ms": round(self.render * 1000, 3),
+            "total_ms": round(self.total * 1000, 3),
+        }
+
+    def server_timing(self):
+        """
+        The timings as a Server-Timing header value.
+        """
+        return ", ".join(
+            [
+                f'db;dur={self.sql * 1000:.3f};desc="{self.queries} queries"',
+                f"serialize;dur={self.serialize * 1000:.3f}",
+                f"render;dur={self.render * 1000:.3f}",
+                f"total;dur={self.total * 1000:.3f}",
+            ]
+        )
+
+    def log(self, request, response):
+        match = request.resolver_match
+        fields = {
+            "method": request.method,
+            "path": request.path,
+            "route": match.view_name if match else None,
+            "status": response.status_code,
+            **self.as_dict(),
+        }
+        logger.info(
+            " ".join(f"{name}={value}" for name, value in fields.items()),
+            extra={"timing": fields},
+        )
+
+
+class TimedSerializerMixin:
+    """
+    Count the time a serializer spends producing its output towards the
+    serializer time of a timed request. Only the outermost serializer
+    is timed, nested ones are part of it.
+    """
+
+    def to_representation(self, instance):
+        timer = _timer.get()
+        if timer is None or timer.serializing:
+            return super().to_representation(instance)
+        timer.serializing = True
+        start, sql = time.perf_counter(), timer.sql
+        try:
+            return super().to_representation(instance)
+        finally:
+            timer.serializing = False
+            elapsed = time.perf_counter() - start
+            timer.serialize += elapsed - (timer.sql - sql)
@@ -1,10 +1,10 @@
 # urls.py
-from django.conf import settings
-from django.conf.urls.static import static
-from django.urls import include, path
+from django.urls import path
 
 from .views import (
     BookCreateView,
+    BookImportView,
+    BookExportView,
     BookDetailView,
     BookListView,
     CategoryDetailView,
@@ -16,7 +16,10 @@ from .views import (
     CartUpdateDeleteView,
     CheckoutView,
     OrderView,
-    OrderListView
+    OrderListView,
+    CacheStatsView,
+    ProfileDetailView,
+    ProfileListView,
 )
 
 urlpatterns = [
@@ -32,6 +35,8 @@ urlpatterns = [
     path("login/", LoginView.as_view(), name="user-login"),
     path("logout/", LogoutView.as_view(), name="user-logout"),
     path("books/create/", BookCreateView.as_view(), name="book-create"),
+    path("books/import/", BookImportView.as_view(), name="book-import"),
+    path("books/export/", BookExportView.as_view(), name="book-export"),
     path("cart/", CartListView.as_view(), name="cart"),
     path("cart/<int:pk>/", CartUpdateDeleteView.as_view(), name="cart-update"),
     path(
@@ -47,9 +52,11 @@ urlpatterns = [
         OrderListView.as_view(),
         name="order_list",
     ),
+    path("cache/stats/", CacheStatsView.as_view(), name="cache-stats"),
+    path("profiles/", ProfileListView.as_view(), name="profile-list"),
+    path(
+        "profiles/<slug:profile_id>/",
+        ProfileDetailView.as_view(),
+        name="profile-detail",
+    ),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )
@@ -16,34 +16,182 @@ from .models import Book, Category, Cart, CartItem, Order, OrderItem
 from rest_framework.views import APIView
 from django.contrib.auth import authenticate, login
 from rest_framework.authtoken.models import Token
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from .permissions import IsSeller, IsBuyer, CanRetrieveOrIsSeller
-from .pagination import CustomPagination
+from .pagination import CatalogPagination, KeysetPagination
+from .search import BookSearchFilter
+from .rows import (
+    BookListRowSerializer,
+    CategoryListRowSerializer,
+    OrderRowSerializer,
+    RowListMixin,
+)
+from .cache import (
+    CachedResponseMixin,
+    ConditionalGetMixin,
+    get_stats,
+    get_versions,
+)
+from .streaming import stream_json_object
+from .export import (
+    BookExportFilterSerializer,
+    CSVRenderer,
+    ExportEncoder,
+    NDJSONRenderer,
+    export_queryset,
+    export_response,
+    iter_export,
+)
+from rest_framework.renderers import JSONRenderer
+from .categories import category_cache
+from .profiling import get_profile_store
+from .importer import IMPORT_FORMATS, guess_format, import_books, text_stream
+from rest_framework.parsers import MultiPartParser
 from django.shortcuts import get_object_or_404
-
-
-class BookListView(generics.ListAPIView):
-    queryset = Book.objects.all()
+from django.http import FileResponse, Http404
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Prefetch
+
+
+class BookListView(
+    ConditionalGetMixin,
+    CachedResponseMixin,
+    RowListMixin,
+    generics.ListAPIView,
+):
+    # Newest first, as keyset pages are; searches order by rank instead
+    queryset = Book.objects.order_by("-created", "-id")
     serializer_class = BookListSerializer
-    filter_backends = [filters.SearchFilter]
+    row_serializer_class = BookListRowSerializer
+    filter_backends = [BookSearchFilter]
     search_fields = ["title", "description", "category__name", "author"]
-    pagination_class = CustomPagination
+    pagination_class = CatalogPagination
 
+    def get_cache_namespaces(self):
+        return ["books", "categories"]
 
-class BookDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Book.objects.all()
+    def get_validator_state(self):
+        # The namespaces' versions change with every write to books or
+        # categories (see api/signals.py), so no query is needed: an
+        # aggregate would scan the whole filtered catalog on every
+        # request. Without one there's no Last-Modified either.
+        return None, get_versions(self.get_cache_namespaces())
+
+
+class BookDetailView(
+    ConditionalGetMixin,
+    CachedResponseMixin,
+    generics.RetrieveUpdateDestroyAPIView,
+):
+    queryset = Book.objects.select_related("seller", "category")
     serializer_class = BookDetailSerializer
     permission_classes = [CanRetrieveOrIsSeller]
 
+    def get_cache_namespaces(self):
+        # The seller is embedded too, so user writes bump "sellers"
+        return [
+            f"book:{self.kwargs['pk']}",
+            "books:bulk",
+            "categories",
+            "sellers",
+        ]
+
+    def get_validator_state(self):
+        state = (
+            Book.objects.filter(pk=self.kwargs["pk"])
+            .values_list(
+                "updated_at", "category__updated_at", "seller__updated_at"
+            )
+            .first()
+        )
+        if state is None:
+            return None
+        return max_datetime(*state), state
+
 
-class CategoryListView(generics.ListAPIView):
+class CategoryListView(
+    CachedResponseMixin, RowListMixin, generics.ListAPIView
+):
     queryset = Category.objects.all()
     serializer_class = CategoryListSerializer
+    row_serializer_class = CategoryListRowSerializer
+
+    def get_cache_namespaces(self):
+        return ["categories"]
+
 
+class CategoryDetailView(
+    ConditionalGetMixin, CachedResponseMixin, generics.RetrieveAPIView
+):
+    """
+    Category with one keyset page of its books (see KeysetPagination for
+    the query params). ``?stream=true`` streams every book instead.
+    """
 
-class CategoryDetailView(generics.RetrieveAPIView):
     queryset = Category.objects.all()
     serializer_class = CategoryDetailSerializer
+    book_fields = (
+        "id",
+        "created",
+        "category",
+        "title",
+        "image",
+        "image_variants",
+        "price",
+        "author",
+    )
+
+    def get_cache_namespaces(self):
+        return [f"category:{self.kwargs['pk']}", "categories:bulk", "books"]
+
+    def get_validator_state(self):
+        state = (
+            Category.objects.filter(pk=self.kwargs["pk"])
+            .values_list("updated_at")
+            .annotate(
+                books_updated=Max("books__updated_at"), books=Count("books")
+            )
+            .order_by("pk")
+            .first()
+        )
+        if state is None:
+            return None
+        return max_datetime(state[0], state[1]), state
+
+    def retrieve(self, request, *args, **kwargs):
+        category = self.get_object()
+        books = self.get_books(category)
+
+        if self.wants_stream():
+            return stream_json_object(
+                {"name": category.name},
+                "books",
+                books,
+                BookListSerializer,
+                self.get_serializer_context(),
+            )
+
+        paginator = KeysetPagination()
+        category.book_page = paginator.paginate_queryset(books, request, self)
+        return Response(self.get_page_data(category, paginator))
+
+    def get_books(self, category):
+        return category.books.only(*self.book_fields).order_by(
+            "-created", "-id"
+        )
+
+    def wants_stream(self):
+        return self.request.query_params.get("stream") in ("1", "true")
+
+    def get_page_data(self, category, paginator):
+        data = self.get_serializer(category).data
+        if paginator.count is not None:
+            data["count"] = paginator.count
+            data["count_is_estimate"] = paginator.count_is_estimate
+        data["next"] = paginator.get_next_link()
+        data["previous"] = paginator.get_previous_link()
+        return data
 
 
 class UserRegistrationView(generics.CreateAPIView):
@@ -112,6 +260,61 @@ class BookCreateView(generics.CreateAPIView):
         serializer.save(seller=self.request.user)
 
 
+class BookImportView(APIView):
+    """
+    Bulk upload of a seller's books from a CSV or JSONL ``file``. Bad rows
+    are reported and skipped, the rest are imported.
+    """
+
+    permission_classes = [IsSeller]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response(
+                {"file": ["No file was submitted."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        format = request.data.get("format") or guess_format(upload.name)
+        if format not in IMPORT_FORMATS:
+            return Response(
+                {"format": [f"Expected one of {', '.join(IMPORT_FORMATS)}."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        result = import_books(text_stream(upload), format, request.user)
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED)
+
+
+class BookExportView(APIView):
+    """
+    The whole catalog, or the books of a category/seller/updated since a
+    time, streamed as NDJSON (default) or CSV (?format=csv or by Accept).
+    """
+
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    def get(self, request):
+        queryset, encoder = self.get_export()
+        return export_response(iter_export(queryset, encoder), request)
+
+    def get_export(self):
+        filters = BookExportFilterSerializer(data=self.request.query_params)
+        filters.is_valid(raise_exception=True)
+        encoder = ExportEncoder(
+            self.request.accepted_renderer.format, self.request
+        )
+        return export_queryset(filters.validated_data), encoder
+
+    def handle_exception(self, exc):
+        # Errors are reported as JSON whatever the export format
+        self.request.accepted_renderer = JSONRenderer()
+        self.request.accepted_media_type = JSONRenderer.media_type
+        return super().handle_exception(exc)
+
+
 class CartListView(generics.ListCreateAPIView):
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
@@ -122,7 +325,15 @@ class CartListView(generics.ListCreateAPIView):
 
     def get_queryset(self):
         # Return only the carts belonging to the authenticated user
-        return Cart.objects.filter(buyer=self.request.user)
+        return (
+            Cart.objects.filter(buyer=self.request.user)
+            .select_related("buyer")
+            .prefetch_related(
+                Prefetch(
+                    "items", queryset=CartItem.objects.select_related("book")
+                )
+            )
+        )
 
 
 class CartUpdateDeleteView(generics.RetrieveUpdateDestroyAPIView):
@@ -132,44 +343,44 @@ class CartUpdateDeleteView(generics.RetrieveUpdateDestroyAPIView):
 
     def get_queryset(self):
         # Return only the carts belonging to the authenticated user
-        return CartItem.objects.filter(cart__buyer=self.request.user)
+        return CartItem.objects.filter(
+            cart__buyer=self.request.user
+        ).select_related("book")
 
 
 class CheckoutView(APIView):
     permission_classes = [IsBuyer]
 
     def post(self, request):
-        cart = get_object_or_404(Cart, buyer=request.user)
-
-        total_price = 0
-        order_items = []
-
-        for cart_item in cart.items.all():
-            total_price += cart_item.book.price * cart_item.quantity
-            order_items.append(
-                {
-                    "book": cart_item.book,
-                    "quantity": cart_item.quantity,
-                    "unit_price": cart_item.book.price,
-                }
+        with transaction.atomic():
+            # Lock the cart so a double submit can't check it out twice
+            cart = get_object_or_404(
+                Cart.objects.select_for_update(), buyer=request.user
             )
-
-        order = Order.objects.create(
-            buyer=request.user, total_price=total_price
-        )
-
-        for item in order_items:
-            OrderItem.objects.create(
-                order=order,
-                book=item["book"],
-                quantity=item["quantity"],
-                unit_price=item["unit_price"],
+            cart_items = cart.items.select_related("book")
+
+            total_price = 0
+            order_items = []
+            for cart_item in cart_items:
+                unit_price = cart_item.book.price
+                total_price += unit_price * cart_item.quantity
+                order_items.append(
+                    OrderItem(
+                        book_id=cart_item.book_id,
+                        quantity=cart_item.quantity,
+                        unit_price=unit_price,
+                    )
+                )
+
+            order = Order.objects.create(
+                buyer=request.user, total_price=total_price
             )
+            for order_item in order_items:
+                order_item.order = order
+            OrderItem.objects.bulk_create(order_items)
 
-        cart.items.all().delete()
-        cart.delete()
+            cart.delete()  # Cascades to the cart items in one query
 
-        
         response_data = {
             "message": "Checkout successful!",
             "order_id": order.id,
@@ -182,7 +393,7 @@ class CheckoutView(APIView):
 
 
 class OrderView(generics.RetrieveAPIView):
-  
+
     serializer_class = OrderSerializer
     permission_classes = [IsBuyer]
 
@@ -190,11 +401,100 @@ class OrderView(generics.RetrieveAPIView):
         order_id = self.kwargs.get(
             "order_id"
         )  # Since the order id is passed as order_id
-        order = get_object_or_404(Order, id=order_id, buyer=self.request.user)
+        order = get_object_or_404(
+            orders_with_items(self.request.user), id=order_id
+        )
         return order
-    
-class OrderListView(generics.ListAPIView):
+
+
+class OrderListView(RowListMixin, generics.ListAPIView):
     serializer_class = OrderSerializer
+    row_serializer_class = OrderRowSerializer
     permission_classes = [IsBuyer]
+
     def get_queryset(self):
-         return Order.objects.filter(buyer=self.request.user)
+        # OrderRowSerializer fetches the items itself
+        return orders_by_date(self.request.user)
+
+
+def orders_by_date(buyer):
+    """
+    The buyer's orders in the order they were placed.
+    """
+    return Order.objects.filter(buyer=buyer).order_by("ordered_at", "id")
+
+
+def orders_with_items(buyer):
+    """
+    orders_by_date() with their items and books, in two queries however
+    many orders and items there are.
+    """
+    return (
+        orders_by_date(buyer)
+        .select_related("buyer")
+        .prefetch_related(
+            Prefetch(
+                "order_items",
+                queryset=OrderItem.objects.select_related("book"),
+            )
+        )
+    )
+
+
+class CacheStatsView(APIView):
+    """
+    Hit, miss and eviction counters of each cache in this worker.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(
+            {
+                "catalog": get_stats(settings.CATALOG_CACHE_ALIAS).as_dict(),
+                "auth": get_stats(settings.AUTH_TOKEN_CACHE_ALIAS).as_dict(),
+                "categories": category_cache.stats.as_dict(),
+            }
+        )
+
+
+class ProfileListView(APIView):
+    """
+    The stored request profiles (see api/profiling.py), newest first.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_profile_store().summaries())
+
+
+class ProfileDetailView(APIView):
+    """
+    A stored request profile: the request, its SQL and the profiler's
+    report. ``?download=pstats`` returns the raw pstats dump instead.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id):
+        store = get_profile_store()
+        profile = store.get(profile_id)
+        if profile is None:
+            raise Http404("No such profile.")
+        if request.query_params.get("download") == "pstats":
+            try:
+                stream = open(store.path(profile_id, "pstats"), "rb")
+            except FileNotFoundError:
+                raise Http404("No such profile.")
+            return FileResponse(
+                stream, as_attachment=True, filename=f"{profile_id}.pstats"
+            )
+        return Response(profile)
+
+
+def max_datetime(*values):
+    """
+    Latest of the given datetimes, ignoring None (e.g. no category).
+    """
+    return max((value for value in values if value is not None), default=None)
@@ -2,6 +2,8 @@
 ASGI config for base project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests served through it are routed with ASGI_URLCONF, which swaps in the
+async views (api/async_views.py) where there is one.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
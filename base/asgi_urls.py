@@ -0,0 +1,14 @@
+"""
+URL configuration for requests served through base/asgi.py.
+
+The same URLs as base/urls.py, except that the async views in
+api/async_urls.py take precedence over their sync counterparts.
+"""
+from django.urls import include, path
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path("api/", include("api.async_urls")),
+    *sync_urlpatterns,
+]
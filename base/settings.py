@@ -43,16 +43,22 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.asgi_urlconf_middleware',
 ]
 
 ROOT_URLCONF = 'base.urls'
+# Used instead of ROOT_URLCONF for requests served through base/asgi.py
+ASGI_URLCONF = 'base.asgi_urls'
 
 TEMPLATES = [
     {
@@ -103,6 +109,55 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# The async (ASGI) login and register views hash passwords on a bounded
+# thread pool (api.hashing), off the event loop. Requests arriving while
+# MAX_PENDING hashes are queued or running get a 503.
+PASSWORD_HASHING_WORKERS = 2
+PASSWORD_HASHING_MAX_PENDING = 32
+
+# Worker processes rendering Book.image derivatives (api.images)
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# Fraction of the requests api.middleware.RequestTimingMiddleware times
+# (query count, SQL, serializer and render time), reported in a
+# Server-Timing header and logged by the api.timing logger. 0 turns it
+# off; the requests left out cost next to nothing.
+REQUEST_TIMING_SAMPLE_RATE = 0.01
+
+# Per-route request counts, latencies, query counts and cache lookups
+# (api.metrics), served at /metrics in the Prometheus text format. Each
+# worker process writes its own memory-mapped file here and /metrics
+# adds them all up, moving those of the workers that are gone into one
+# archive file. Emptying the directory resets the counters.
+METRICS_DIR = BASE_DIR / 'cache' / 'metrics'
+
+# Who may scrape /metrics: clients at one of METRICS_ALLOWED_IPS, or ones
+# sending an "Authorization: Bearer <METRICS_TOKEN>" header when a token
+# is set. Behind a proxy REMOTE_ADDR is the proxy's, so use the token.
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+METRICS_TOKEN = None
+
+# On-demand profiling (api.profiling): requests with a valid X-Profile-Token
+# header (see manage.py profiling_token) or, from staff users, a ?profile=1
+# query param run under cProfile. The newest PROFILING_MAX_PROFILES
+# profiles, with the SQL the requests ran, are kept in PROFILING_DIR for
+# admins to browse at /api/profiles/.
+PROFILING_DIR = BASE_DIR / 'cache' / 'profiles'
+PROFILING_MAX_PROFILES = 100
+PROFILING_TOKEN_MAX_AGE = 3600
+
+# Queries taking SLOW_QUERY_THRESHOLD_MS or more (None turns it off), from
+# anywhere, are logged by the api.slow_queries logger with their
+# fingerprint, the code that ran them and their EXPLAIN plan. They are
+# also added up per fingerprint in SLOW_QUERY_DIR, one file per worker
+# process, for manage.py slow_queries to print the worst.
+SLOW_QUERY_THRESHOLD_MS = 200
+SLOW_QUERY_DIR = BASE_DIR / 'cache' / 'slow_queries'
+
+# manage.py test keeps the directories above out of the tests' way
+TEST_RUNNER = 'api.test_runner.TestRunner'
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -126,10 +181,72 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
 }
 
+# Caches
+# The catalog cache holds rendered catalog responses (see api/cache.py).
+# LRUCache is per process, but the versions its keys are made of are in
+# the shared catalog_versions cache, so a write invalidates the responses
+# of every worker (within CATALOG_VERSION_TTL). Use api.cache.SharedFileCache with a LOCATION
+# to share the responses themselves between all the workers on a box.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'api.cache.LRUCache',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    # Versions of the catalog cache namespaces (api.cache), which every
+    # write bumps. Shared by all the workers, so a write invalidates the
+    # responses each of them cached.
+    'catalog_versions': {
+        'BACKEND': 'api.cache.SharedFileCache',
+        'LOCATION': BASE_DIR / 'cache' / 'catalog_versions',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Token -> user resolutions (api.authentication). Must be shared by
+    # all the workers, so a logout is seen by every one of them at once.
+    'auth': {
+        'BACKEND': 'api.cache.SharedFileCache',
+        'LOCATION': BASE_DIR / 'cache' / 'auth',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_VERSION_CACHE_ALIAS = 'catalog_versions'
+AUTH_TOKEN_CACHE_ALIAS = 'auth'
+
+# Seconds a worker reuses the catalog versions it read, instead of
+# reading the catalog_versions cache on every request. Writes made by
+# other workers are seen that much later at most; 0 reads them every time.
+CATALOG_VERSION_TTL = 1
+
 # Media settings
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'  # Directory where media files will be stored
+
+# Media is served by api.media.serve_media at MEDIA_URL. Behind nginx or a
+# server with X-Sendfile support set MEDIA_OFFLOAD to 'x-accel-redirect'
+# (with an internal location at MEDIA_OFFLOAD_PREFIX aliasing MEDIA_ROOT)
+# or 'x-sendfile' to let it send the files. Content-addressed files are
+# cached forever, others for MEDIA_CACHE_MAX_AGE seconds.
+MEDIA_OFFLOAD = None
+MEDIA_OFFLOAD_PREFIX = '/protected-media/'
+MEDIA_CACHE_MAX_AGE = 3600
+
+# Uploads are stored once per distinct content, see api/storage.py; run
+# manage.py collect_blobs periodically to delete the unreferenced ones.
+STORAGES = {
+    'default': {
+        'BACKEND': 'api.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}